@@ -0,0 +1,168 @@
+import os
+import threading
+import numpy as np
+from typing import Optional, Tuple
+
+# ---------------- IVF (INVERTED FILE) INDEX ---------------- #
+#
+# Approximate nearest-neighbour search for large face galleries.
+# Vectors are clustered with spherical k-means into `nlist` cells; a query
+# only scores the vectors in its `nprobe` closest cells. Raising `nprobe`
+# trades speed for recall (nprobe == nlist is an exact scan).
+#
+# The index does not copy embeddings: it stores row ids into the caller's
+# L2-normalised matrix (see model_utils.FaceGallery), plus the centroids
+# and the row -> cell assignment, which is all that is persisted.
+
+DEFAULT_NPROBE = 8
+TRAIN_ITERATIONS = 20
+TRAIN_SAMPLES_PER_LIST = 256
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def suggest_nlist(n: int) -> int:
+    """Rule of thumb: about sqrt(N) cells, at least 1."""
+    return max(1, int(np.sqrt(n)))
+
+class IVFIndex:
+    """Inverted-file index over an external matrix of normalised vectors."""
+
+    def __init__(self, nlist: int, nprobe: int = DEFAULT_NPROBE, seed: int = 0, tag: str = ""):
+        self.nlist = nlist
+        self.tag = tag  # identifies the data the index was built for
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = []
+        self._lock = threading.RLock()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def train(self, matrix: np.ndarray):
+        """Cluster `matrix` (rows already normalised) and index every row."""
+        n = len(matrix)
+        if n == 0:
+            raise ValueError("Cannot train an IVF index on an empty gallery.")
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist, n)
+
+        sample = matrix
+        if n > nlist * TRAIN_SAMPLES_PER_LIST:
+            sample = matrix[rng.choice(n, nlist * TRAIN_SAMPLES_PER_LIST, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(TRAIN_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed dead cells with random points so every cell is usable
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalise(sums)
+
+        with self._lock:
+            self.nlist = nlist
+            self.centroids = centroids
+            self.assignments = np.empty(0, dtype=np.int32)
+            self._lists = [(np.empty(0, dtype=np.int64), 0) for _ in range(nlist)]
+            self.trained_size = n
+            self.add(matrix, start=0)
+
+    def add(self, vectors: np.ndarray, start: int):
+        """Index rows `start .. start + len(vectors)` of the external matrix."""
+        if not self.is_trained:
+            raise RuntimeError("IVF index must be trained before adding vectors.")
+        vectors = np.atleast_2d(vectors)
+        with self._lock:
+            if start != len(self.assignments):
+                raise ValueError(f"Expected row {len(self.assignments)}, got {start}")
+            assign = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+            self.assignments = np.concatenate([self.assignments, assign])
+            rows = np.arange(start, start + len(assign), dtype=np.int64)
+            for cell in np.unique(assign):
+                self._extend_list(int(cell), rows[assign == cell])
+
+    def _extend_list(self, cell: int, rows: np.ndarray):
+        ids, count = self._lists[cell]
+        if count + len(rows) > len(ids):
+            grown = np.empty(max(count + len(rows), 2 * len(ids), 16), dtype=np.int64)
+            grown[:count] = ids[:count]
+            ids = grown
+        ids[count:count + len(rows)] = rows
+        self._lists[cell] = (ids, count + len(rows))
+
+    def _build_lists(self):
+        """Group rows by cell from the assignment array (one argsort)."""
+        order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(self.assignments[order], np.arange(self.nlist + 1))
+        self._lists = [(order[bounds[c]:bounds[c + 1]].copy(), int(bounds[c + 1] - bounds[c]))
+                       for c in range(self.nlist)]
+
+    def needs_retrain(self, growth: float = 4.0) -> bool:
+        """Cells drift out of balance once the gallery outgrows the training set."""
+        return not self.is_trained or len(self) > growth * max(self.trained_size, 1)
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int = 1,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (row_ids, scores) of the approximate top-k rows of `matrix`
+        for a normalised `query`, best first.
+        """
+        with self._lock:
+            nprobe = min(nprobe or self.nprobe, self.nlist)
+            cell_scores = self.centroids @ query
+            cells = np.argpartition(-cell_scores, nprobe - 1)[:nprobe]
+            candidates = [ids[:count] for ids, count in (self._lists[c] for c in cells) if count]
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ids = np.concatenate(candidates)
+        ids = ids[ids < len(matrix)]  # rows enrolled after the caller's snapshot
+        if not len(ids):
+            return ids, np.empty(0, dtype=np.float32)
+        scores = matrix[ids] @ query
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    # ---------- persistence ---------- #
+
+    def save(self, path: str):
+        """Write centroids and assignments atomically (tmp file + rename)."""
+        with self._lock:
+            tmp_path = f"{path}.{os.getpid()}.tmp"  # unique per process: workers may save concurrently
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    centroids=self.centroids,
+                    assignments=self.assignments,
+                    params=np.array([self.nlist, self.nprobe, self.trained_size, self.seed], dtype=np.int64),
+                    tag=np.array(self.tag),
+                )
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            nlist, nprobe, trained_size, seed = (int(v) for v in data["params"])
+            tag = str(data["tag"]) if "tag" in data.files else ""
+            index = cls(nlist=nlist, nprobe=nprobe, seed=seed, tag=tag)
+            index.centroids = data["centroids"].astype(np.float32)
+            index.assignments = data["assignments"].astype(np.int32)
+        index.trained_size = trained_size
+        index._build_lists()
+        return index
@@ -1,20 +1,20 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 import shutil
 import os
+import tempfile
 import urllib.request
 import logging
 import json
 import asyncio
+import itertools
 import cv2
 import numpy as np
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import base64
-from io import BytesIO
-from PIL import Image
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import re
 import pandas as pd
 
@@ -26,9 +26,17 @@ except Exception:
     APSCHED_AVAILABLE = False
 
 # project utilities (you already have these modules)
-from model_utils import detect_emotion, save_labelled_face, recognize_face, initialize_emotion_model  # type: ignore
+from model_utils import detect_emotions, emotion_batcher, emotion_trainer, online_model_status, submit_emotion_feedback, save_labelled_face, recognize_face, recognize_faces, recognize_faces_in_image, track_faces_in_image, initialize_emotion_model, get_gallery, face_cache, emotion_cache  # type: ignore
+from face_utils import initialize_face_engine, initialize_face_detector, decode_images, to_bgr_array  # type: ignore
+from face_worker_utils import face_workers, WORKERS_DOWN  # type: ignore
+from video_utils import VideoFacePipeline  # type: ignore
+from realtime_utils import RealTimeFaceTracker  # type: ignore
+from text_utils import iter_text_chunks, EmotionAggregate, READ_BLOCK_SIZE  # type: ignore
+from executor_utils import run_in_pool, pool_stats, shutdown_pools, PoolSaturated  # type: ignore
+from state_utils import ChangeWatcher, EventBus, LeaderLock, read_json, update_json, state_path, CHECK_INTERVAL  # type: ignore
 from speech_utils import audio_to_text, speak  # type: ignore
-from logger_utils import log_emotion, get_emotion_summary  # type: ignore
+from logger_utils import log_emotion, get_emotion_summary, emotion_log  # type: ignore
+from history_utils import emotion_history  # type: ignore
 
 # configure simple logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -41,6 +49,14 @@ except Exception as e:
     logging.error(f"Failed to initialize emotion detection model: {e}")
     logging.warning("Emotion detection endpoints will not work until model is initialized")
 
+# Build and warm the Facenet model once so the first recognition request does not pay for it
+try:
+    initialize_face_engine()
+    logging.info("Face embedding engine initialized successfully")
+except Exception as e:
+    logging.error(f"Failed to initialize face embedding engine: {e}")
+    logging.warning("Face recognition will load the model lazily on first use")
+
 app = FastAPI(title="Echo Backend - Universal ML / Face / Speech / Video - Real-time")
 
 app.add_middleware(
@@ -50,10 +66,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc: PoolSaturated):
+    # Backpressure: tell clients to come back later instead of queueing without limit
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "pool": exc.pool, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # -------------------- WebSocket Connection Manager --------------------
 
 class ConnectionManager:
-    def _init_(self):
+    def __init__(self):
         self.active_connections: List[WebSocket] = []
 
     async def connect(self, websocket: WebSocket):
@@ -82,6 +107,25 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# Each server worker only holds its own WebSocket connections, so
+# server-wide messages go through a shared event file that every worker
+# relays to its clients (see state_utils.EventBus).
+events = EventBus("broadcast")
+
+def publish_broadcast(message: str):
+    events.publish({"message": message})
+
+async def relay_broadcasts():
+    while True:
+        try:
+            for event in await run_in_pool("io", events.poll):
+                await manager.broadcast(event["message"])
+        except PoolSaturated:
+            pass
+        except Exception as e:
+            logging.warning(f"Broadcast relay error: {e}")
+        await asyncio.sleep(CHECK_INTERVAL)
+
 # -------------------- Helper: ensure face-detector models --------------------
 
 CAFFE_FILES = {
@@ -110,6 +154,73 @@ def ensure_face_detector_files(dest_dir: str = "."):
 # Ensure model files at startup (best effort)
 ensure_face_detector_files()
 
+# Load the SSD once; multi-face recognition runs it on every frame
+try:
+    initialize_face_detector()
+except Exception as e:
+    logging.error(f"Failed to load SSD face detector: {e}")
+    logging.warning("Multi-face recognition will fall back to DeepFace detection")
+
+# -------------------- Face worker processes --------------------
+
+def use_face_workers() -> bool:
+    return face_workers is not None and face_workers.started
+
+# Each helper falls back to the inference pool when a worker has died
+# (WORKERS_DOWN); the pool respawns itself in the background
+
+async def recognize_image_faces(image, **kwargs) -> List[dict]:
+    """recognize_faces_in_image in a worker process if the pool is running, else in the inference pool."""
+    if use_face_workers():
+        frame = await run_in_pool("cpu", to_bgr_array, image)
+        try:
+            return await asyncio.wrap_future(face_workers.submit_faces(frame, **kwargs))
+        except WORKERS_DOWN:
+            pass
+    return await run_in_pool("inference", recognize_faces_in_image, image, **kwargs)
+
+async def recognize_main_face(image) -> Optional[str]:
+    """recognize_face in a worker process if the pool is running, else in the inference pool."""
+    if use_face_workers():
+        frame = await run_in_pool("cpu", to_bgr_array, image)
+        try:
+            return await asyncio.wrap_future(face_workers.submit_face(frame))
+        except WORKERS_DOWN:
+            pass
+    return await run_in_pool("inference", recognize_face, image)
+
+async def track_image_faces(tracker: RealTimeFaceTracker, image) -> Tuple[List[dict], RealTimeFaceTracker]:
+    """
+    track_faces_in_image in a worker process if the pool is running, else in
+    the inference pool. A worker updates a copy of the tracker, so use the
+    returned one for the connection's next frame.
+    """
+    if use_face_workers():
+        frame = await run_in_pool("cpu", to_bgr_array, image)
+        try:
+            return await asyncio.wrap_future(face_workers.submit_track(frame, tracker))
+        except WORKERS_DOWN:
+            pass
+    faces = await run_in_pool("inference", track_faces_in_image, tracker, image)
+    return faces, tracker
+
+def recognize_images(images: List) -> List[dict]:
+    """
+    recognize_faces spread over the worker processes if the pool is running
+    (blocking); images no worker can take are recognized in-process.
+    """
+    if use_face_workers():
+        return face_workers.recognize_faces(images, fallback=recognize_faces)
+    return recognize_faces(images)
+
+def recognize_video_frame(frame) -> List[dict]:
+    if use_face_workers():
+        try:
+            return face_workers.recognize_faces_in_image(frame, use_cache=False)
+        except WORKERS_DOWN:
+            pass
+    return recognize_faces_in_image(frame, use_cache=False)
+
 # -------------------- User Preferences & Roles --------------------
 
 PREFS_FILE = "user_prefs.json"
@@ -122,48 +233,158 @@ USER_PREFS = {
     "time_zone_note": "Uses server local time"
 }
 
-_last_sleep_nudge_date: Optional[date] = None  # to avoid repeating every minute
+# Last day the sleep nudge went out, shared by all workers and kept across restarts
+NUDGE_STATE_FILE = state_path("sleep_nudge.json")
+
+# Other workers may rewrite these files; reload only when they change on disk
+prefs_watcher = ChangeWatcher(PREFS_FILE)
+roles_watcher = ChangeWatcher(ROLES_FILE)
+_roles: dict = {}
 
 def load_prefs():
     global USER_PREFS
     if os.path.exists(PREFS_FILE):
         try:
-            with open(PREFS_FILE, "r", encoding="utf-8") as f:
-                USER_PREFS.update(json.load(f))
+            USER_PREFS.update(read_json(PREFS_FILE, {}))
         except Exception as e:
             logging.warning(f"Failed to load {PREFS_FILE}: {e}")
 
-def save_prefs():
+def sync_prefs():
+    """Pick up preferences saved by another worker."""
+    if prefs_watcher.changed():
+        load_prefs()
+
+def save_prefs(changes: Optional[dict] = None):
+    """Merge `changes` into the prefs file under its lock, so concurrent workers do not overwrite each other."""
     try:
-        with open(PREFS_FILE, "w", encoding="utf-8") as f:
-            json.dump(USER_PREFS, f, indent=2)
+        saved = update_json(PREFS_FILE, lambda current: {**USER_PREFS, **(current or {}), **(changes or {})}, {})
+        USER_PREFS.update(saved)
+        prefs_watcher.mark_seen()
     except Exception as e:
         logging.warning(f"Failed to save {PREFS_FILE}: {e}")
 
 def load_roles() -> dict:
-    if os.path.exists(ROLES_FILE):
+    global _roles
+    if roles_watcher.changed():
         try:
-            with open(ROLES_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            _roles = read_json(ROLES_FILE, {})
         except Exception as e:
             logging.warning(f"Failed to load {ROLES_FILE}: {e}")
-    return {}
+    return dict(_roles)
+
+def get_label_role(label: str) -> str:
+    roles = load_roles()
+    return roles.get(label, "friend")  # default relation
 
-def save_roles(data: dict):
+def set_label_role(label: str, role: str):
+    # Read-modify-write under the lock so roles set by another worker are kept
+    def _set(roles):
+        roles = dict(roles or {})
+        roles[label] = role
+        return roles
     try:
-        with open(ROLES_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        update_json(ROLES_FILE, _set, {})
     except Exception as e:
         logging.warning(f"Failed to save {ROLES_FILE}: {e}")
 
-def get_label_role(label: str) -> str:
+async def classify_emotion(text: str):
+    """
+    Score one text through the shared micro-batcher without blocking the
+    event loop. Raises PoolSaturated when the batcher's queue is full.
+    """
+    result = await asyncio.wrap_future(emotion_batcher.submit(text))
+    return result["emotion"], result["confidence"]
+
+async def log_emotion_async(text: str, emotion: str, confidence: float, user_id: Optional[str] = None):
+    # Only enqueues; the CSV is appended in batches by logger_utils' writer thread
+    log_emotion(text, emotion, confidence, user_id=user_id)
+
+async def speak_async(message: str):
+    """Best-effort text-to-speech off the event loop; skipped when the io pool is full."""
+    try:
+        await run_in_pool("io", speak, message)
+    except Exception as e:
+        logging.warning(f"Speak failed: {e}")
+
+def write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def save_upload(fileobj, path: str):
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(fileobj, buffer)
+
+def save_upload_to_temp(fileobj, suffix: str) -> Tuple[str, int]:
+    """Copy an upload to a new temp file in one go; returns (path, size). Nothing is left behind on failure."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(fileobj, out, READ_BLOCK_SIZE)
+            return path, out.tell()
+    except BaseException:
+        os.remove(path)
+        raise
+
+def transcribe_bytes(audio_data: bytes, suffix: str = ".wav") -> str:
+    """Write audio bytes to a temp file for the speech recognizer and clean up after."""
+    fd, temp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio_data)
+        return audio_to_text(temp_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def ws_error(e: Exception) -> dict:
+    response = {
+        "type": "error",
+        "message": str(e),
+        "timestamp": asyncio.get_event_loop().time()
+    }
+    if isinstance(e, PoolSaturated):
+        response["retry_after"] = e.retry_after
+    return response
+
+def attach_roles(faces: List[dict]) -> Optional[dict]:
+    """Add "role" to each recognized face; return the best-scoring recognized face, if any."""
     roles = load_roles()
-    return roles.get(label, "friend")  # default relation
+    for face in faces:
+        face["role"] = roles.get(face["label"], "friend") if face["label"] else None
+    recognized = [f for f in faces if f["label"]]
+    return max(recognized, key=lambda f: f["score"]) if recognized else None
 
-def set_label_role(label: str, role: str):
+def analyze_video_faces(file_path: str) -> dict:
+    """
+    Run the pipelined recognizer (decode and inference threads, motion-based
+    frame skipping, container timestamps) and shape its detections like the
+    per-frame recognition results the video endpoints always returned.
+    """
+    if use_face_workers():
+        # One inference thread per worker process keeps every process busy
+        pipeline = VideoFacePipeline(recognize_video_frame, inference_workers=face_workers.workers)
+    else:
+        pipeline = VideoFacePipeline(recognize_video_frame)
+    report = pipeline.run(file_path)
     roles = load_roles()
-    roles[label] = role
-    save_roles(roles)
+    recognitions = [
+        {
+            "frame": d["frame"],
+            "person": d["label"],
+            "role": roles.get(d["label"], "friend"),
+            "timestamp": d["timestamp"],
+            "score": d["score"],
+            "bbox": d["bbox"]
+        }
+        for d in report.pop("detections") if d["label"]
+    ]
+    report["recognitions"] = recognitions
+    report["unique_persons"] = list(dict.fromkeys(r["person"] for r in recognitions))
+    return report
+
+def describe_faces(faces: List[dict]) -> str:
+    names = [f"{f['label']} ({f['role']})" for f in faces if f["label"]]
+    return " and ".join(names)
 
 # Load prefs on startup
 load_prefs()
@@ -172,17 +393,34 @@ load_prefs()
 
 scheduler: Optional["BackgroundScheduler"] = None
 
+# Every worker starts the scheduler, but only the lock holder runs its jobs
+scheduler_leader = LeaderLock("scheduler")
+
+def claim_nudge_day(today: date) -> bool:
+    """Record `today` as sent; False if the nudge already went out today."""
+    claimed = []
+    def _claim(state):
+        state = dict(state or {})
+        if state.get("last_sleep_nudge_date") != today.isoformat():
+            state["last_sleep_nudge_date"] = today.isoformat()
+            claimed.append(True)
+        return state
+    update_json(NUDGE_STATE_FILE, _claim, {})
+    return bool(claimed)
+
 def sleep_reminder_job():
     """Checks current time and speaks a reminder at configured sleep hour (runs every minute)."""
-    global _last_sleep_nudge_date
     try:
+        if not scheduler_leader.is_leader():
+            return
+        sync_prefs()
         if not USER_PREFS.get("sleep_enabled", True):
             return
 
         now = datetime.now()
         if now.hour == int(USER_PREFS.get("sleep_hour", 22)):
             # send once per day
-            if _last_sleep_nudge_date != now.date():
+            if claim_nudge_day(now.date()):
                 username = USER_PREFS.get("username", "mate")
                 msg = f"Hey {username}, it’s time to sleep."
                 try:
@@ -197,13 +435,9 @@ def sleep_reminder_job():
                     "timestamp": now.isoformat()
                 })
                 try:
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        asyncio.run_coroutine_threadsafe(manager.broadcast(payload), loop)
-                except Exception:
-                    # If no loop running (e.g., in tests), ignore
-                    pass
-                _last_sleep_nudge_date = now.date()
+                    publish_broadcast(payload)
+                except Exception as e:
+                    logging.warning(f"Failed to publish sleep reminder: {e}")
     except Exception as e:
         logging.warning(f"sleep_reminder_job error: {e}")
 
@@ -221,6 +455,20 @@ def start_scheduler():
     else:
         logging.info("APScheduler not available. Skipping scheduler start.")
 
+@app.on_event("startup")
+async def start_broadcast_relay():
+    asyncio.create_task(relay_broadcasts())
+
+@app.on_event("startup")
+def start_face_workers():
+    if face_workers is None:
+        return
+    try:
+        face_workers.start()
+    except Exception as e:
+        logging.error(f"Failed to start face worker processes: {e}")
+        logging.warning("Face recognition will run in the server process")
+
 @app.on_event("shutdown")
 def stop_scheduler():
     global scheduler
@@ -229,12 +477,28 @@ def stop_scheduler():
             scheduler.shutdown(wait=False)
         except Exception:
             pass
+    scheduler_leader.release()
+    shutdown_pools()
+    emotion_log.close()
+    if face_workers is not None:
+        face_workers.shutdown()
 
 # -------------------- Pydantic models --------------------
 
 class EmotionRequest(BaseModel):
     text: str
 
+class EmotionBatchRequest(BaseModel):
+    texts: List[str]
+    log: bool = False  # re-analysis and back-fill jobs should not duplicate log rows
+
+class EmotionCorrection(BaseModel):
+    text: str
+    emotion: str
+
+class EmotionFeedbackRequest(BaseModel):
+    corrections: List[EmotionCorrection]
+
 class FaceLabelRequest(BaseModel):
     label: str
 
@@ -262,8 +526,8 @@ async def websocket_emotion(websocket: WebSocket):
             data = await websocket.receive_text()
             request = json.loads(data)
             try:
-                emotion, confidence = detect_emotion(request.get("text", ""))
-                log_emotion(request.get("text", ""), emotion, confidence)
+                emotion, confidence = await classify_emotion(request.get("text", ""))
+                await log_emotion_async(request.get("text", ""), emotion, confidence, request.get("user_id"))
                 response = {
                     "type": "emotion_result",
                     "emotion": emotion,
@@ -272,47 +536,43 @@ async def websocket_emotion(websocket: WebSocket):
                 }
                 await manager.send_personal_message(json.dumps(response), websocket)
             except Exception as e:
-                error_response = {
-                    "type": "error",
-                    "message": str(e),
-                    "timestamp": asyncio.get_event_loop().time()
-                }
-                await manager.send_personal_message(json.dumps(error_response), websocket)
+                await manager.send_personal_message(json.dumps(ws_error(e)), websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
 @app.websocket("/ws/face-recognition")
 async def websocket_face_recognition(websocket: WebSocket):
-    """Real-time face recognition via WebSocket"""
+    """
+    Real-time face recognition via WebSocket. Each connection keeps its own
+    face tracker, so a person who stays in view keeps their face_id and is
+    only re-recognized when the tracker's confidence decays. Send
+    {"track": false} with a frame to recognize every face from scratch.
+    """
     await manager.connect(websocket)
+    tracker = RealTimeFaceTracker()
     try:
         while True:
             data = await websocket.receive_text()
             request = json.loads(data)
             try:
                 image_data = base64.b64decode(request.get("image", ""))
-                image = Image.open(BytesIO(image_data))
-                temp_path = f"temp_ws_{asyncio.get_event_loop().time()}.jpg"
-                image.save(temp_path)
-                label = recognize_face(temp_path)
-                role = get_label_role(label) if label else None
+                if request.get("track", True):
+                    faces, tracker = await track_image_faces(tracker, image_data)
+                else:
+                    faces = await recognize_image_faces(image_data)
+                best = await run_in_pool("io", attach_roles, faces)
                 response = {
                     "type": "face_recognition_result",
-                    "recognized": label if label else None,
-                    "role": role,
-                    "message": f"Recognized as {label} ({role})" if label else "Person not recognized",
+                    "recognized": best["label"] if best else None,
+                    "role": best["role"] if best else None,
+                    "faces": faces,
+                    "message": f"Recognized as {describe_faces(faces)}" if best else "Person not recognized",
+                    "tracking": tracker.get_tracking_stats(),
                     "timestamp": asyncio.get_event_loop().time()
                 }
                 await manager.send_personal_message(json.dumps(response), websocket)
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
             except Exception as e:
-                error_response = {
-                    "type": "error",
-                    "message": str(e),
-                    "timestamp": asyncio.get_event_loop().time()
-                }
-                await manager.send_personal_message(json.dumps(error_response), websocket)
+                await manager.send_personal_message(json.dumps(ws_error(e)), websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
@@ -326,12 +586,9 @@ async def websocket_audio_stream(websocket: WebSocket):
             request = json.loads(data)
             try:
                 audio_data = base64.b64decode(request.get("audio", ""))
-                temp_path = f"temp_audio_{asyncio.get_event_loop().time()}.wav"
-                with open(temp_path, "wb") as f:
-                    f.write(audio_data)
-                text = audio_to_text(temp_path)
-                emotion, confidence = detect_emotion(text)
-                log_emotion(text, emotion, confidence)
+                text = await run_in_pool("io", transcribe_bytes, audio_data)
+                emotion, confidence = await classify_emotion(text)
+                await log_emotion_async(text, emotion, confidence)
                 response = {
                     "type": "audio_processing_result",
                     "text": text,
@@ -340,15 +597,8 @@ async def websocket_audio_stream(websocket: WebSocket):
                     "timestamp": asyncio.get_event_loop().time()
                 }
                 await manager.send_personal_message(json.dumps(response), websocket)
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
             except Exception as e:
-                error_response = {
-                    "type": "error",
-                    "message": str(e),
-                    "timestamp": asyncio.get_event_loop().time()
-                }
-                await manager.send_personal_message(json.dumps(error_response), websocket)
+                await manager.send_personal_message(json.dumps(ws_error(e)), websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
@@ -371,27 +621,20 @@ async def voice_command(
     audio_path = os.path.join(tmp_dir, audio.filename) # type: ignore
 
     try:
-        with open(audio_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
-
-        cmd_text = audio_to_text(audio_path).lower().strip()
+        await run_in_pool("io", save_upload, audio.file, audio_path)
+        cmd_text = (await run_in_pool("io", audio_to_text, audio_path)).lower().strip()
 
         # Basic NLP by keyword matching
         if "who is this" in cmd_text or "who's this" in cmd_text or "who am i looking at" in cmd_text:
             if not image:
                 msg = "I need an image to answer who this is."
                 if speak_response:
-                    try: speak(msg)
-                    except Exception: pass
+                    await speak_async(msg)
                 return {"intent": "who_is_this", "need_image": True, "message": msg}
 
-            # Save image and recognize
-            img_path = os.path.join(tmp_dir, image.filename) # type: ignore
-            with open(img_path, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
-
-            label = recognize_face(img_path)
-            role = get_label_role(label) if label else None
+            # Recognize straight from the uploaded bytes
+            label = await recognize_main_face(await image.read())
+            role = await run_in_pool("io", get_label_role, label) if label else None
 
             if label:
                 msg = f"This is {label}"
@@ -403,8 +646,7 @@ async def voice_command(
                 msg = "Sorry, I do not recognize this person."
 
             if speak_response:
-                try: speak(msg)
-                except Exception as e: logging.warning(f"Speak failed: {e}")
+                await speak_async(msg)
 
             return {
                 "intent": "who_is_this",
@@ -417,21 +659,20 @@ async def voice_command(
             now_str = datetime.now().strftime("%I:%M %p")
             msg = f"It’s {now_str}."
             if speak_response:
-                try: speak(msg)
-                except Exception: pass
+                await speak_async(msg)
             return {"intent": "time_query", "message": msg, "time": now_str}
 
         if "what's my name" in cmd_text or "what is my name" in cmd_text:
+            await run_in_pool("io", sync_prefs)
             name = USER_PREFS.get("username", "mate")
             msg = f"Your name is {name}."
             if speak_response:
-                try: speak(msg)
-                except Exception: pass
+                await speak_async(msg)
             return {"intent": "name_query", "message": msg, "username": name}
 
         # Unknown command -> Try emotion on the text anyway
-        emotion, confidence = detect_emotion(cmd_text)
-        log_emotion(cmd_text, emotion, confidence)
+        emotion, confidence = await classify_emotion(cmd_text)
+        await log_emotion_async(cmd_text, emotion, confidence)
         fallback_msg = f"I heard: '{cmd_text}'. Emotion: {emotion} ({confidence})."
         return {
             "intent": "unknown",
@@ -441,6 +682,8 @@ async def voice_command(
             "message": fallback_msg
         }
 
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Voice command failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -454,6 +697,35 @@ async def voice_command(
 
 # -------------------- Real-time Video Processing Endpoints --------------------
 
+def video_emotion_report(file_path: str) -> dict:
+    cap = cv2.VideoCapture(file_path)
+    frame_texts = []
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_texts.append(f"Frame at {len(frame_texts)} seconds")
+    cap.release()
+
+    emotions = []
+    try:
+        results = detect_emotions(frame_texts)
+    except Exception:
+        results = []
+    for idx, result in enumerate(results):
+        emotions.append({
+            "frame": idx,
+            "emotion": result["emotion"],
+            "confidence": result["confidence"],
+            "timestamp": idx
+        })
+
+    return {
+        "video_emotions": emotions,
+        "total_frames": len(emotions),
+        "dominant_emotion": max(set([e["emotion"] for e in emotions]), key=[e["emotion"] for e in emotions].count) if emotions else None
+    }
+
 @app.post("/video-stream/emotion")
 async def video_stream_emotion(file: UploadFile = File(...)):
     """Process video stream for real-time emotion detection (placeholder demo)."""
@@ -462,36 +734,14 @@ async def video_stream_emotion(file: UploadFile = File(...)):
         os.makedirs(tmp_dir, exist_ok=True)
         file_path = os.path.join(tmp_dir, file.filename) # type: ignore
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        cap = cv2.VideoCapture(file_path)
-        emotions = []
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_text = f"Frame at {len(emotions)} seconds"
-            try:
-                emotion, confidence = detect_emotion(frame_text)
-                emotions.append({
-                    "frame": len(emotions),
-                    "emotion": emotion,
-                    "confidence": confidence,
-                    "timestamp": len(emotions)
-                })
-            except:
-                pass
-
-        cap.release()
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-        return {
-            "video_emotions": emotions,
-            "total_frames": len(emotions),
-            "dominant_emotion": max(set([e["emotion"] for e in emotions]), key=[e["emotion"] for e in emotions].count) if emotions else None
-        }
+        await run_in_pool("io", save_upload, file.file, file_path)
+        try:
+            return await run_in_pool("video", video_emotion_report, file_path)
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Video emotion detection failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -504,43 +754,16 @@ async def video_stream_face_recognition(file: UploadFile = File(...)):
         os.makedirs(tmp_dir, exist_ok=True)
         file_path = os.path.join(tmp_dir, file.filename) # type: ignore
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        cap = cv2.VideoCapture(file_path)
-        recognitions = []
-        frame_count = 0
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            if frame_count % 10 == 0:
-                temp_frame_path = f"temp_frame_{frame_count}.jpg"
-                cv2.imwrite(temp_frame_path, frame)
-                try:
-                    label = recognize_face(temp_frame_path)
-                    if label:
-                        recognitions.append({
-                            "frame": frame_count,
-                            "person": label,
-                            "role": get_label_role(label),
-                            "timestamp": frame_count / 30.0
-                        })
-                except:
-                    pass
-                if os.path.exists(temp_frame_path):
-                    os.remove(temp_frame_path)
-            frame_count += 1
-
-        cap.release()
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        await run_in_pool("io", save_upload, file.file, file_path)
+        try:
+            report = await run_in_pool("video", analyze_video_faces, file_path)
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
-        return {
-            "recognitions": recognitions,
-            "total_frames": frame_count,
-            "unique_persons": list({r["person"] for r in recognitions})
-        }
+        return report
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Video face recognition failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -550,14 +773,16 @@ async def video_stream_face_recognition(file: UploadFile = File(...)):
 @app.post("/stream-emotion")
 async def stream_emotion(request: StreamingEmotionRequest):
     try:
-        emotion, confidence = detect_emotion(request.text)
-        log_emotion(request.text, emotion, confidence)
+        emotion, confidence = await classify_emotion(request.text)
+        await log_emotion_async(request.text, emotion, confidence, request.user_id)
         return {
             "emotion": emotion,
             "confidence": confidence,
             "timestamp": asyncio.get_event_loop().time(),
             "user_id": request.user_id
         }
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Streaming emotion detection failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -566,21 +791,27 @@ async def stream_emotion(request: StreamingEmotionRequest):
 async def stream_emotion_feed():
     async def generate():
         while True:
-            summary = get_emotion_summary()
+            summary = await run_in_pool("io", get_emotion_summary)
             yield f"data: {json.dumps(summary)}\n\n"
             await asyncio.sleep(1)
     return StreamingResponse(generate(), media_type="text/plain")
 
 # -------------------- Real-time Camera Endpoints --------------------
 
+def probe_camera(index: int = 0) -> bool:
+    cap = cv2.VideoCapture(index)
+    opened = cap.isOpened()
+    cap.release()
+    return opened
+
 @app.get("/camera/start")
 async def start_camera():
     try:
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
+        if not await run_in_pool("io", probe_camera):
             raise HTTPException(status_code=500, detail="Could not open camera")
-        cap.release()
         return {"status": "camera_started", "message": "Camera is now active for real-time processing"}
+    except (HTTPException, PoolSaturated):
+        raise
     except Exception as e:
         logging.exception("Failed to start camera")
         raise HTTPException(status_code=500, detail=str(e))
@@ -595,16 +826,9 @@ async def stop_camera():
 async def upload_universal(file: UploadFile = File(...)):
     """
     Universal upload endpoint that automatically detects content type and processes accordingly.
-    Supports: images (face recognition), audio (emotion detection), video (emotion/face analysis), text files
+    Supports: images (face recognition), audio (emotion detection), video (emotion/face analysis), text files (analysed in chunks, streamed back as NDJSON)
     """
     try:
-        tmp_dir = "temp_universal"
-        os.makedirs(tmp_dir, exist_ok=True)
-        file_path = os.path.join(tmp_dir, file.filename) # type: ignore
-
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
         file_extension = file.filename.lower().split('.')[-1] if '.' in file.filename else '' # type: ignore
         mime_type = file.content_type or ''
 
@@ -613,12 +837,32 @@ async def upload_universal(file: UploadFile = File(...)):
         video_extensions = ['mp4', 'avi', 'mov', 'mkv', 'wmv', 'flv', 'webm']
         text_extensions = ['txt', 'md', 'json', 'csv']
 
+        is_image = file_extension in image_extensions or 'image' in mime_type
+        is_audio = file_extension in audio_extensions or 'audio' in mime_type
+        is_video = file_extension in video_extensions or 'video' in mime_type
+
+        # Text is streamed: never held in memory whole, analysed chunk by chunk
+        if not (is_image or is_audio or is_video) and (file_extension in text_extensions or 'text' in mime_type):
+            return await stream_text_upload(file, mime_type)
+
+        content = await file.read()
+        file_size = len(content)
+
+        def spill_to_disk() -> str:
+            # Only audio/video decoders need a real file; images and text stay in memory
+            tmp_dir = "temp_universal"
+            os.makedirs(tmp_dir, exist_ok=True)
+            path = os.path.join(tmp_dir, file.filename) # type: ignore
+            with open(path, "wb") as buffer:
+                buffer.write(content)
+            return path
+
         # Image
-        if file_extension in image_extensions or 'image' in mime_type:
+        if is_image:
             try:
-                label = recognize_face(file_path)
+                label = await recognize_main_face(content)
                 if label:
-                    role = get_label_role(label)
+                    role = await run_in_pool("io", get_label_role, label)
                     return {
                         "content_type": "image",
                         "processing": "face_recognition",
@@ -629,7 +873,7 @@ async def upload_universal(file: UploadFile = File(...)):
                         },
                         "file_info": {
                             "filename": file.filename,
-                            "size": os.path.getsize(file_path),
+                            "size": file_size,
                             "mime_type": mime_type
                         }
                     }
@@ -643,10 +887,12 @@ async def upload_universal(file: UploadFile = File(...)):
                         },
                         "file_info": {
                             "filename": file.filename,
-                            "size": os.path.getsize(file_path),
+                            "size": file_size,
                             "mime_type": mime_type
                         }
                     }
+            except PoolSaturated:
+                raise
             except Exception:
                 return {
                     "content_type": "image",
@@ -657,17 +903,18 @@ async def upload_universal(file: UploadFile = File(...)):
                     },
                     "file_info": {
                         "filename": file.filename,
-                        "size": os.path.getsize(file_path),
+                        "size": file_size,
                         "mime_type": mime_type
                     }
                 }
 
         # Audio
-        if file_extension in audio_extensions or 'audio' in mime_type:
+        if is_audio:
             try:
-                text = audio_to_text(file_path)
-                emotion, confidence = detect_emotion(text)
-                log_emotion(text, emotion, confidence)
+                file_path = await run_in_pool("io", spill_to_disk)
+                text = await run_in_pool("io", audio_to_text, file_path)
+                emotion, confidence = await classify_emotion(text)
+                await log_emotion_async(text, emotion, confidence)
                 return {
                     "content_type": "audio",
                     "processing": "audio_to_text_and_emotion",
@@ -678,10 +925,12 @@ async def upload_universal(file: UploadFile = File(...)):
                     },
                     "file_info": {
                         "filename": file.filename,
-                        "size": os.path.getsize(file_path),
+                        "size": file_size,
                         "mime_type": mime_type
                     }
                 }
+            except PoolSaturated:
+                raise
             except Exception as e:
                 return {
                     "content_type": "audio",
@@ -692,54 +941,32 @@ async def upload_universal(file: UploadFile = File(...)):
                     },
                     "file_info": {
                         "filename": file.filename,
-                        "size": os.path.getsize(file_path),
+                        "size": file_size,
                         "mime_type": mime_type
                     }
                 }
 
         # Video
-        if file_extension in video_extensions or 'video' in mime_type:
+        if is_video:
             try:
-                cap = cv2.VideoCapture(file_path)
-                recognitions = []
-                frame_count = 0
-                while cap.isOpened():
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    if frame_count % 10 == 0:
-                        temp_frame_path = f"temp_frame_{frame_count}.jpg"
-                        cv2.imwrite(temp_frame_path, frame)
-                        try:
-                            label = recognize_face(temp_frame_path)
-                            if label:
-                                recognitions.append({
-                                    "frame": frame_count,
-                                    "person": label,
-                                    "role": get_label_role(label),
-                                    "timestamp": frame_count / 30.0
-                                })
-                        except:
-                            pass
-                        if os.path.exists(temp_frame_path):
-                            os.remove(temp_frame_path)
-                    frame_count += 1
-                cap.release()
+                file_path = await run_in_pool("io", spill_to_disk)
+                report = await run_in_pool("video", analyze_video_faces, file_path)
                 return {
                     "content_type": "video",
                     "processing": "video_analysis",
                     "result": {
-                        "total_frames": frame_count,
-                        "recognitions": recognitions,
-                        "unique_persons": list({r["person"] for r in recognitions}),
-                        "message": f"Video processed: {frame_count} frames analyzed"
+                        **report,
+                        "message": f"Video processed: {report['total_frames']} frames decoded, {report['processed_frames']} analyzed"
+                                   + (f", {report['failed_frames']} failed" if report["failed_frames"] else "")
                     },
                     "file_info": {
                         "filename": file.filename,
-                        "size": os.path.getsize(file_path),
+                        "size": file_size,
                         "mime_type": mime_type
                     }
                 }
+            except PoolSaturated:
+                raise
             except Exception as e:
                 return {
                     "content_type": "video",
@@ -750,44 +977,7 @@ async def upload_universal(file: UploadFile = File(...)):
                     },
                     "file_info": {
                         "filename": file.filename,
-                        "size": os.path.getsize(file_path),
-                        "mime_type": mime_type
-                    }
-                }
-
-        # Text
-        if file_extension in text_extensions or 'text' in mime_type:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
-                emotion, confidence = detect_emotion(text_content)
-                log_emotion(text_content, emotion, confidence)
-                return {
-                    "content_type": "text",
-                    "processing": "text_emotion_analysis",
-                    "result": {
-                        "text_preview": text_content[:200] + "..." if len(text_content) > 200 else text_content,
-                        "emotion": emotion,
-                        "confidence": confidence,
-                        "text_length": len(text_content)
-                    },
-                    "file_info": {
-                        "filename": file.filename,
-                        "size": os.path.getsize(file_path),
-                        "mime_type": mime_type
-                    }
-                }
-            except Exception as e:
-                return {
-                    "content_type": "text",
-                    "processing": "text_analysis",
-                    "result": {
-                        "message": "Text file uploaded",
-                        "error": str(e)
-                    },
-                    "file_info": {
-                        "filename": file.filename,
-                        "size": os.path.getsize(file_path),
+                        "size": file_size,
                         "mime_type": mime_type
                     }
                 }
@@ -801,12 +991,14 @@ async def upload_universal(file: UploadFile = File(...)):
             },
             "file_info": {
                 "filename": file.filename,
-                "size": os.path.getsize(file_path),
+                "size": file_size,
                 "mime_type": mime_type,
                 "extension": file_extension
             }
         }
 
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Universal upload failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -817,13 +1009,87 @@ async def upload_universal(file: UploadFile = File(...)):
         except Exception:
             pass
 
+# -------------------- Streaming Text Analysis --------------------
+
+TEXT_STREAM_BATCH = 32  # chunks classified per detect_emotions() call
+
+def next_chunks(chunks, n: int) -> List[str]:
+    return list(itertools.islice(chunks, n))
+
+async def run_in_pool_waiting(pool: str, fn, *args):
+    """run_in_pool for a response that has already started: wait out saturation instead of failing it."""
+    while True:
+        try:
+            return await run_in_pool(pool, fn, *args)
+        except PoolSaturated as e:
+            await asyncio.sleep(e.retry_after)
+
+async def stream_text_emotions(path: str, file_info: dict):
+    """
+    NDJSON lines for a text file on disk: one "chunk" line per passage, an
+    "aggregate" line after every batch and a final "summary" line. Reading
+    runs in the io pool and scoring in the cpu pool, one batch at a time.
+    The generator owns `path` and deletes it when the stream ends or is aborted.
+    """
+    aggregate = EmotionAggregate()
+    preview = ""
+
+    try:
+        with open(path, "rb") as f:
+            chunks = iter_text_chunks(f)
+            while True:
+                batch = await run_in_pool_waiting("io", next_chunks, chunks, TEXT_STREAM_BATCH)
+                if not batch:
+                    break
+                for chunk in batch:
+                    if len(preview) < 200:
+                        preview = (preview + " " + chunk).strip()
+                results = await run_in_pool_waiting("cpu", detect_emotions, batch)
+                for text, result in zip(batch, results):
+                    aggregate.add(text, result)
+                    yield json.dumps({
+                        "type": "chunk",
+                        "index": aggregate.chunks - 1,
+                        "text_preview": text[:80] + "..." if len(text) > 80 else text,
+                        "characters": len(text),
+                        **result
+                    }) + "\n"
+                yield json.dumps({"type": "aggregate", **aggregate.to_dict()}) + "\n"
+
+        summary = aggregate.to_dict()
+        if aggregate.chunks:
+            # One log row per upload, so a long transcript does not flood the emotion log
+            log_emotion(preview[:200], summary["dominant_emotion"], summary["mean_confidence"])
+        yield json.dumps({
+            "type": "summary",
+            "content_type": "text",
+            "processing": "text_emotion_analysis",
+            "result": {
+                "text_preview": preview[:200] + "..." if len(preview) > 200 else preview,
+                **summary
+            },
+            "file_info": file_info
+        }) + "\n"
+    except Exception as e:
+        logging.exception("Streaming text analysis failed")
+        yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+async def stream_text_upload(file: UploadFile, mime_type: str) -> StreamingResponse:
+    """Copy the upload to a temp file (one io-pool task), then stream its analysis as NDJSON."""
+    path, size = await run_in_pool("io", save_upload_to_temp, file.file, ".txt")
+    file_info = {"filename": file.filename, "size": size, "mime_type": mime_type}
+    return StreamingResponse(stream_text_emotions(path, file_info), media_type="application/x-ndjson")
+
 # -------------------- Simple Text Input Endpoint --------------------
 
 @app.post("/analyze-text")
 async def analyze_text(request: EmotionRequest):
     try:
-        emotion, confidence = detect_emotion(request.text)
-        log_emotion(request.text, emotion, confidence)
+        emotion, confidence = await classify_emotion(request.text)
+        await log_emotion_async(request.text, emotion, confidence)
         response_map = {
             "anxious": "You sound anxious. It's okay, you're safe and not alone.",
             "frustrated": "You seem frustrated. Take your time, I'm here to help.",
@@ -845,20 +1111,76 @@ async def analyze_text(request: EmotionRequest):
                 "text": request.text[:100] + "..." if len(request.text) > 100 else request.text
             }
         }
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Text analysis failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 # -------------------- Original Endpoints (compatibility) --------------------
 
+@app.post("/detect-emotion-batch")
+async def detect_emotion_batch_api(req: EmotionBatchRequest):
+    """Classify many texts in one vectorized pass; each result carries the full class distribution."""
+    try:
+        results = await run_in_pool("cpu", detect_emotions, req.texts)
+    except PoolSaturated:
+        raise
+    except Exception as e:
+        logging.exception("Batch emotion detection failed")
+        raise HTTPException(status_code=500, detail=str(e))
+    if req.log:
+        for text, result in zip(req.texts, results):
+            await log_emotion_async(text, result["emotion"], result["confidence"])
+    return {"results": results, "count": len(results)}
+
+@app.post("/emotion-feedback")
+async def emotion_feedback(req: EmotionFeedbackRequest):
+    """
+    Caregiver-corrected (text, emotion) pairs. They are applied to the online
+    model (and stored) in the background; the updated model is served once
+    enough corrections have been applied.
+    """
+    try:
+        queued = await run_in_pool("io", submit_emotion_feedback, [(c.text, c.emotion) for c in req.corrections])
+    except PoolSaturated:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.exception("Emotion feedback failed")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"queued": queued, "trainer": emotion_trainer.stats()}
+
+@app.get("/emotion-feedback/stats")
+async def emotion_feedback_stats():
+    return {**emotion_trainer.stats(), **online_model_status()}
+
+@app.get("/emotion-cache/stats")
+async def emotion_cache_stats():
+    """Hit/miss counters of the repeated-utterance prediction cache."""
+    return emotion_cache.stats()
+
+@app.get("/emotion-batcher/stats")
+async def emotion_batcher_stats():
+    """Batch-size and queue-wait histograms for tuning ECHO_EMOTION_BATCH_SIZE / _DELAY_MS."""
+    return emotion_batcher.stats()
+
+@app.get("/emotion-log/stats")
+async def emotion_log_stats():
+    """Queued, written and dropped records of the buffered emotion log writer."""
+    return emotion_log.stats()
+
 @app.post("/detect-emotion")
 async def detect_emotion_api(req: EmotionRequest):
     try:
-        emotion, confidence = detect_emotion(req.text)
+        emotion, confidence = await classify_emotion(req.text)
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Emotion detection failed")
         raise HTTPException(status_code=500, detail=str(e))
-    log_emotion(req.text, emotion, confidence)
+    await log_emotion_async(req.text, emotion, confidence)
     response_map = {
         "anxious": "You sound anxious. It's okay, you're safe and not alone.",
         "frustrated": "You seem frustrated. Take your time, I'm here to help.",
@@ -879,16 +1201,17 @@ async def detect_emotion_from_audio(file: UploadFile = File(...)):
     os.makedirs(tmp_dir, exist_ok=True)
     file_path = os.path.join(tmp_dir, file.filename) # type: ignore
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        text = audio_to_text(file_path)
-        emotion, confidence = detect_emotion(text)
-        log_emotion(text, emotion, confidence)
+        await run_in_pool("io", save_upload, file.file, file_path)
+        text = await run_in_pool("io", audio_to_text, file_path)
+        emotion, confidence = await classify_emotion(text)
+        await log_emotion_async(text, emotion, confidence)
         return {
             "original_text": text,
             "emotion": emotion,
             "confidence": confidence
         }
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Audio emotion detection failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -901,7 +1224,44 @@ async def detect_emotion_from_audio(file: UploadFile = File(...)):
 
 @app.get("/emotion-stats")
 async def emotion_stats():
-    return get_emotion_summary()
+    return await run_in_pool("io", get_emotion_summary)
+
+# Window used when the caller leaves out `from`
+TIMESERIES_DEFAULT_WINDOW = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+
+@app.get("/emotion-stats/timeseries")
+async def emotion_stats_timeseries(
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    bucket: str = "hour",
+    user_id: Optional[str] = None,
+):
+    """
+    Emotion counts and mean confidence per hour or day, answered from the
+    incrementally maintained rollups in history_utils. `from`/`to` are ISO
+    times in server local time; `to` defaults to now and `from` to the last
+    24 hours (hour buckets) or 30 days (day buckets).
+    """
+    if bucket not in TIMESERIES_DEFAULT_WINDOW:
+        raise HTTPException(status_code=400, detail="bucket must be 'hour' or 'day'")
+    try:
+        end = datetime.fromisoformat(to) if to else datetime.now()
+        start = datetime.fromisoformat(from_) if from_ else end - TIMESERIES_DEFAULT_WINDOW[bucket]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {e}")
+    if start.tzinfo is not None or end.tzinfo is not None:
+        raise HTTPException(status_code=400, detail="Use local times without a UTC offset")
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    series = await run_in_pool("io", emotion_history.timeseries, start, end, bucket, user_id)
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "bucket": bucket,
+        "user_id": user_id,
+        "series": series,
+    }
 
 # -------------------- Face Recognition Routes --------------------
 
@@ -918,86 +1278,117 @@ async def upload_face(
     file_path = os.path.join("faces", file.filename) # type: ignore
 
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        content = await file.read()
+        # Keep the enrollment photo on disk, but embed from the bytes already in memory
+        await run_in_pool("io", write_bytes, file_path, content)
 
-        save_labelled_face(file_path, label)
+        await run_in_pool("inference", save_labelled_face, content, label, source=file.filename)
         if role:
-            set_label_role(label, role)
+            await run_in_pool("io", set_label_role, label, role)
 
         logging.info(f"Saved labeled face: {label} -> {file_path} (role={role})")
         return {"status": "success", "label": label, "role": role}
     except ValueError as e:
         logging.warning(f"No face detected while uploading {file.filename}: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Failed to save labeled face")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/recognize-face/")
 async def recognize_face_api(file: UploadFile = File(...), speak_response: Optional[bool] = True):
-    tmp_dir = "temp"
-    os.makedirs(tmp_dir, exist_ok=True)
-    file_path = os.path.join(tmp_dir, file.filename) # type: ignore
-
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        label = recognize_face(file_path)
+        faces = await recognize_image_faces(await file.read())
+        best = await run_in_pool("io", attach_roles, faces)
+        label = best["label"] if best else None
         if label:
-            role = get_label_role(label)
-            message = f"According to your label, this is {label} ({role})."
+            message = f"According to your label, this is {describe_faces(faces)}."
         else:
             message = "Sorry, I do not recognize this person."
 
         if speak_response:
-            try:
-                speak(message)
-            except Exception as e:
-                logging.warning(f"Speak failed: {e}")
+            await speak_async(message)
 
-        return {"recognized": label if label else None, "role": get_label_role(label) if label else None, "message": message}
+        return {"recognized": label if label else None, "role": best["role"] if best else None, "faces": faces, "message": message}
+    except PoolSaturated:
+        raise
     except Exception as e:
         logging.exception("Face recognition failed")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception:
-            pass
+
+@app.post("/recognize-faces-batch")
+async def recognize_faces_batch(files: List[UploadFile] = File(...)):
+    """
+    Recognize many images from one multipart request. Images are decoded in
+    parallel, embedded in a single batch and matched against the gallery in
+    one operation (or spread over the face worker processes when they run).
+    """
+    try:
+        started = datetime.now()
+        blobs = [await f.read() for f in files]
+        images = await run_in_pool("cpu", decode_images, blobs)
+        matches = await run_in_pool("inference", recognize_images, images)
+
+        roles = await run_in_pool("io", load_roles)
+        results = []
+        for f, match in zip(files, matches):
+            label = match["label"]
+            role = roles.get(label, "friend") if label else None
+            results.append({
+                "filename": f.filename,
+                "recognized": label,
+                "role": role,
+                "score": match["score"],
+                "message": f"Recognized as {label} ({role})" if label else "Person not recognized",
+                "error": match["error"]
+            })
+
+        return {
+            "count": len(results),
+            "recognized_count": sum(1 for r in results if r["recognized"]),
+            "results": results,
+            "elapsed_ms": round((datetime.now() - started).total_seconds() * 1000, 1)
+        }
+    except PoolSaturated:
+        raise
+    except Exception as e:
+        logging.exception("Batch face recognition failed")
+        raise HTTPException(status_code=500, detail=str(e))
 
 # -------------------- Preferences & Roles Management --------------------
 
 @app.post("/set-prefs")
 async def set_prefs(prefs: PrefsRequest):
+    changes = {}
     if prefs.username is not None:
-        USER_PREFS["username"] = prefs.username
+        changes["username"] = prefs.username
     if prefs.sleep_hour is not None:
         try:
             hour = int(prefs.sleep_hour)
             if 0 <= hour <= 23:
-                USER_PREFS["sleep_hour"] = hour
+                changes["sleep_hour"] = hour
         except Exception:
             pass
     if prefs.sleep_enabled is not None:
-        USER_PREFS["sleep_enabled"] = bool(prefs.sleep_enabled)
-    save_prefs()
+        changes["sleep_enabled"] = bool(prefs.sleep_enabled)
+    await run_in_pool("io", save_prefs, changes)
     return {"status": "ok", "prefs": USER_PREFS}
 
 @app.get("/get-prefs")
 async def get_prefs():
+    await run_in_pool("io", sync_prefs)
     return {"prefs": USER_PREFS}
 
 @app.post("/set-face-role")
 async def set_face_role(req: FaceRoleRequest):
-    set_label_role(req.label, req.role)
+    await run_in_pool("io", set_label_role, req.label, req.role)
     return {"status": "ok", "label": req.label, "role": req.role}
 
 @app.get("/get-face-role")
 async def get_face_role(label: str):
-    role = get_label_role(label)
+    role = await run_in_pool("io", get_label_role, label)
     return {"label": label, "role": role}
 
 # -------------------- Utility Endpoints --------------------
@@ -1006,25 +1397,37 @@ async def get_face_role(label: str):
 async def healthcheck():
     return {"status": "ok"}
 
+@app.get("/executor/stats")
+async def executor_stats():
+    """Per-pool in-flight work, queue depth and rejections (503s)."""
+    stats = pool_stats()
+    if face_workers is not None:
+        stats["face-workers"] = face_workers.stats()
+    return stats
+
+@app.get("/face-cache/stats")
+async def face_cache_stats():
+    """Hit/miss counters of the repeated-frame embedding cache."""
+    return face_cache.stats()
+
+def list_faces_with_roles() -> List[dict]:
+    # The first call may load the whole gallery (or migrate the legacy pickle)
+    labels = list(dict.fromkeys(get_gallery().labels))
+    roles_map = load_roles()
+    return [{"label": l, "role": roles_map.get(l, "friend")} for l in labels]
+
 @app.get("/list-faces")
 async def list_known_faces():
-    enc_file = "face_encodings.pkl"
-    if os.path.exists(enc_file):
-        try:
-            import pickle
-            with open(enc_file, "rb") as f:
-                data = pickle.load(f)
-            labels = list(dict.fromkeys(data.get("labels", [])))
-            # Attach roles
-            roles_map = load_roles()
-            labeled_with_roles = [{"label": l, "role": roles_map.get(l, "friend")} for l in labels]
-            return {"count": len(labels), "faces": labeled_with_roles}
-        except Exception:
-            logging.exception("Failed to read encodings")
-            raise HTTPException(status_code=500, detail="Failed to read encodings")
-    return {"count": 0, "faces": []}
+    try:
+        labeled_with_roles = await run_in_pool("io", list_faces_with_roles)
+        return {"count": len(labeled_with_roles), "faces": labeled_with_roles}
+    except PoolSaturated:
+        raise
+    except Exception:
+        logging.exception("Failed to read encodings")
+        raise HTTPException(status_code=500, detail="Failed to read encodings")
 
 # -------------------- Run with Uvicorn --------------------
-if __name__ == "_main_":
+if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,155 @@
+import time
+import queue
+import threading
+from bisect import bisect_left
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+from executor_utils import PoolSaturated
+
+# ---------------- DYNAMIC MICRO-BATCHING ---------------- #
+#
+# Callers submit single items and get a Future back. One worker thread
+# takes the first waiting item, then keeps collecting until either
+# MAX_BATCH_SIZE items are queued or MAX_DELAY seconds have passed since
+# that first item arrived, and runs the batch function once for all of
+# them. A lone request therefore waits at most MAX_DELAY; under load the
+# per-call model overhead is paid once per batch instead of once per item.
+# At most MAX_QUEUE items wait; beyond that submit() raises PoolSaturated,
+# like the executor pools, so callers can answer 503.
+
+MAX_BATCH_SIZE = 32
+MAX_DELAY = 0.005  # seconds
+MAX_QUEUE = 8 * MAX_BATCH_SIZE
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250)
+
+class Histogram:
+    """Fixed-bucket histogram; a value lands in the first bucket >= it."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else None,
+        }
+
+class MicroBatcher:
+    """
+    Collect single-item requests into batches for `batch_fn(items) -> results`
+    (one result per item, same order). If the batch function raises, every
+    caller in that batch receives the exception.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = MAX_BATCH_SIZE,
+                 max_delay: float = MAX_DELAY, name: str = "batcher", max_queue: int = MAX_QUEUE):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.rejected = 0
+        self._avg_seconds = 0.0  # exponential moving average of batch duration
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _retry_after(self) -> int:
+        batches_ahead = self._queue.qsize() / max(self.max_batch_size, 1)
+        return max(1, int(round(batches_ahead * max(self._avg_seconds, 0.1))))
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the Future resolves to its result. Raises PoolSaturated when the queue is full."""
+        self._ensure_started()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+                retry_after = self._retry_after()
+            raise PoolSaturated(self.name, retry_after)
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(item).result()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: batch function returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                elapsed = time.perf_counter() - started
+                self._avg_seconds = elapsed if not self._avg_seconds else 0.8 * self._avg_seconds + 0.2 * elapsed
+                self.batch_sizes.observe(len(batch))
+                for _, _, enqueued in batch:
+                    self.queue_wait_ms.observe((started - enqueued) * 1000.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_delay_ms": self.max_delay * 1000.0,
+                "max_queue": self.max_queue,
+                "queued": self._queue.qsize(),
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "items": self.items,
+                "errors": self.errors,
+                "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+                "batch_size_histogram": self.batch_sizes.to_dict(),
+                "queue_wait_ms_histogram": self.queue_wait_ms.to_dict(),
+            }
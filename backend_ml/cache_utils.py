@@ -0,0 +1,137 @@
+import time
+import hashlib
+import threading
+import numpy as np
+import cv2
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# ---------------- BOUNDED LRU CACHE ---------------- #
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a size bound, optional TTL and hit/miss
+    counters. get_or_compute() coalesces concurrent misses on the same key
+    so only one caller runs the computation; the others wait for its result.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key: Hashable):
+        """Return (found, value); caller holds the lock."""
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        value, stored_at = item
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            del self._data[key]
+            self.expirations += 1
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            }
+
+# ---------------- IMAGE HASHING ---------------- #
+
+def content_hash(image) -> str:
+    """Fast exact hash of encoded bytes, a file's bytes, or an ndarray's pixels."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(image, np.ndarray):
+        h.update(str((image.shape, image.dtype.str)).encode("ascii"))
+        h.update(np.ascontiguousarray(image).data)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        h.update(image)
+    else:
+        with open(image, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def perceptual_hash(image: np.ndarray, hash_size: int = 8) -> str:
+    """
+    Difference hash (dHash) of a BGR image: near-identical frames (JPEG
+    noise, tiny shifts in lighting) map to the same 64-bit value.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict
+
+# ---------------- BOUNDED EXECUTION POOLS ---------------- #
+#
+# Blocking work (model inference, speech, video decoding, file writes) runs
+# in named pools instead of on the asyncio event loop. Each pool admits at
+# most `workers + max_queue` tasks; beyond that submit() raises
+# PoolSaturated straight away, so an overloaded server answers 503 with a
+# Retry-After hint instead of queueing requests without limit.
+#
+#   inference  TensorFlow face embedding (the model is shared, so few workers)
+#   video      whole-video analysis, kept apart so one upload cannot starve
+#              the live face-recognition WebSocket
+#   cpu        sklearn batches, image decoding and other NumPy/OpenCV work
+#   io         speech-to-text, text-to-speech, camera and file access
+#
+# A pool becomes a process pool with ECHO_POOL_<NAME>_KIND=process; only
+# picklable module-level functions can be sent to it.
+
+CPU_COUNT = os.cpu_count() or 2
+
+POOL_CONFIG = {
+    # name: (workers, max_queue)
+    "inference": (2, 16),
+    "video": (1, 2),
+    "cpu": (CPU_COUNT, 4 * CPU_COUNT),
+    "io": (8, 64),
+}
+
+class PoolSaturated(RuntimeError):
+    """Raised when a pool's queue is full; `retry_after` is a hint in seconds."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"The {pool} pool is saturated, retry in {retry_after}s")
+        self.pool = pool
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    """Thread or process pool that rejects work instead of queueing past `max_queue`."""
+
+    def __init__(self, name: str, workers: int, max_queue: int, kind: str = "thread"):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pool-{name}")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._avg_seconds = 0.0  # exponential moving average of task duration
+
+    def _retry_after(self) -> int:
+        backlog = self._in_flight / max(self.workers, 1)
+        return max(1, int(round(backlog * max(self._avg_seconds, 0.1))))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated(self.name, self._retry_after())
+            self._in_flight += 1
+            self.submitted += 1
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+
+        def _done(f: Future):
+            elapsed = time.perf_counter() - started  # includes queue wait, which is what callers see
+            with self._lock:
+                self._in_flight -= 1
+                if f.exception() is not None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self._avg_seconds = elapsed if not self._avg_seconds else 0.8 * self._avg_seconds + 0.2 * elapsed
+
+        future.add_done_callback(_done)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.workers),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_task_seconds": round(self._avg_seconds, 4),
+            }
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+def _build_pools() -> Dict[str, BoundedExecutor]:
+    pools = {}
+    for name, (workers, max_queue) in POOL_CONFIG.items():
+        prefix = f"ECHO_POOL_{name.upper()}_"
+        pools[name] = BoundedExecutor(
+            name,
+            workers=int(os.environ.get(prefix + "WORKERS", workers)),
+            max_queue=int(os.environ.get(prefix + "QUEUE", max_queue)),
+            kind=os.environ.get(prefix + "KIND", "thread"),
+        )
+    return pools
+
+pools = _build_pools()
+
+async def run_in_pool(pool: str, fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call in the named pool and await its result."""
+    return await pools[pool].run(fn, *args, **kwargs)
+
+def pool_stats() -> Dict[str, Any]:
+    return {name: executor.stats() for name, executor in pools.items()}
+
+def shutdown_pools(wait: bool = False):
+    for executor in pools.values():
+        executor.shutdown(wait=wait)
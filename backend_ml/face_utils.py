@@ -0,0 +1,265 @@
+import os
+import threading
+import tempfile
+import numpy as np
+import cv2
+from io import BytesIO
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from deepface import DeepFace
+from deepface.modules import preprocessing
+from typing import List, Dict, Any, Optional
+
+# ---------------- FACE EMBEDDING ENGINE ---------------- #
+
+FACE_MODEL_NAME = "Facenet"
+DETECTOR_BACKEND = "opencv"  # DeepFace.represent default
+
+class FaceEmbedder:
+    """
+    Holds a prebuilt DeepFace recognition model and embeds many faces in a
+    single forward pass. Mirrors DeepFace.represent (same preprocessing and
+    result dictionaries) without the per-call model lookup.
+    """
+
+    def __init__(self, model_name: str = FACE_MODEL_NAME, detector_backend: str = DETECTOR_BACKEND):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.model = None
+        self._load_lock = threading.Lock()
+        # Keras models are not safe for concurrent predict calls
+        self._forward_lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    @property
+    def input_shape(self):
+        return self.model.input_shape
+
+    def load(self):
+        """Build the recognition model and detector once and warm them up."""
+        with self._load_lock:
+            if self.model is not None:
+                return
+            model = DeepFace.build_model(model_name=self.model_name, task="facial_recognition")
+            if self.detector_backend != "skip":
+                DeepFace.build_model(model_name=self.detector_backend, task="face_detector")
+            # First call traces the graph; do it now rather than on a request
+            height, width = model.input_shape[1], model.input_shape[0]
+            model.forward(np.zeros((1, height, width, 3), dtype=np.float32))
+            self.model = model
+
+    def _prepare(self, face_bgr: np.ndarray) -> np.ndarray:
+        target_size = self.input_shape
+        img = preprocessing.resize_image(img=face_bgr, target_size=(target_size[1], target_size[0]))
+        return preprocessing.normalize_input(img=img, normalization="base")
+
+    def embed_crops(self, crops: List[np.ndarray]) -> np.ndarray:
+        """
+        Embed already-cropped BGR face images in one batched forward pass.
+        Returns an (n, dim) float32 array.
+        """
+        if not self.is_loaded:
+            self.load()
+        if not crops:
+            return np.empty((0, 0), dtype=np.float32)
+        batch = np.concatenate([self._prepare(crop) for crop in crops], axis=0)
+        with self._forward_lock:
+            embeddings = self.model.forward(batch)
+        return np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+
+    def extract_faces(self, image, enforce_detection: bool = True) -> List[Dict[str, Any]]:
+        """Detect and align faces; `face` is returned BGR, scaled to [0, 1]."""
+        img_objs = DeepFace.extract_faces(
+            img_path=image,
+            detector_backend=self.detector_backend,
+            enforce_detection=enforce_detection,
+            align=True,
+        )
+        for img_obj in img_objs:
+            img_obj["face"] = img_obj["face"][:, :, ::-1]
+        return img_objs
+
+    def represent(self, images: List[Any], enforce_detection: bool = True,
+                  max_faces: Optional[int] = None, ignore_errors: bool = False) -> List[Any]:
+        """
+        Batched equivalent of DeepFace.represent for a list of image paths or
+        BGR arrays: detection runs per image, embedding runs once for every
+        face found. Returns one list of {embedding, facial_area,
+        face_confidence} per input image. With `ignore_errors`, an image that
+        fails detection yields its exception instead of failing the batch.
+        """
+        faces, owners, objs = [], [], []
+        results: List[Any] = [[] for _ in images]
+        for idx, image in enumerate(images):
+            try:
+                img_objs = self.extract_faces(image, enforce_detection=enforce_detection)
+            except Exception as e:
+                if not ignore_errors:
+                    raise
+                results[idx] = e
+                continue
+            if max_faces is not None and len(img_objs) > max_faces:
+                img_objs = sorted(
+                    img_objs,
+                    key=lambda o: o["facial_area"]["w"] * o["facial_area"]["h"],
+                    reverse=True,
+                )[:max_faces]
+            for img_obj in img_objs:
+                faces.append(img_obj["face"])
+                owners.append(idx)
+                objs.append(img_obj)
+
+        if not faces:
+            return results
+
+        embeddings = self.embed_crops(faces)
+        for owner, img_obj, embedding in zip(owners, objs, embeddings):
+            results[owner].append({
+                "embedding": embedding.tolist(),
+                "facial_area": img_obj["facial_area"],
+                "face_confidence": img_obj["confidence"],
+            })
+        return results
+
+face_engine = FaceEmbedder()
+
+# ---------------- MULTI-FACE DETECTION (res10 SSD) ---------------- #
+
+DETECTOR_PROTOTXT = "deploy.prototxt"
+DETECTOR_CAFFEMODEL = "res10_300x300_ssd_iter_140000.caffemodel"
+DETECTION_CONFIDENCE = 0.5
+DETECTION_INPUT_SIZE = 300
+DETECTION_MEAN = (104.0, 177.0, 123.0)
+
+class SSDFaceDetector:
+    """
+    OpenCV res10 SSD face detector loaded once through cv2.dnn. Each frame
+    is downscaled to the 300x300 network input, so one pass finds every
+    face regardless of the original resolution.
+    """
+
+    def __init__(self, prototxt: str = DETECTOR_PROTOTXT, caffemodel: str = DETECTOR_CAFFEMODEL,
+                 confidence: float = DETECTION_CONFIDENCE, input_size: int = DETECTION_INPUT_SIZE):
+        self.prototxt = prototxt
+        self.caffemodel = caffemodel
+        self.confidence = confidence
+        self.input_size = input_size
+        self.net = None
+        # cv2.dnn.Net keeps per-call state in the net object
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.net is not None
+
+    def load(self):
+        if not (os.path.exists(self.prototxt) and os.path.exists(self.caffemodel)):
+            raise FileNotFoundError(f"Face detector files not found: {self.prototxt}, {self.caffemodel}")
+        self.net = cv2.dnn.readNetFromCaffe(self.prototxt, self.caffemodel)
+
+    def detect(self, image: np.ndarray, confidence: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return [{"bbox": (x, y, w, h), "confidence": c}] for faces above the threshold."""
+        if self.net is None:
+            self.load()
+        threshold = self.confidence if confidence is None else confidence
+        height, width = image.shape[:2]
+        size = (self.input_size, self.input_size)
+        blob = cv2.dnn.blobFromImage(cv2.resize(image, size), 1.0, size, DETECTION_MEAN)
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()[0, 0]
+
+        detections = detections[detections[:, 2] > threshold]
+        boxes = detections[:, 3:7] * np.array([width, height, width, height])
+        boxes = np.clip(boxes, 0, [width, height, width, height]).astype(int)
+        faces = []
+        for (x1, y1, x2, y2), score in zip(boxes, detections[:, 2]):
+            if x2 > x1 and y2 > y1:
+                faces.append({"bbox": (int(x1), int(y1), int(x2 - x1), int(y2 - y1)), "confidence": float(score)})
+        return faces
+
+    @staticmethod
+    def crop(image: np.ndarray, bbox) -> np.ndarray:
+        x, y, w, h = bbox
+        return image[y:y + h, x:x + w]
+
+face_detector = SSDFaceDetector()
+
+def initialize_face_detector():
+    """Load the res10 SSD detector (files are fetched by app.ensure_face_detector_files)."""
+    face_detector.load()
+    print("SSD face detector initialized successfully!")
+
+# ---------------- IMAGE DECODING ---------------- #
+
+# cv2.imdecode releases the GIL, so a small pool decodes uploads in parallel
+DECODE_WORKERS = 4
+_decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+
+def decode_image(data: bytes) -> np.ndarray:
+    """
+    Decode encoded image bytes to a BGR array in memory. OpenCV handles
+    JPEG/PNG/BMP/WebP; PIL covers formats it cannot read, such as GIF.
+    """
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is not None:
+        return img
+    try:
+        with Image.open(BytesIO(data)) as pil_image:
+            return cv2.cvtColor(np.array(pil_image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    except Exception:
+        raise ValueError("Could not decode image data.")
+
+def to_bgr_array(image) -> np.ndarray:
+    """Load a path, encoded bytes or BGR ndarray as a BGR ndarray."""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(bytes(image))
+    img = cv2.imread(image)
+    if img is None:
+        with open(image, "rb") as f:
+            img = decode_image(f.read())
+    return img
+
+@contextmanager
+def image_input(image):
+    """
+    Yield something DeepFace can read for `image` (a path, a BGR ndarray or
+    encoded bytes). Bytes are decoded in memory; a temp file is only written
+    when neither OpenCV nor PIL can decode them, and removed afterwards.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        try:
+            yield decode_image(bytes(image))
+            return
+        except ValueError:
+            pass
+        fd, temp_path = tempfile.mkstemp(suffix=".img")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(image)
+            yield temp_path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    else:
+        yield image
+
+def decode_images(blobs: List[bytes]) -> List[Any]:
+    """Decode many images in parallel; undecodable entries become their exception."""
+    def _safe_decode(data):
+        try:
+            return decode_image(data)
+        except Exception as e:
+            return e
+    return list(_decode_pool.map(_safe_decode, blobs))
+
+def initialize_face_engine():
+    """Preload and warm the face embedding model (call once at startup)."""
+    face_engine.load()
+    print(f"{FACE_MODEL_NAME} face embedding model initialized successfully!")
@@ -0,0 +1,343 @@
+import os
+import queue
+import threading
+import multiprocessing
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from executor_utils import PoolSaturated
+from face_utils import to_bgr_array
+
+# ---------------- FACE RECOGNITION WORKER PROCESSES ---------------- #
+#
+# TensorFlow holds the GIL for much of a Facenet forward pass, so threads
+# inside one server process cannot use more than about one core for
+# recognition. FaceWorkerPool runs FACE_WORKERS long-lived processes that
+# each load the detector, Facenet and the gallery once at start-up.
+#
+# Frames never go through pickle: the parent keeps a ring of shared-memory
+# slots, copies the decoded BGR frame into a free slot and sends the worker
+# only (slot name, shape). The worker maps the slot once, reads the frame in
+# place and returns the small list of match dicts. A slot goes back on the
+# free list when its result arrives. When every slot is busy, submit_*()
+# raises PoolSaturated like the thread pools in executor_utils, while the
+# blocking wrappers used by background threads (video analysis) wait.
+#
+# Workers share the append-only face store with the parent and sync the
+# gallery before each call, so a face enrolled through the API is matched
+# by every worker within a second. Live tracking runs in the workers too:
+# the connection's small tracker object travels with the frame and comes
+# back updated, so any worker can serve the next frame.
+#
+# If a worker process dies, every pending future fails with
+# BrokenProcessPool. The pool then marks itself unavailable (callers fall
+# back to in-process recognition) and spawns a fresh executor in the
+# background.
+#
+# The pool is off unless ECHO_FACE_WORKERS is set: each worker holds its own
+# copy of TensorFlow and Facenet (several hundred MB).
+
+FACE_WORKERS = int(os.environ.get("ECHO_FACE_WORKERS", "0"))
+SLOTS_PER_WORKER = 2                     # one frame being read, one queued
+SLOT_BYTES = 1920 * 1080 * 3             # a 1080p BGR frame; larger frames get a one-off segment
+SLOT_WAIT_SECONDS = 30.0                 # how long blocking callers wait for a free slot
+SLOT_HANDBACK_SECONDS = 1.0              # wait for a slot a finished task of ours is returning
+
+# ---------- worker process side ---------- #
+
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+def _init_worker():
+    import model_utils
+    from face_utils import initialize_face_engine, initialize_face_detector
+    initialize_face_engine()
+    try:
+        initialize_face_detector()
+    except Exception as e:
+        print(f"Face worker {os.getpid()}: SSD detector unavailable ({e}), using DeepFace detection")
+    model_utils.get_gallery().ensure_loaded()
+
+def _frame_view(name: str, shape: Tuple[int, ...], keep: bool) -> Tuple[np.ndarray, shared_memory.SharedMemory]:
+    shm = _attached.get(name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+        if keep:
+            _attached[name] = shm  # ring slots are reused, so map each one only once
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf), shm
+
+def _run_on_frame(task: str, name: str, shape: Tuple[int, ...], keep: bool, kwargs: Dict[str, Any]):
+    import model_utils
+    frame, shm = _frame_view(name, shape, keep)
+    try:
+        model_utils.get_gallery().sync()
+        if task == "faces":
+            return model_utils.recognize_faces_in_image(frame, **kwargs)
+        if task == "track":
+            tracker = kwargs["tracker"]
+            return model_utils.track_faces_in_image(tracker, frame, kwargs.get("min_confidence")), tracker
+        if task == "main":
+            return model_utils.recognize_faces([frame])[0]
+        return model_utils.recognize_face(frame)
+    finally:
+        del frame  # the parent may reuse the slot as soon as we return
+        if not keep:
+            shm.close()
+
+def _ping() -> int:
+    return os.getpid()
+
+# ---------- parent side ---------- #
+
+class FaceWorkersUnavailable(RuntimeError):
+    """The pool is not running (not started, shut down or restarting after a crash)."""
+
+# Errors after which a caller should recognize in-process instead
+WORKERS_DOWN = (FaceWorkersUnavailable, BrokenProcessPool)
+
+class FaceWorkerPool:
+    """Process pool for face recognition with frames passed through shared memory."""
+
+    def __init__(self, workers: int = FACE_WORKERS, slots: Optional[int] = None, slot_bytes: int = SLOT_BYTES):
+        self.workers = workers
+        self.slot_bytes = slot_bytes
+        self.slot_count = slots or workers * SLOTS_PER_WORKER
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: List[shared_memory.SharedMemory] = []
+        self._free: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.oversized = 0
+        self.restarts = 0
+        self._restarting = False
+        self._closed = False
+
+    def _spawn(self) -> ProcessPoolExecutor:
+        # spawn, not fork: TensorFlow state does not survive fork()
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # ProcessPoolExecutor spawns every worker on the first submit; wait for their initializers
+        for future in [executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def start(self):
+        """Spawn the workers and wait until each has loaded its models."""
+        with self._lock:
+            if self._executor is not None or self._restarting:
+                return
+            self._closed = False
+            if not self._slots:
+                for _ in range(self.slot_count):
+                    slot = shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+                    self._slots.append(slot)
+                    self._free.put(slot)
+        executor = self._spawn()
+        with self._lock:
+            self._executor = executor
+        print(f"Face worker pool ready: {self.workers} process(es), {self.slot_count} shared-memory slots")
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def _on_broken(self):
+        """A worker died: take the pool out of service and respawn it in the background."""
+        with self._lock:
+            if self._closed or self._restarting or self._executor is None:
+                return
+            broken, self._executor = self._executor, None
+            self._restarting = True
+            self.restarts += 1
+        print("Face worker process died; restarting the pool (recognition runs in-process meanwhile)")
+        threading.Thread(target=self._restart, args=(broken,), name="face-worker-restart", daemon=True).start()
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        try:
+            broken.shutdown(wait=False, cancel_futures=True)
+            executor = self._spawn()
+            with self._lock:
+                closed = self._closed
+                if not closed:
+                    self._executor = executor
+            if closed:
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                print("Face worker pool restarted")
+        except Exception as e:
+            print(f"Failed to restart face worker pool: {e}")
+        finally:
+            with self._lock:
+                self._restarting = False
+
+    def _submit(self, task: str, image: Any, wait: float, **kwargs) -> Future:
+        """Hand `image` to a worker; `wait` is how many seconds to wait for a free slot (0: none)."""
+        executor = self._executor
+        if executor is None:
+            raise FaceWorkersUnavailable("Face worker pool is not running")
+        frame = np.ascontiguousarray(to_bgr_array(image), dtype=np.uint8)
+
+        if frame.nbytes > self.slot_bytes:
+            shm, keep = shared_memory.SharedMemory(create=True, size=frame.nbytes), False
+            with self._lock:
+                self.oversized += 1
+        else:
+            try:
+                shm = self._free.get(timeout=wait) if wait else self._free.get_nowait()
+                keep = True
+            except queue.Empty:
+                with self._lock:
+                    self.rejected += 1
+                raise PoolSaturated("face-workers", 1)
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)[...] = frame
+
+        def _release(f: Future):
+            error = f.exception()
+            with self._lock:
+                if error is not None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            if keep:
+                self._free.put(shm)
+            else:
+                shm.close()
+                shm.unlink()
+            if isinstance(error, BrokenProcessPool):
+                self._on_broken()
+
+        try:
+            future = executor.submit(_run_on_frame, task, shm.name, frame.shape, keep, kwargs)
+        except BrokenProcessPool as e:
+            future = Future()
+            future.set_exception(e)
+        except RuntimeError:
+            future = Future()
+            future.set_exception(FaceWorkersUnavailable("Face worker pool is shut down"))
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(_release)
+        return future
+
+    def submit_faces(self, image: Any, min_confidence: Optional[float] = None, use_cache: bool = True,
+                     wait: bool = False) -> Future:
+        """Future for recognize_faces_in_image(image) run in a worker."""
+        return self._submit("faces", image, SLOT_WAIT_SECONDS if wait else 0,
+                            min_confidence=min_confidence, use_cache=use_cache)
+
+    def submit_face(self, image: Any, wait: bool = False) -> Future:
+        """Future for recognize_face(image) run in a worker."""
+        return self._submit("face", image, SLOT_WAIT_SECONDS if wait else 0)
+
+    def submit_main_face(self, image: Any, wait: bool = False) -> Future:
+        """Future for recognize_faces([image])[0] ({"label", "score", "error"}) run in a worker."""
+        return self._submit("main", image, SLOT_WAIT_SECONDS if wait else 0)
+
+    def submit_track(self, image: Any, tracker: Any, min_confidence: Optional[float] = None,
+                     wait: bool = False) -> Future:
+        """Future for (track_faces_in_image(tracker, image), updated tracker) run in a worker."""
+        return self._submit("track", image, SLOT_WAIT_SECONDS if wait else 0,
+                            tracker=tracker, min_confidence=min_confidence)
+
+    def recognize_faces_in_image(self, image: Any, min_confidence: Optional[float] = None,
+                                 use_cache: bool = True) -> List[dict]:
+        return self.submit_faces(image, min_confidence, use_cache, wait=True).result()
+
+    def recognize_face(self, image: Any) -> Optional[str]:
+        return self.submit_face(image, wait=True).result()
+
+    def recognize_faces(self, images: List[Any],
+                        fallback: Optional[Callable[[List[Any]], List[dict]]] = None) -> List[dict]:
+        """
+        recognize_faces() spread over the workers, one image per task. Images
+        are handed over as slots free up, never waiting on other callers'
+        work: when every slot is busy and none of ours is about to come back,
+        or a worker dies, the remaining images go to `fallback(images)`
+        (in-process recognition) or, without one, are reported as errors.
+        Entries of `images` that are exceptions (failed decodes) are
+        reported as errors.
+        """
+        results: List[Optional[dict]] = [None] * len(images)
+        pending: "deque[Tuple[int, Future]]" = deque()
+        leftover: List[int] = []
+
+        def collect():
+            idx, future = pending.popleft()
+            try:
+                results[idx] = future.result()
+            except WORKERS_DOWN:
+                leftover.append(idx)
+            except Exception as e:
+                results[idx] = {"label": None, "score": None, "error": str(e)}
+
+        for idx, image in enumerate(images):
+            if isinstance(image, Exception):
+                results[idx] = {"label": None, "score": None, "error": str(image)}
+                continue
+            wait = 0.0
+            while True:
+                try:
+                    pending.append((idx, self._submit("main", image, wait)))
+                    break
+                except PoolSaturated:
+                    if not pending:
+                        leftover.append(idx)
+                        break
+                    collect()  # one of ours finishes and hands its slot back
+                    wait = SLOT_HANDBACK_SECONDS
+                except WORKERS_DOWN:
+                    leftover.append(idx)
+                    break
+        while pending:
+            collect()
+
+        if leftover:
+            leftover.sort()
+            if fallback is not None:
+                computed = fallback([images[i] for i in leftover])
+            else:
+                computed = [{"label": None, "score": None, "error": "No face worker available"} for _ in leftover]
+            for idx, result in zip(leftover, computed):
+                results[idx] = result
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": "process",
+                "workers": self.workers,
+                "started": self.started,
+                "restarting": self._restarting,
+                "restarts": self.restarts,
+                "slots": self.slot_count,
+                "free_slots": self._free.qsize(),
+                "slot_bytes": self.slot_bytes,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "oversized_frames": self.oversized,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._closed = True
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+        self._slots = []
+        self._free = queue.Queue()
+
+face_workers = FaceWorkerPool() if FACE_WORKERS > 0 else None
@@ -0,0 +1,469 @@
+import os
+import csv
+import json
+import numpy as np
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from state_utils import file_lock
+
+# ---------------- DAY-PARTITIONED EMOTION HISTORY ---------------- #
+#
+# Every logged emotion is also stored as four typed columns, one directory
+# per calendar day:
+#
+#   logs/emotion_history/
+#     emotions.json            category codes: ["anxious", "calm", ...]
+#     users.json               user codes (code 0 = no user_id)
+#     2026-10-18/ts.i64        wall-clock microseconds since 1970-01-01
+#     2026-10-18/emotion.u8    index into emotions.json
+#     2026-10-18/confidence.f32
+#     2026-10-18/user.u32      index into users.json, plus one
+#
+# Appends are raw little-endian writes at the end of each column file, one
+# write per column per batch. A row exists once all four columns hold it;
+# readers use the shortest column, and a writer trims longer columns left
+# by an interrupted append before adding to them. Timestamps are the same
+# naive local times as the CSV, so hour/day buckets follow the wall clock.
+# Range queries only open the partitions of the days they cover.
+#
+# Each append also updates two rollups: per-hour totals in the day's
+# hourly.json and per-day totals in daily/<YYYY-MM>.json, each keyed by
+# bucket start and by user ("*" for everyone). An append rewrites only the
+# rollup files of the days it touches, so their size stays bounded by one
+# day or one month however long the history grows. timeseries() answers
+# from these alone, so a dashboard polling a month reads one small file per
+# day (or one per month for daily buckets), never the raw rows.
+#
+# The columns are written before the rollups, so a crash in between leaves
+# rows no rollup has counted. Each rollup therefore records how many rows of
+# a day it has folded in ("rows": the day's count in hourly.json, a map of
+# day to count in the month file). The next append to that day, or the
+# first timeseries() of a process for any day, folds the missing rows in
+# from the columns.
+
+HISTORY_DIR = "logs/emotion_history"
+COLUMNS = {
+    "ts": np.dtype("<i8"),
+    "emotion": np.dtype("u1"),
+    "confidence": np.dtype("<f4"),
+    "user": np.dtype("<u4"),
+}
+COLUMN_FILES = {"ts": "ts.i64", "emotion": "emotion.u8", "confidence": "confidence.f32", "user": "user.u32"}
+BUCKET_MICROS = {"hour": 3600 * 10 ** 6, "day": 86400 * 10 ** 6}
+MIGRATE_BATCH_SIZE = 50000
+HOURLY_ROLLUP_FILE = "hourly.json"   # in each day partition
+DAILY_ROLLUP_DIR = "daily"           # in the history root, one <YYYY-MM>.json per month
+ALL_USERS = "*"
+ROLLUP_ROWS_KEY = "rows"             # partition rows a rollup has folded in (not a bucket)
+
+_EPOCH = datetime(1970, 1, 1)
+
+def to_micros(moment: datetime) -> int:
+    return (moment.replace(tzinfo=None) - _EPOCH) // timedelta(microseconds=1)
+
+def from_micros(micros: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(micros))
+
+# A record is (timestamp, emotion, confidence, user_id or None)
+Record = Tuple[datetime, str, float, Optional[str]]
+
+def _read_json(path: str, default: Any) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def _write_json(path: str, data: Any):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _rollup_add(table: Dict[str, Any], bucket_key: str, user_key: str, emotion: str, confidence: float):
+    entry = table.setdefault(bucket_key, {}).setdefault(
+        user_key, {"total": 0, "counts": {}, "confidence_sum": 0.0})
+    entry["total"] += 1
+    entry["counts"][emotion] = entry["counts"].get(emotion, 0) + 1
+    entry["confidence_sum"] += confidence
+
+def _bucket_key(micros: int, bucket: str) -> str:
+    return from_micros(micros - micros % BUCKET_MICROS[bucket]).isoformat()
+
+class EmotionHistory:
+    """Append-only columnar emotion log partitioned by day, with range queries."""
+
+    def __init__(self, root: str = HISTORY_DIR):
+        self.root = root
+        self._rollup_cache: Dict[str, Tuple[tuple, Any]] = {}
+        self._rollups_checked = False
+
+    def lock(self):
+        """The cross-process lock every append holds (reentrant within a thread)."""
+        return file_lock(os.path.join(self.root, "history"))
+
+    # ---------- dictionaries ---------- #
+
+    def _load_codes(self, name: str) -> List[str]:
+        return _read_json(os.path.join(self.root, name), [])
+
+    def _save_codes(self, name: str, values: List[str]):
+        _write_json(os.path.join(self.root, name), values)
+
+    def emotions(self) -> List[str]:
+        return self._load_codes("emotions.json")
+
+    def users(self) -> List[str]:
+        return self._load_codes("users.json")
+
+    # ---------- writing ---------- #
+
+    def _partition_path(self, day: date) -> str:
+        return os.path.join(self.root, day.isoformat())
+
+    def _daily_rollup_path(self, month: str) -> str:
+        return os.path.join(self.root, DAILY_ROLLUP_DIR, f"{month}.json")
+
+    def _column_sizes(self, path: str) -> Dict[str, int]:
+        sizes = {}
+        for name, filename in COLUMN_FILES.items():
+            column_path = os.path.join(path, filename)
+            sizes[name] = os.path.getsize(column_path) if os.path.exists(column_path) else 0
+        return sizes
+
+    def _align_columns(self, path: str) -> int:
+        """Trim columns to the rows every column holds; returns that row count."""
+        sizes = self._column_sizes(path)
+        rows = min(sizes[name] // COLUMNS[name].itemsize for name in COLUMNS)
+        for name, filename in COLUMN_FILES.items():
+            if sizes[name] > rows * COLUMNS[name].itemsize:
+                with open(os.path.join(path, filename), "r+b") as f:
+                    f.truncate(rows * COLUMNS[name].itemsize)
+        return rows
+
+    def append(self, records: Iterable[Record]) -> int:
+        """Append records (any order, any days); returns how many were written."""
+        records = list(records)
+        if not records:
+            return 0
+        os.makedirs(self.root, exist_ok=True)
+        with self.lock():
+            emotions, users = self.emotions(), self.users()
+            emotion_codes = {e: i for i, e in enumerate(emotions)}
+            user_codes = {u: i + 1 for i, u in enumerate(users)}
+            n_emotions, n_users = len(emotions), len(users)
+
+            by_day: Dict[date, List[tuple]] = {}
+            for moment, emotion, confidence, user_id in records:
+                if emotion not in emotion_codes:
+                    if len(emotions) > np.iinfo(COLUMNS["emotion"]).max:
+                        raise ValueError("Too many distinct emotions for the uint8 emotion column")
+                    emotion_codes[emotion] = len(emotions)
+                    emotions.append(emotion)
+                user_code = 0
+                if user_id is not None:
+                    user_code = user_codes.get(user_id)
+                    if user_code is None:
+                        users.append(user_id)
+                        user_code = user_codes[user_id] = len(users)
+                by_day.setdefault(moment.date(), []).append(
+                    (to_micros(moment), emotion_codes[emotion], confidence, user_code))
+
+            # Dictionaries first: a column row must never reference an unknown code
+            if len(emotions) != n_emotions:
+                self._save_codes("emotions.json", emotions)
+            if len(users) != n_users:
+                self._save_codes("users.json", users)
+
+            written: Dict[date, Tuple[int, List[tuple]]] = {}
+            for day, rows in by_day.items():
+                path = self._partition_path(day)
+                os.makedirs(path, exist_ok=True)
+                written[day] = (self._align_columns(path), rows)
+                values = list(zip(*rows))
+                for (name, dtype), column in zip(COLUMNS.items(), values):
+                    with open(os.path.join(path, COLUMN_FILES[name]), "ab") as f:
+                        f.write(np.asarray(column, dtype=dtype).tobytes())
+            self._update_rollups(written, emotions, users)
+        return len(records)
+
+    # ---------- rollups ---------- #
+
+    @staticmethod
+    def _folded_rows(hourly: Dict[str, Any], daily: Dict[str, Any], day: date, rows: int) -> Tuple[int, int]:
+        """
+        Rows of `day` (which now has `rows`) the hourly and the daily rollup
+        have folded in. Rollups written before the counts were kept are
+        taken as complete.
+        """
+        day_key = datetime.combine(day, datetime.min.time()).isoformat()
+        hourly_rows = hourly.get(ROLLUP_ROWS_KEY, rows if hourly else 0)
+        daily_rows = daily.get(ROLLUP_ROWS_KEY, {}).get(day.isoformat(), rows if day_key in daily else 0)
+        return hourly_rows, daily_rows
+
+    def _column_rows(self, day: date, start: int, stop: int) -> List[tuple]:
+        columns = self.read_partition(day, start)
+        return list(zip(*(columns[name][:stop - start].tolist() for name in COLUMNS)))
+
+    def _update_rollups(self, by_day: Dict[date, Tuple[int, List[tuple]]], emotions: List[str], users: List[str]):
+        """
+        Fold newly written rows into the hourly and daily rollups (caller
+        holds the lock). `by_day` maps a day to its row count before the new
+        rows and the new rows; rows before those that a rollup is missing
+        are read back from the columns first.
+        """
+        os.makedirs(os.path.join(self.root, DAILY_ROLLUP_DIR), exist_ok=True)
+        monthly: Dict[str, Dict[str, Any]] = {}
+        for day, (start, rows) in by_day.items():
+            month = day.isoformat()[:7]
+            daily = monthly.get(month)
+            if daily is None:
+                daily = monthly[month] = _read_json(self._daily_rollup_path(month), {})
+            hourly_path = os.path.join(self._partition_path(day), HOURLY_ROLLUP_FILE)
+            hourly = _read_json(hourly_path, {})
+            hourly_rows, daily_rows = self._folded_rows(hourly, daily, day, start)
+            for table, bucket, folded in ((hourly, "hour", hourly_rows), (daily, "day", daily_rows)):
+                missing = self._column_rows(day, folded, start) if folded < start else []
+                for micros, emotion_code, confidence, user_code in missing + rows:
+                    emotion = emotions[emotion_code]
+                    confidence = float(np.float32(confidence))  # same value the column holds
+                    user_keys = (ALL_USERS, users[user_code - 1]) if user_code else (ALL_USERS,)
+                    for user_key in user_keys:
+                        _rollup_add(table, _bucket_key(micros, bucket), user_key, emotion, confidence)
+            hourly[ROLLUP_ROWS_KEY] = start + len(rows)
+            daily.setdefault(ROLLUP_ROWS_KEY, {})[day.isoformat()] = start + len(rows)
+            _write_json(hourly_path, hourly)
+        for month, daily in monthly.items():
+            _write_json(self._daily_rollup_path(month), daily)
+
+    def _check_rollups(self):
+        """Fold in rows an interrupted append left out of the rollups; once per process."""
+        self._rollups_checked = True
+        stale = []
+        for day in self.days():
+            sizes = self._column_sizes(self._partition_path(day))
+            rows = min(sizes[name] // COLUMNS[name].itemsize for name in COLUMNS)
+            hourly = self._cached_rollup(os.path.join(self._partition_path(day), HOURLY_ROLLUP_FILE))
+            daily = self._cached_rollup(self._daily_rollup_path(day.isoformat()[:7]))
+            if min(self._folded_rows(hourly, daily, day, rows)) < rows:
+                stale.append(day)
+        if not stale:
+            return
+        with self.lock():
+            self._update_rollups({day: (self._align_columns(self._partition_path(day)), []) for day in stale},
+                                 self.emotions(), self.users())
+
+    def rebuild_rollups(self):
+        """Recompute every rollup from the columns (e.g. after partitions were removed by hand)."""
+        with self.lock():
+            emotions, users = self.emotions(), self.users()
+            daily_dir = os.path.join(self.root, DAILY_ROLLUP_DIR)
+            if os.path.isdir(daily_dir):
+                for name in os.listdir(daily_dir):
+                    os.remove(os.path.join(daily_dir, name))
+            for day in self.days():
+                hourly_path = os.path.join(self._partition_path(day), HOURLY_ROLLUP_FILE)
+                if os.path.exists(hourly_path):
+                    os.remove(hourly_path)
+                rows = self._align_columns(self._partition_path(day))
+                self._update_rollups({day: (0, self._column_rows(day, 0, rows))}, emotions, users)
+
+    def _cached_rollup(self, path: str) -> Dict[str, Any]:
+        """Parsed rollup file, re-read only when its mtime or size changed."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return {}
+        signature = (st.st_mtime_ns, st.st_size)
+        cached = self._rollup_cache.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, _read_json(path, {}))
+            self._rollup_cache[path] = cached
+        return cached[1]
+
+    def timeseries(self, start: datetime, end: datetime, bucket: str = "hour",
+                   user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Like bucket_counts(), from the rollups: every bucket whose start lies
+        in [start rounded down to the bucket, end). Empty buckets are omitted.
+        """
+        if bucket not in BUCKET_MICROS:
+            raise ValueError(f"bucket must be one of: {', '.join(BUCKET_MICROS)}")
+        if not self._rollups_checked:
+            self._check_rollups()
+        lo, hi = _bucket_key(to_micros(start), bucket), end.isoformat()
+        user_key = ALL_USERS if user_id is None else user_id
+        if bucket == "day":
+            last_month = (end - timedelta(microseconds=1)).isoformat()[:7]
+            daily_dir = os.path.join(self.root, DAILY_ROLLUP_DIR)
+            months = sorted(name[:-len(".json")] for name in os.listdir(daily_dir)
+                            if name.endswith(".json")) if os.path.isdir(daily_dir) else []
+            tables = [self._cached_rollup(self._daily_rollup_path(month))
+                      for month in months if lo[:7] <= month <= last_month]
+        else:
+            tables = [self._cached_rollup(os.path.join(self._partition_path(day), HOURLY_ROLLUP_FILE))
+                      for day in self.days(start, end)]
+        series = []
+        for table in tables:
+            for key in sorted(k for k in table if k != ROLLUP_ROWS_KEY and lo <= k < hi):
+                entry = table[key].get(user_key)
+                if entry:
+                    series.append({
+                        "start": key,
+                        "total": entry["total"],
+                        "counts": dict(entry["counts"]),
+                        "mean_confidence": round(entry["confidence_sum"] / entry["total"], 4),
+                    })
+        return series
+
+    # ---------- reading ---------- #
+
+    def days(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[date]:
+        """Partitions overlapping [start, end), oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        days = []
+        for name in os.listdir(self.root):
+            try:
+                day = date.fromisoformat(name)
+            except ValueError:
+                continue
+            if start is not None and day < start.date():
+                continue
+            if end is not None and datetime.combine(day, datetime.min.time()) >= end:
+                continue
+            days.append(day)
+        return sorted(days)
+
+    def read_partition(self, day: date, start: int = 0) -> Dict[str, np.ndarray]:
+        """Columns of one day's rows from row `start` on (in append order)."""
+        path = self._partition_path(day)
+        columns = {}
+        for name, filename in COLUMN_FILES.items():
+            column_path = os.path.join(path, filename)
+            dtype = COLUMNS[name]
+            if os.path.exists(column_path) and os.path.getsize(column_path) > start * dtype.itemsize:
+                columns[name] = np.fromfile(column_path, dtype=dtype, offset=start * dtype.itemsize)
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+        rows = min(len(c) for c in columns.values())  # a half-written last row is not visible yet
+        return {name: column[:rows] for name, column in columns.items()}
+
+    def _user_code(self, user_id: Optional[str]) -> Optional[int]:
+        if user_id is None:
+            return None
+        users = self.users()
+        return users.index(user_id) + 1 if user_id in users else -1
+
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              user_id: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Columns of every row with start <= timestamp < end (optionally one user's rows)."""
+        user_code = self._user_code(user_id)
+        lo = to_micros(start) if start is not None else None
+        hi = to_micros(end) if end is not None else None
+        parts = []
+        for day in self.days(start, end):
+            columns = self.read_partition(day)
+            mask = np.ones(len(columns["ts"]), dtype=bool)
+            if lo is not None:
+                mask &= columns["ts"] >= lo
+            if hi is not None:
+                mask &= columns["ts"] < hi
+            if user_code is not None:
+                mask &= columns["user"] == user_code
+            parts.append({name: column[mask] for name, column in columns.items()})
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+    def bucket_counts(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      bucket: str = "hour", user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Per-bucket emotion counts and mean confidence over [start, end):
+        [{"start", "total", "counts": {emotion: n}, "mean_confidence"}],
+        oldest first, empty buckets omitted.
+        """
+        if bucket not in BUCKET_MICROS:
+            raise ValueError(f"bucket must be one of: {', '.join(BUCKET_MICROS)}")
+        rows = self.query(start, end, user_id)
+        if not len(rows["ts"]):
+            return []
+        emotions = self.emotions()
+        keys = rows["ts"] // BUCKET_MICROS[bucket]
+        buckets, index = np.unique(keys, return_inverse=True)
+        totals = np.bincount(index, minlength=len(buckets))
+        confidence = np.bincount(index, weights=rows["confidence"].astype(np.float64), minlength=len(buckets))
+        per_emotion = np.zeros((len(buckets), len(emotions)), dtype=np.int64)
+        np.add.at(per_emotion, (index, rows["emotion"].astype(np.intp)), 1)
+        return [
+            {
+                "start": from_micros(key * BUCKET_MICROS[bucket]).isoformat(),
+                "total": int(totals[i]),
+                "counts": {emotions[c]: int(n) for c, n in enumerate(per_emotion[i]) if n},
+                "mean_confidence": round(float(confidence[i] / totals[i]), 4),
+            }
+            for i, key in enumerate(buckets)
+        ]
+
+    def earliest(self) -> Optional[datetime]:
+        for day in self.days():
+            ts = self.read_partition(day)["ts"]
+            if len(ts):
+                return from_micros(ts.min())
+        return None
+
+    # ---------- migration ---------- #
+
+    def migrate_csv(self, csv_path: str, batch_size: int = MIGRATE_BATCH_SIZE) -> int:
+        """
+        Import rows of an emotion CSV log that are older than everything
+        already stored, so running it again (or after live logging has
+        started) does not duplicate rows. Returns the number imported.
+        """
+        cutoff = self.earliest()
+        imported = 0
+        batch: List[Record] = []
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    moment = datetime.fromisoformat(row["timestamp"])
+                    record = (moment, row["emotion"], float(row["confidence"]), None)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if cutoff is not None and moment >= cutoff:
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    imported += self.append(batch)
+                    batch = []
+        return imported + self.append(batch)
+
+emotion_history = EmotionHistory()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Day-partitioned emotion history")
+    parser.add_argument("--migrate-csv", metavar="CSV",
+                        help="import an existing emotion CSV log (e.g. logs/emotion_logs.csv)")
+    parser.add_argument("--from", dest="start", help="ISO start time for --counts")
+    parser.add_argument("--to", dest="end", help="ISO end time for --counts")
+    parser.add_argument("--counts", choices=sorted(BUCKET_MICROS), help="print counts per emotion per bucket")
+    parser.add_argument("--user-id", help="restrict --counts to one user")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help=f"recompute {HOURLY_ROLLUP_FILE} and {DAILY_ROLLUP_DIR}/ from the columns")
+    args = parser.parse_args()
+
+    if args.migrate_csv:
+        imported = emotion_history.migrate_csv(args.migrate_csv)
+        print(f"Imported {imported} rows from {args.migrate_csv} into {emotion_history.root}")
+    if args.counts:
+        start = datetime.fromisoformat(args.start) if args.start else None
+        end = datetime.fromisoformat(args.end) if args.end else None
+        for entry in emotion_history.bucket_counts(start, end, args.counts, args.user_id):
+            print(json.dumps(entry))
+    if args.rebuild_rollups:
+        emotion_history.rebuild_rollups()
+        print(f"Rebuilt rollups in {emotion_history.root}")
+    if not (args.migrate_csv or args.counts or args.rebuild_rollups):
+        parser.print_help()
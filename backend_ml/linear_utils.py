@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+# ---------------- COMPILED LINEAR TEXT CLASSIFIER ---------------- #
+#
+# A fitted TfidfVectorizer + LogisticRegression pipeline reduces to:
+#
+#   tokens  -> column ids (vocabulary)
+#   x       = counts * idf, then L2-normalised
+#   logits  = x @ coef.T + intercept
+#   proba   = softmax(logits)  (sigmoid for two classes)
+#
+# CompiledLinearClassifier stores just the vocabulary, idf, coefficients and
+# intercepts and runs those steps with a few NumPy operations, skipping the
+# sklearn pipeline's per-call validation. It needs neither sklearn nor
+# pickle to load, and gives the same probabilities as the pipeline.
+
+class CompiledLinearClassifier:
+    """predict_proba-compatible replacement for a TF-IDF + linear model pipeline."""
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, coef: np.ndarray, intercept: np.ndarray,
+                 classes: Sequence[str], token_pattern: str = r"(?u)\b\w\w+\b", lowercase: bool = True,
+                 ngram_range=(1, 1), stop_words: Optional[Sequence[str]] = None, norm: Optional[str] = "l2",
+                 sublinear_tf: bool = False, multi_class: str = "multinomial"):
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.ngram_range = tuple(ngram_range)
+        self.stop_words = frozenset(stop_words or ())
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.multi_class = multi_class
+        self._token_re = re.compile(token_pattern)
+
+    # ---------- export ---------- #
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "CompiledLinearClassifier":
+        """Compile a fitted make_pipeline(TfidfVectorizer(), LogisticRegression())."""
+        vectorizer, classifier = pipeline.steps[0][1], pipeline.steps[-1][1]
+        unsupported = {
+            "analyzer": vectorizer.analyzer != "word",
+            "tokenizer": vectorizer.tokenizer is not None,
+            "preprocessor": vectorizer.preprocessor is not None,
+            "strip_accents": vectorizer.strip_accents is not None,
+            "binary": vectorizer.binary,
+            "norm": vectorizer.norm not in ("l2", "l1", None),
+        }
+        bad = [name for name, flag in unsupported.items() if flag]
+        if bad:
+            raise ValueError(f"Cannot compile vectorizer with custom {', '.join(bad)}")
+
+        n_features = len(vectorizer.vocabulary_)
+        idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(n_features)
+        multi_class = getattr(classifier, "multi_class", "auto")
+        return cls(
+            vocabulary={term: int(col) for term, col in vectorizer.vocabulary_.items()},
+            idf=idf,
+            coef=classifier.coef_,
+            intercept=classifier.intercept_,
+            classes=[str(c) for c in classifier.classes_],
+            token_pattern=vectorizer.token_pattern,
+            lowercase=vectorizer.lowercase,
+            ngram_range=vectorizer.ngram_range,
+            stop_words=sorted(vectorizer.get_stop_words() or ()),
+            norm=vectorizer.norm,
+            sublinear_tf=vectorizer.sublinear_tf,
+            multi_class="ovr" if multi_class == "ovr" else "multinomial",
+        )
+
+    # ---------- inference ---------- #
+
+    def _tokens(self, text: str) -> List[str]:
+        if self.lowercase:
+            text = text.lower()
+        words = [w for w in self._token_re.findall(text) if w not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return words
+        tokens = words if min_n == 1 else []
+        for n in range(max(min_n, 2), max_n + 1):
+            tokens.extend(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+        return tokens
+
+    def transform(self, texts: Sequence[str]):
+        """(rows, cols, values) of the normalised TF-IDF matrix, in CSR order."""
+        rows, cols = [], []
+        vocabulary = self.vocabulary
+        for row, text in enumerate(texts):
+            ids = [vocabulary[t] for t in self._tokens(text) if t in vocabulary]
+            rows.extend([row] * len(ids))
+            cols.extend(ids)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+
+        # Collapse repeated (row, col) pairs into counts
+        keys, counts = np.unique(rows * len(self.idf) + cols, return_counts=True)
+        rows, cols = keys // len(self.idf), keys % len(self.idf)
+        tf = counts.astype(np.float64)
+        if self.sublinear_tf:
+            tf = np.log(tf) + 1
+        values = tf * self.idf[cols]
+
+        if self.norm:
+            power = 2 if self.norm == "l2" else 1
+            norms = np.zeros(len(texts))
+            np.add.at(norms, rows, np.abs(values) ** power)
+            norms = np.sqrt(norms) if power == 2 else norms
+            norms[norms == 0] = 1.0
+            values = values / norms[rows]
+        return rows, cols, values
+
+    def decision_function(self, texts: Sequence[str]) -> np.ndarray:
+        rows, cols, values = self.transform(texts)
+        logits = np.tile(self.intercept, (len(texts), 1))
+        np.add.at(logits, rows, values[:, None] * self.coef.T[cols])
+        return logits
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        logits = self.decision_function(list(texts))
+        if logits.shape[1] == 1:
+            positive = 1.0 / (1.0 + np.exp(-logits[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        if self.multi_class == "ovr":
+            scores = 1.0 / (1.0 + np.exp(-logits))
+            return scores / scores.sum(axis=1, keepdims=True)
+        logits = logits - logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        return logits / logits.sum(axis=1, keepdims=True)
+
+    def predict(self, texts: Sequence[str]) -> np.ndarray:
+        return self.classes_[self.decision_function(list(texts)).argmax(axis=1)]
+
+    # ---------- persistence ---------- #
+
+    def save(self, path: str, key: Optional[dict] = None):
+        """Write a single .npz (no pickle) atomically; `key` identifies the training data."""
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        for term, col in self.vocabulary.items():
+            terms[col] = term
+        config = {
+            "token_pattern": self.token_pattern,
+            "lowercase": self.lowercase,
+            "ngram_range": list(self.ngram_range),
+            "stop_words": sorted(self.stop_words),
+            "norm": self.norm,
+            "sublinear_tf": self.sublinear_tf,
+            "multi_class": self.multi_class,
+            "key": key,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # unique per process: workers may save concurrently
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                terms=terms.astype(str),
+                idf=self.idf,
+                coef=self.coef,
+                intercept=self.intercept,
+                classes=self.classes_.astype(str),
+                config=np.array(json.dumps(config)),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, key: Optional[dict] = None) -> Optional["CompiledLinearClassifier"]:
+        """Load a saved classifier; returns None if `key` is given and does not match."""
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data["config"]))
+            if key is not None and config.get("key") != key:
+                return None
+            return cls(
+                vocabulary={term: col for col, term in enumerate(data["terms"].tolist())},
+                idf=data["idf"],
+                coef=data["coef"],
+                intercept=data["intercept"],
+                classes=data["classes"].tolist(),
+                token_pattern=config["token_pattern"],
+                lowercase=config["lowercase"],
+                ngram_range=config["ngram_range"],
+                stop_words=config["stop_words"],
+                norm=config["norm"],
+                sublinear_tf=config["sublinear_tf"],
+                multi_class=config["multi_class"],
+            )
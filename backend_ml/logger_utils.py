@@ -1,81 +1,662 @@
+import io
+import re
 import csv
 import os
+import json
+import time
+import queue
+import atexit
+import itertools
+import threading
+import contextlib
 from datetime import datetime
-import pandas as pd
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+from filelock import Timeout
+from state_utils import file_lock
+from history_utils import EmotionHistory, emotion_history
 
 LOG_FILE = "logs/emotion_logs.csv"
+LOG_HEADER = ["timestamp", "input_text", "emotion", "confidence"]
 
-def log_emotion(text: str, emotion: str, confidence: float):
-    os.makedirs("logs", exist_ok=True)
-    file_exists = os.path.isfile(LOG_FILE)
+# ---------------- BUFFERED LOG WRITER ---------------- #
+#
+# log_emotion() only timestamps the record and puts it on an in-memory
+# queue. A background thread appends queued rows to the CSV in batches:
+# as soon as FLUSH_BATCH_SIZE rows are waiting, or FLUSH_INTERVAL seconds
+# after the first row of a batch arrived. The file format is unchanged.
+# If the queue is full (the disk cannot keep up) new records are dropped
+# and counted rather than blocking the request. After the CSV, each batch
+# goes to the writer's sinks, by default the columnar history in
+# history_utils (ECHO_EMOTION_HISTORY=0 turns it off).
+#
+# Readers do not wait for the flush: pending(stage) returns this process's
+# records that the CSV (stage "csv") or a sink has not stored yet. A stage
+# advances while holding its lock, so a reader holding the same lock sees
+# every record exactly once, either stored or pending. The writer also
+# remembers where in the file its last WRITTEN_BATCHES_KEPT batches ended,
+# so unstored() can tell a reader which of our records lie beyond the
+# offset it has read up to without taking the file lock.
 
-    with open(LOG_FILE, "a", newline="", encoding="utf-8") as csvfile:
-        writer = csv.writer(csvfile)
-        if not file_exists:
-            writer.writerow(["timestamp", "input_text", "emotion", "confidence"])
-        writer.writerow([datetime.now().isoformat(), text, emotion, round(confidence, 2)])
+FLUSH_BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5        # seconds
+MAX_QUEUED_RECORDS = 10000
+WRITTEN_BATCHES_KEPT = 1024
+HISTORY_ENABLED = os.environ.get("ECHO_EMOTION_HISTORY", "1") != "0"
 
+class EmotionLogWriter:
+    """
+    Background CSV appender for (timestamp, text, emotion, confidence,
+    user_id) records; see stats() for its counters. Sinks (add_sink) are
+    called with each written batch; a failing sink does not lose the CSV rows.
+    """
 
-def get_emotion_summary():
-    if not os.path.exists(LOG_FILE):
+    def __init__(self, path: str = LOG_FILE, batch_size: int = FLUSH_BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, max_queued: int = MAX_QUEUED_RECORDS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._direct = threading.Lock()
+        self._sinks: List[Tuple[str, Callable[[List[tuple]], Any], Optional[Any]]] = []
+        # Records some stage has not stored yet, oldest first; _pending[0] is record number _pending_base
+        self._pending: deque = deque()
+        self._pending_base = 0
+        self._stages: Dict[str, int] = {"csv": 0}  # records each stage has stored (or given up on)
+        # (inode, end offset, records) of our latest CSV appends, oldest first
+        self._written: deque = deque(maxlen=WRITTEN_BATCHES_KEPT)
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self.sink_errors = 0
+        self.last_error: Optional[str] = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="emotion-log-writer", daemon=True)
+                    self._thread.start()
+
+    def add_sink(self, name: str, sink: Callable[[List[tuple]], Any], lock: Optional[Any] = None):
+        """Call `sink(batch)` after each CSV write, holding `lock` (the lock its readers take)."""
+        with self._lock:
+            self._stages[name] = self._stages["csv"]
+            self._sinks.append((name, sink, lock))
+
+    def write(self, record: tuple) -> bool:
+        """Queue one record; False if it was dropped."""
+        if self._closed:
+            with self._direct:  # after shutdown, write straight through, in order
+                self.flush()
+                with self._lock:
+                    self._pending.append(record)
+                self._write_batch([record])
+            return True
+        self._ensure_started()
+        with self._lock:
+            # Queue and pending list in the same order: stages advance by count
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self.enqueued += 1
+            self._pending.append(record)
+        return True
+
+    def _advance(self, stage: str, count: int, written: Optional[tuple] = None):
+        with self._lock:
+            if written is not None:
+                self._written.append(written)
+            self._stages[stage] += count
+            done = min(self._stages.values())
+            while self._pending_base < done:
+                self._pending.popleft()
+                self._pending_base += 1
+
+    def pending(self, stage: str = "csv") -> List[tuple]:
+        """
+        Records of this process that `stage` has not stored yet, oldest first.
+        Hold the stage's lock (file_lock(path) for "csv") while reading the
+        stored data and calling this, so no record is missed or seen twice.
+        """
+        with self._lock:
+            return list(itertools.islice(self._pending, self._stages[stage] - self._pending_base, None))
+
+    def unstored(self, inode: Optional[int], offset: int) -> List[tuple]:
+        """
+        Records of this process that are not in the first `offset` bytes of
+        the log file `inode` (None: nothing read yet): those the writer
+        appended beyond it, then those still pending for the CSV, oldest
+        first. Needs no file lock: a batch moves from pending to written in
+        one step. Meant for one reader whose offset only grows (the summary).
+        """
+        with self._lock:
+            written = self._written
+            # Batches the reader has passed are in its aggregate for good
+            while written and written[0][0] == inode and written[0][1] <= offset:
+                written.popleft()
+            records = [record for batch_inode, end, batch in written
+                       if inode is None or (batch_inode == inode and end > offset) for record in batch]
+            records.extend(itertools.islice(self._pending, self._stages["csv"] - self._pending_base, None))
+            return records
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_rows(self, records: List[tuple]):
+        rows = [[moment.isoformat(), text, emotion, round(confidence, 2)]
+                for moment, text, emotion, confidence, _ in records]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Several server workers append to the same file; one writer at a time keeps rows whole
+        with file_lock(self.path):
+            file_exists = os.path.isfile(self.path)
+            with open(self.path, "a", newline="", encoding="utf-8") as csvfile:
+                writer = csv.writer(csvfile)
+                if not file_exists:
+                    writer.writerow(LOG_HEADER)
+                writer.writerows(rows)
+                csvfile.flush()
+                st = os.fstat(csvfile.fileno())
+            self._advance("csv", len(records), written=(st.st_ino, st.st_size, records))
+
+    def _write_batch(self, batch: List[tuple]):
+        try:
+            self._write_rows(batch)
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self.dropped += len(batch)
+                self.last_error = str(e)
+                stages = list(self._stages)
+            for stage in stages:
+                self._advance(stage, len(batch))  # lost, not pending
+            return
+        for name, sink, lock in self._sinks:
+            advanced = False
+            try:
+                with lock or contextlib.nullcontext():
+                    try:
+                        sink(batch)
+                    finally:
+                        self._advance(name, len(batch))
+                        advanced = True
+            except Exception as e:
+                if not advanced:
+                    self._advance(name, len(batch))
+                with self._lock:
+                    self.sink_errors += 1
+                    self.last_error = f"{name}: {e}"
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued record has been written (or failed)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Drain the queue; later records are written synchronously."""
+        self._closed = True
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "pending": len(self._pending),
+                "errors": self.errors,
+                "sink_errors": self.sink_errors,
+                "last_error": self.last_error,
+                "batch_size": self.batch_size,
+                "flush_interval_ms": self.flush_interval * 1000.0,
+            }
+
+def _append_history(batch: List[tuple]):
+    emotion_history.append((moment, emotion, confidence, user_id)
+                           for moment, _, emotion, confidence, user_id in batch)
+
+emotion_log = EmotionLogWriter()
+if HISTORY_ENABLED:
+    emotion_log.add_sink("history", _append_history, lock=emotion_history.lock())
+atexit.register(emotion_log.close)
+
+def log_emotion(text: str, emotion: str, confidence: float, user_id: Optional[str] = None):
+    """
+    Record one prediction; the row reaches LOG_FILE within FLUSH_INTERVAL.
+    `user_id` (the patient) is not written to the CSV; the emotion history
+    stores it for that patient's streak and alert checks.
+    """
+    recent_emotions.record((datetime.now(), text, emotion, confidence, user_id))
+
+
+# ---------------- READING THE LOG TAIL ---------------- #
+
+TAIL_BLOCK_SIZE = 64 * 1024
+# Rows start with an ISO timestamp; used to find a row boundary when reading backwards
+_ROW_START = re.compile(rb"\n(?=\d{4}-\d{2}-\d{2}T\d{2}:)")
+
+def _parse_rows(data: bytes) -> List[List[str]]:
+    text = data.decode("utf-8", errors="replace")
+    return [row for row in csv.reader(io.StringIO(text, newline="")) if len(row) >= 4 and row != LOG_HEADER]
+
+def read_appended(path: str, offset: int, wait: bool = True) -> Optional[bytes]:
+    """
+    Bytes after `offset`. Read under the writers' lock, so the data ends on
+    a complete row; with wait=False, None while another writer holds it.
+    """
+    lock = file_lock(path)
+    try:
+        lock.acquire(timeout=-1 if wait else 0)
+    except Timeout:
+        return None
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read()
+    finally:
+        lock.release()
+
+def read_last_rows(path: str, n: int, end: Optional[int] = None) -> List[List[str]]:
+    """The last `n` rows before byte `end` (EOF by default), reading backwards block by block."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END) if end is None else end
+        size = TAIL_BLOCK_SIZE
+        while True:
+            start = max(0, end - size)
+            f.seek(start)
+            data = f.read(end - start)
+            if start > 0:
+                # The block may begin mid-row (or inside a quoted newline): skip to a row start
+                match = _ROW_START.search(data)
+                data = data[match.end():] if match else b""
+            rows = _parse_rows(data)
+            if len(rows) >= n or start == 0:
+                return rows[-n:] if n else []
+            size *= 4
+
+# ---------------- INCREMENTAL SUMMARY ---------------- #
+#
+# The summary is a running aggregate over the CSV: row count, per-emotion
+# counts, the latest emotion and the sum of confidences. It remembers the
+# byte offset it has read up to, so each call only parses rows appended
+# since the previous one (by this or any other server worker) and an idle
+# log costs a single stat(). The aggregate and offset are checkpointed to
+# SUMMARY_CHECKPOINT_FILE, so a restart reads just the log tail.
+#
+# A read never waits for the log's file lock: if another writer holds it,
+# the tail is folded in on a later read. This process's own events that
+# the aggregate does not cover yet (still queued, or appended past its
+# offset) come from emotion_log.unstored(), so the summary includes an
+# event as soon as log_emotion() returns; other workers' events show up
+# once their rows are read from the tail.
+
+SUMMARY_CHECKPOINT_FILE = "logs/emotion_summary.json"
+CHECKPOINT_EVERY_ROWS = 1000
+
+class EmotionLogSummary:
+    """Totals over LOG_FILE, caught up incrementally from a byte offset."""
+
+    def __init__(self, path: str = LOG_FILE, checkpoint_path: str = SUMMARY_CHECKPOINT_FILE,
+                 writer: Optional[EmotionLogWriter] = None):
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._restored = False
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.inode: Optional[int] = None
+        self.total = 0
+        self.counts: Dict[str, int] = {}
+        self.most_recent: Optional[str] = None
+        self.confidence_sum = 0.0
+        self._unsaved = 0
+
+    def _state(self) -> Dict[str, Any]:
         return {
-            "total": 0,
-            "emotions": {},
-            "most_recent": None,
-            "average_confidence": None
+            "offset": self.offset,
+            "inode": self.inode,
+            "total": self.total,
+            "counts": self.counts,
+            "most_recent": self.most_recent,
+            "confidence_sum": self.confidence_sum,
         }
 
-    df = pd.read_csv(LOG_FILE)
+    def _restore(self):
+        self._restored = True
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.offset = int(state["offset"])
+            self.inode = state["inode"]
+            self.total = int(state["total"])
+            self.counts = {str(k): int(v) for k, v in state["counts"].items()}
+            self.most_recent = state["most_recent"]
+            self.confidence_sum = float(state["confidence_sum"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring unreadable emotion summary checkpoint: {e}")
+            self._reset()
 
-    emotion_counts = df["emotion"].value_counts().to_dict()
-    most_recent = df.iloc[-1]["emotion"]
-    avg_confidence = round(df["confidence"].mean(), 2)
+    def save_checkpoint(self):
+        with self._lock:
+            if not self._restored:
+                return  # nothing read yet; keep the existing checkpoint
+            state = self._state()
+            self._unsaved = 0
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
 
-    return {
-        "total": len(df),
-        "emotions": emotion_counts,
-        "most_recent": most_recent,
-        "average_confidence": avg_confidence
-    }
+    def _add_rows(self, rows: List[List[str]]):
+        for row in rows:
+            try:
+                confidence = float(row[3])
+            except ValueError:
+                continue
+            emotion = row[2]
+            self.total += 1
+            self.counts[emotion] = self.counts.get(emotion, 0) + 1
+            self.most_recent = emotion
+            self.confidence_sum += confidence
+        self._unsaved += len(rows)
 
+    def refresh(self, wait: bool = True):
+        """
+        Fold rows appended since the last call into the aggregate; with
+        wait=False, skip it while another writer holds the log.
+        """
+        with self._lock:
+            if not self._restored:
+                self._restore()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self.total:
+                    self._reset()
+                return
+            if st.st_ino != self.inode or st.st_size < self.offset:
+                self._reset()  # log replaced or truncated: start over
+                self.inode = st.st_ino
+            if st.st_size == self.offset:
+                return
+            chunk = read_appended(self.path, self.offset, wait)
+            if chunk is None:
+                return
+            self.offset += len(chunk)
+            self._add_rows(_parse_rows(chunk))
+            save = self._unsaved >= CHECKPOINT_EVERY_ROWS
+        if save:
+            self.save_checkpoint()
 
-def check_emotion_streak(target_emotion="anxious", streak_length=3):
-    if not os.path.exists(LOG_FILE):
+    def to_dict(self) -> Dict[str, Any]:
+        self.refresh(wait=False)
+        with self._lock:
+            offset, inode = self.offset, self.inode
+            total, counts = self.total, dict(self.counts)
+            most_recent, confidence_sum = self.most_recent, self.confidence_sum
+        # Our events beyond the offset this aggregate was read up to
+        unstored = self.writer.unstored(inode, offset) if self.writer is not None else []
+        for _, _, emotion, confidence, _ in unstored:
+            total += 1
+            counts[emotion] = counts.get(emotion, 0) + 1
+            most_recent = emotion
+            confidence_sum += round(confidence, 2)  # as written to the CSV
         return {
-            "streak_detected": False,
-            "recent_emotions": [],
-            "count": 0
+            "total": total,
+            "emotions": dict(sorted(counts.items(), key=lambda kv: -kv[1])),  # as value_counts()
+            "most_recent": most_recent,
+            "average_confidence": round(confidence_sum / total, 2) if total else None
         }
 
-    df = pd.read_csv(LOG_FILE)
-    recent = df["emotion"].tail(streak_length).tolist()
-    count = recent.count(target_emotion)
+emotion_summary = EmotionLogSummary(writer=emotion_log)
+atexit.register(emotion_summary.save_checkpoint)
+
+def get_emotion_summary():
+    return emotion_summary.to_dict()
+
+
+# ---------------- RECENT EMOTIONS (STREAKS & ALERTS) ---------------- #
+#
+# Each patient (user_id passed to log_emotion) has a fixed-size ring of
+# their latest emotions, plus one ring for the whole log (user_id=None).
+# Next to the ring it keeps the length of the current run of one emotion
+# and a running distress count for each TRACKED_LOOKBACKS window, so the
+# streak and caregiver-alert checks cost O(1) per event instead of a full
+# CSV read.
+#
+# log_emotion() appends each event to the rings in memory. A ring is
+# restored from shared storage once, the first time it is asked for: the
+# whole-log ring from the tail of LOG_FILE, a patient's ring from the user
+# column of the emotion history (history_utils, the last RING_RESTORE_DAYS
+# day partitions), plus this process's events the writer has not stored
+# yet. So a restart loses nothing, and a check never takes the writers'
+# lock; events another server worker logs after the restore are not seen
+# by this worker's rings. Windows longer than RING_CAPACITY are read from
+# storage. With ECHO_EMOTION_HISTORY=0 there is no shared user column and
+# patient rings hold this process's own events only.
+
+RING_CAPACITY = 32
+RING_RESTORE_DAYS = 30
+
+DISTRESS_EMOTIONS = ["anxious", "frustrated", "disoriented"]
+# Alert windows whose distress count is maintained incrementally; others are counted on demand
+TRACKED_LOOKBACKS = tuple(int(n) for n in os.environ.get("ECHO_ALERT_LOOKBACKS", "3,5").split(","))
+
+class EmotionRing:
+    """Latest emotions of one stream with running run-length and distress counters."""
+
+    def __init__(self, capacity: int = RING_CAPACITY, lookbacks=TRACKED_LOOKBACKS,
+                 distress=DISTRESS_EMOTIONS):
+        self.capacity = capacity
+        self.distress = frozenset(distress)
+        self._items: deque = deque(maxlen=capacity)
+        self._distress_counts = {n: 0 for n in lookbacks if 0 < n <= capacity}
+        self.run_emotion: Optional[str] = None
+        self.run_length = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def append(self, emotion: str):
+        items = self._items
+        for n in self._distress_counts:
+            # The n-th newest item drops out of the n-window once this one arrives
+            if len(items) >= n and items[-n] in self.distress:
+                self._distress_counts[n] -= 1
+            if emotion in self.distress:
+                self._distress_counts[n] += 1
+        items.append(emotion)
+        if emotion == self.run_emotion:
+            self.run_length += 1
+        else:
+            self.run_emotion, self.run_length = emotion, 1
+
+    def recent(self, n: int) -> List[str]:
+        """Up to `n` latest emotions, oldest first."""
+        if n <= 0:
+            return []
+        return list(self._items)[-n:]
+
+    def distress_count(self, lookback: int) -> int:
+        if lookback in self._distress_counts:
+            return self._distress_counts[lookback]
+        return sum(1 for e in self.recent(lookback) if e in self.distress)
+
+    def streak(self, emotion: str, length: int) -> bool:
+        """True if the last `length` emotions were all `emotion`."""
+        if length <= 0:
+            return True
+        return self.run_emotion == emotion and self.run_length >= length
+
+class RecentEmotions:
+    """EmotionRing per patient, plus the whole-log ring under user_id=None."""
+
+    def __init__(self, path: str = LOG_FILE, capacity: int = RING_CAPACITY,
+                 writer: Optional[EmotionLogWriter] = None, history: Optional[EmotionHistory] = None):
+        self.path = path
+        self.capacity = capacity
+        self.writer = writer
+        self.history = history
+        self._rings: Dict[Optional[str], EmotionRing] = {}
+        # Held while reading a ring; reentrant so a check can hold it around recent()
+        self.lock = threading.RLock()
+        self._emotion_names: List[str] = []
+        self._user_names: List[str] = []
+
+    def record(self, record: tuple) -> bool:
+        """
+        Write one (timestamp, text, emotion, confidence, user_id) record
+        through the writer and append it to the rings; False if dropped.
+        Both happen under the lock, so a ring being restored counts the
+        record once, either stored or pending.
+        """
+        _, _, emotion, _, user_id = record
+        with self.lock:
+            if self.writer is not None and not self.writer.write(record):
+                return False
+            ring = self._rings.get(None)
+            if ring is not None:
+                ring.append(emotion)
+            if user_id is not None:
+                ring = self._rings.get(user_id)
+                if ring is None and self.history is None:
+                    ring = self._rings[user_id] = EmotionRing(self.capacity)  # nothing to restore from
+                if ring is not None:
+                    ring.append(emotion)
+        return True
+
+    def _pending(self, stage: str, user_id: Optional[str] = None) -> List[str]:
+        if self.writer is None:
+            return []
+        return [emotion for _, _, emotion, _, user in self.writer.pending(stage)
+                if user_id is None or user == user_id]
+
+    # ---------- reading shared storage ---------- #
+
+    def _log_window(self, n: int) -> List[str]:
+        # Under the writers' lock, each of our events is either in the file or pending
+        with file_lock(self.path):
+            stored = [row[2] for row in read_last_rows(self.path, n)] if os.path.exists(self.path) else []
+            return (stored + self._pending("csv"))[-n:]
+
+    def _emotion_name(self, code: int) -> str:
+        if code >= len(self._emotion_names):
+            self._emotion_names = self.history.emotions()
+        return self._emotion_names[code]
+
+    def _stored_patient_emotions(self, user_id: str, n: int) -> List[str]:
+        """Up to `n` latest stored emotions of one patient (caller holds the history lock)."""
+        if user_id not in self._user_names:
+            self._user_names = self.history.users()
+        if user_id not in self._user_names:
+            return []
+        code = self._user_names.index(user_id) + 1
+        found: List[List[int]] = []
+        count = 0
+        for day in reversed(self.history.days()[-RING_RESTORE_DAYS:]):
+            columns = self.history.read_partition(day)
+            mine = columns["emotion"][columns["user"] == code][-(n - count):].tolist()
+            found.append(mine)
+            count += len(mine)
+            if count >= n:
+                break
+        return [self._emotion_name(code) for codes in reversed(found) for code in codes]
+
+    def _patient_window(self, user_id: str, n: int) -> List[str]:
+        if self.history is None:
+            return []
+        # Under the history lock, each of our events is either stored or pending
+        with self.history.lock():
+            return (self._stored_patient_emotions(user_id, n) + self._pending("history", user_id))[-n:]
+
+    def recent(self, n: int, user_id: Optional[str] = None) -> Tuple[EmotionRing, List[str]]:
+        """
+        The ring and its last `n` emotions; windows longer than the ring are
+        read from storage. Hold `lock` while using the ring.
+        """
+        with self.lock:
+            ring = self._rings.get(user_id)
+            if ring is None:
+                ring = self._rings[user_id] = EmotionRing(self.capacity)
+                restored = self._log_window(self.capacity) if user_id is None else \
+                    self._patient_window(user_id, self.capacity)
+                for emotion in restored:
+                    ring.append(emotion)
+            if n <= ring.capacity or len(ring) < ring.capacity:
+                return ring, ring.recent(n)
+            return ring, self._log_window(n) if user_id is None else self._patient_window(user_id, n)
+
+recent_emotions = RecentEmotions(writer=emotion_log, history=emotion_history if HISTORY_ENABLED else None)
+
+def check_emotion_streak(target_emotion="anxious", streak_length=3, user_id: Optional[str] = None):
+    with recent_emotions.lock:
+        ring, recent = recent_emotions.recent(streak_length, user_id)
+        if streak_length <= ring.capacity:
+            streak_detected = len(ring) > 0 and ring.streak(target_emotion, streak_length)
+        else:
+            streak_detected = recent == [target_emotion] * streak_length
 
     return {
-        "streak_detected": recent == [target_emotion] * streak_length,
+        "streak_detected": streak_detected,
         "recent_emotions": recent,
-        "count": count
+        "count": recent.count(target_emotion)
     }
 
 
-def check_caregiver_alert(lookback: int = 5, threshold: int = 3):
-    if not os.path.exists(LOG_FILE):
-        return {
-            "should_alert": False,
-            "distress_count": 0,
-            "distress_emotions": [],
-            "recent_emotions": []
-        }
-
-    df = pd.read_csv(LOG_FILE)
-    recent = df["emotion"].tail(lookback).tolist()
-    distress_emotions = ["anxious", "frustrated", "disoriented"]
+def check_caregiver_alert(lookback: int = 5, threshold: int = 3, user_id: Optional[str] = None):
+    with recent_emotions.lock:
+        ring, recent = recent_emotions.recent(lookback, user_id)
+        if not len(ring):
+            return {
+                "should_alert": False,
+                "distress_count": 0,
+                "distress_emotions": [],
+                "recent_emotions": []
+            }
 
-    distress_count = sum(1 for e in recent if e in distress_emotions)
+        if lookback <= ring.capacity:
+            distress_count = ring.distress_count(lookback)
+        else:
+            distress_count = sum(1 for e in recent if e in ring.distress)
 
     return {
         "should_alert": distress_count >= threshold,
         "distress_count": distress_count,
-        "distress_emotions": distress_emotions,
+        "distress_emotions": list(DISTRESS_EMOTIONS),
         "recent_emotions": recent
     }
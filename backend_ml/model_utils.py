@@ -1,159 +1,922 @@
 import os
-import pickle
+import re
+import json
+import atexit
+import hashlib
+import threading
+import joblib
+import numpy as np
 import pandas as pd
+import sklearn
 from sklearn.pipeline import make_pipeline
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
-from deepface import DeepFace
-from numpy import dot
-from numpy.linalg import norm
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List, Union
+from ann_utils import IVFIndex, suggest_nlist, DEFAULT_NPROBE
+from store_utils import EmbeddingStore
+from face_utils import face_engine, face_detector, image_input, to_bgr_array
+from cache_utils import LRUCache, content_hash, perceptual_hash
+from batch_utils import MicroBatcher
+from linear_utils import CompiledLinearClassifier
+from online_utils import FeedbackLog, OnlineTextClassifier, OnlineTrainer
+from state_utils import ChangeWatcher, file_lock
 
 # ---------------- EMOTION DETECTION ---------------- #
 
 # Global variables
 ML_DATA_FILE = "ml_data.csv"
+# Trained pipeline cached on disk; rebuilt only when the CSV or sklearn changes
+EMOTION_MODEL_FILE = "emotion_model.joblib"
+# Same model exported as plain arrays for the fast NumPy path (see linear_utils)
+EMOTION_COMPILED_FILE = "emotion_model.npz"
+# "compiled" serves predictions from CompiledLinearClassifier, "sklearn" from the pipeline
+EMOTION_INFERENCE = os.environ.get("ECHO_EMOTION_INFERENCE", "compiled")
 model = None
+model_version = 0  # bumped on every (re)load; cached predictions are keyed by it
 df = None
 
-def initialize_emotion_model():
-    """Initialize the emotion detection model."""
-    global model, df
-    
+# Patients repeat the same phrases, so predictions are cached by normalised text
+EMOTION_CACHE_SIZE = 4096
+emotion_cache = LRUCache(maxsize=EMOTION_CACHE_SIZE)
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+def normalize_emotion_text(text: str) -> str:
+    """
+    Case, whitespace and punctuation-insensitive cache key. Punctuation
+    becomes a space, so the TF-IDF tokens (and the prediction) match the raw text.
+    """
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+def _training_data_hash(path: str = ML_DATA_FILE) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _artifact_key(data_hash: str) -> dict:
+    return {"data_sha256": data_hash, "sklearn_version": sklearn.__version__}
+
+def _load_emotion_artifact(key: dict):
+    """Return the saved pipeline if it was trained on the same data and sklearn version."""
+    if not os.path.exists(EMOTION_MODEL_FILE):
+        return None
+    try:
+        artifact = joblib.load(EMOTION_MODEL_FILE)
+    except Exception as e:
+        print(f"Ignoring unreadable emotion model artifact: {e}")
+        return None
+    if not isinstance(artifact, dict) or artifact.get("key") != key:
+        return None
+    return artifact["model"]
+
+def _train_emotion_model():
+    global df
+    df = pd.read_csv(ML_DATA_FILE)
+    pipeline = make_pipeline(
+        TfidfVectorizer(),
+        LogisticRegression()
+    )
+    pipeline.fit(df["text"], df["emotion"])
+    return pipeline
+
+def _load_compiled_emotion_model(key: dict) -> Optional[CompiledLinearClassifier]:
+    if not os.path.exists(EMOTION_COMPILED_FILE):
+        return None
+    try:
+        return CompiledLinearClassifier.load(EMOTION_COMPILED_FILE, key=key)
+    except Exception as e:
+        print(f"Ignoring unreadable compiled emotion model: {e}")
+        return None
+
+def build_emotion_model(force: bool = False):
+    """
+    Train the emotion pipeline and save it to EMOTION_MODEL_FILE, unless an
+    artifact for the current ml_data.csv and sklearn version already exists.
+    Also keeps the compiled export (EMOTION_COMPILED_FILE) in step with it.
+    Returns the pipeline.
+    """
     if not os.path.exists(ML_DATA_FILE):
         raise FileNotFoundError(f"{ML_DATA_FILE} not found. Please provide the emotion dataset.")
 
+    key = _artifact_key(_training_data_hash())
+    # Workers starting together queue here; all but the first then find the fresh artifact
+    with file_lock(EMOTION_MODEL_FILE):
+        pipeline = None if force else _load_emotion_artifact(key)
+        if pipeline is None:
+            pipeline = _train_emotion_model()
+            tmp_path = f"{EMOTION_MODEL_FILE}.{os.getpid()}.tmp"
+            joblib.dump({"key": key, "model": pipeline}, tmp_path)
+            os.replace(tmp_path, EMOTION_MODEL_FILE)  # readers never see a half-written file
+            print(f"Emotion model artifact saved to {EMOTION_MODEL_FILE}")
+            force = True
+
+        if force or _load_compiled_emotion_model(key) is None:
+            CompiledLinearClassifier.from_pipeline(pipeline).save(EMOTION_COMPILED_FILE, key=key)
+            print(f"Compiled emotion model saved to {EMOTION_COMPILED_FILE}")
+    return pipeline
+
+def initialize_emotion_model():
+    """
+    Initialize the emotion detection model: load the saved artifact, or
+    retrain (and save) it when ml_data.csv or sklearn has changed. In the
+    default "compiled" mode only the small .npz export is loaded. Once
+    ONLINE_MIN_UPDATES caregiver corrections have been applied, the online
+    model is served instead.
+    """
+    global model, model_version, base_model, online_model, _model_key
+
     try:
-        df = pd.read_csv(ML_DATA_FILE)
-        
-        # Create and train pipeline
-        model = make_pipeline(
-            TfidfVectorizer(),
-            LogisticRegression()
-        )
-        model.fit(df["text"], df["emotion"])
+        if not os.path.exists(ML_DATA_FILE):
+            raise FileNotFoundError(f"{ML_DATA_FILE} not found. Please provide the emotion dataset.")
+        key = _artifact_key(_training_data_hash())
+        if EMOTION_INFERENCE == "compiled":
+            loaded = _load_compiled_emotion_model(key)
+            if loaded is None:
+                loaded = CompiledLinearClassifier.from_pipeline(build_emotion_model())
+        else:
+            loaded = build_emotion_model()
+
+        base_model = loaded
+        online_model = _restore_online_model(key)
+        _online_watcher.mark_seen()
+        _model_key = key
+        model = _serving_model()
+        model_version += 1
+        emotion_cache.clear()
         print("Emotion detection model initialized successfully!")
         
     except Exception as e:
         print(f"Error initializing emotion model: {e}")
         raise
 
-def detect_emotion(text: str) -> Tuple[str, float]:
-    """Predict emotion from text input."""
+# ---------------- ONLINE LEARNING FROM CORRECTIONS ---------------- #
+
+# Every applied correction is numbered and appended here (newest 4 MB kept):
+# the saved online model is a checkpoint, the log covers what it lacks
+EMOTION_FEEDBACK_FILE = "emotion_feedback.jsonl"
+EMOTION_ONLINE_FILE = "emotion_online.joblib"
+# The freshly seeded SGD model is far more confident than the calibrated base
+# model, so predictions keep coming from the base model until this many
+# corrections have been applied to the online one
+ONLINE_MIN_UPDATES = int(os.environ.get("ECHO_ONLINE_MIN_CORRECTIONS", "20"))
+# Checkpoints of the online model are written at most this often; other
+# workers serve a correction once it is in a checkpoint
+ONLINE_SAVE_INTERVAL = float(os.environ.get("ECHO_ONLINE_SAVE_SECONDS", "10"))
+base_model = None
+online_model: Optional[OnlineTextClassifier] = None
+_model_key: Optional[dict] = None
+emotion_feedback = FeedbackLog(EMOTION_FEEDBACK_FILE)
+# Other server workers publish their corrections through the same file
+_online_watcher = ChangeWatcher(EMOTION_ONLINE_FILE)
+_checkpoint_seq = 0         # feedback_seq of the checkpoint last loaded or saved here
+_checkpoint_timer: Optional[threading.Timer] = None
+_checkpoint_guard = threading.Lock()
+
+def _serving_model():
+    if online_model is not None and online_model.updates >= ONLINE_MIN_UPDATES:
+        return online_model
+    return base_model
+
+def online_model_status() -> dict:
+    return {
+        "serving": "online" if online_model is not None and model is online_model else "base",
+        "online_updates": online_model.updates if online_model is not None else 0,
+        "min_updates": ONLINE_MIN_UPDATES,
+    }
+
+def _seed_online_model(key: dict) -> OnlineTextClassifier:
+    """One-off bootstrap from ml_data.csv, then replay the logged corrections."""
+    data = pd.read_csv(ML_DATA_FILE)
+    seeded = OnlineTextClassifier(classes=data["emotion"].unique(), key=key)
+    seeded.seed_fit(data["text"].tolist(), data["emotion"].tolist())
+    seeded.apply_records(emotion_feedback.records())
+    return seeded
+
+def _restore_online_model(key: dict) -> Optional[OnlineTextClassifier]:
+    """The saved online model plus newer logged corrections, reseeded if ml_data.csv changed; None if there were never corrections."""
+    global _checkpoint_seq
+    if os.path.exists(EMOTION_ONLINE_FILE):
+        try:
+            restored = OnlineTextClassifier.load(EMOTION_ONLINE_FILE, key=key)
+            if restored is not None:
+                _checkpoint_seq = restored.feedback_seq
+                restored.apply_records(emotion_feedback.records_after(restored.feedback_seq))
+                return restored
+        except Exception as e:
+            print(f"Ignoring unreadable online emotion model: {e}")
+    if not emotion_feedback.last_seq():
+        return None
+    with file_lock(EMOTION_ONLINE_FILE):
+        restored = _seed_online_model(key)
+        restored.save(EMOTION_ONLINE_FILE)
+        _checkpoint_seq = restored.feedback_seq
+    return restored
+
+def _sync_online_model(force: bool = False):
+    """Serve the online model another worker saved, if the file changed and holds newer corrections."""
+    global model, model_version, online_model, _checkpoint_seq
+    if _model_key is None or not _online_watcher.changed(force) or not os.path.exists(EMOTION_ONLINE_FILE):
+        return
+    try:
+        updated = OnlineTextClassifier.load(EMOTION_ONLINE_FILE, key=_model_key)
+    except Exception as e:
+        print(f"Ignoring unreadable online emotion model: {e}")
+        return
+    if updated is None:
+        return
+    _checkpoint_seq = max(_checkpoint_seq, updated.feedback_seq)
+    if online_model is None or updated.feedback_seq > online_model.feedback_seq:
+        online_model = updated
+        model = _serving_model()
+        model_version += 1
+        emotion_cache.clear()
+
+def _online_base() -> OnlineTextClassifier:
+    """Model the next correction batch starts from (seeded on first use)."""
+    global online_model
+    _sync_online_model(force=True)  # start from the newest checkpoint; the trainer adds the log tail
+    if online_model is None:
+        online_model = _seed_online_model(_artifact_key(_training_data_hash()))
+    return online_model
+
+def _checkpoint_online_model():
+    """Save the online model unless the checkpoint on disk already holds its corrections."""
+    global _checkpoint_seq, _checkpoint_timer
+    with _checkpoint_guard:
+        _checkpoint_timer = None
+    try:
+        with file_lock(EMOTION_ONLINE_FILE):
+            _sync_online_model(force=True)  # another worker may have saved a newer one meanwhile
+            current = online_model
+            if current is None or current.feedback_seq <= _checkpoint_seq:
+                return
+            current.save(EMOTION_ONLINE_FILE)
+            _online_watcher.mark_seen()
+            _checkpoint_seq = current.feedback_seq
+    except Exception as e:
+        print(f"Failed to save online emotion model: {e}")
+
+def _schedule_online_checkpoint():
+    global _checkpoint_timer
+    with _checkpoint_guard:
+        if _checkpoint_timer is None:
+            _checkpoint_timer = threading.Timer(ONLINE_SAVE_INTERVAL, _checkpoint_online_model)
+            _checkpoint_timer.daemon = True
+            _checkpoint_timer.start()
+
+def _publish_online_model(updated: OnlineTextClassifier):
+    """Swap in the updated copy; bumping the version retires cached predictions."""
+    global model, model_version, online_model
+    online_model = updated
+    model = _serving_model()
+    model_version += 1
+    emotion_cache.clear()
+    _schedule_online_checkpoint()
+
+# The file lock serialises load-update-save across workers, and the trainer
+# logs each batch inside it, so every worker starts from all corrections
+# applied so far: the newest checkpoint plus the log records after it.
+emotion_trainer = OnlineTrainer(_online_base, _publish_online_model, lock=file_lock(EMOTION_ONLINE_FILE),
+                                log=emotion_feedback)
+
+def emotion_labels() -> List[str]:
+    """Emotions the model can predict (and therefore learn from corrections)."""
     if model is None:
         raise RuntimeError("Emotion model not initialized. Call initialize_emotion_model() first.")
-    
+    return [str(c) for c in model.classes_]
+
+def submit_emotion_feedback(corrections: List[Tuple[str, str]]) -> int:
+    """
+    Queue caregiver-corrected (text, emotion) pairs for a background
+    partial_fit; the trainer logs them in EMOTION_FEEDBACK_FILE as it
+    applies them. Raises ValueError for an emotion the model does not know.
+    Returns the number of corrections queued.
+    """
+    known = set(emotion_labels())
+    unknown = sorted({emotion for _, emotion in corrections} - known)
+    if unknown:
+        raise ValueError(f"Unknown emotion label(s): {', '.join(unknown)}. Expected one of: {', '.join(sorted(known))}")
+
+    emotion_trainer.submit(list(corrections))
+    return len(corrections)
+
+def _score_emotions(pipeline, texts: List[str]) -> List[dict]:
     try:
-        pred = model.predict([text])[0]
-        prob = max(model.predict_proba([text])[0])
-        return pred, round(prob, 2)
+        probabilities = pipeline.predict_proba(texts)
     except Exception as e:
         raise RuntimeError(f"Error predicting emotion: {e}")
+    classes = [str(c) for c in pipeline.classes_]
+    best = probabilities.argmax(axis=1)
+    return [
+        {
+            "emotion": classes[idx],
+            "confidence": round(float(row[idx]), 2),
+            "distribution": {c: round(float(p), 4) for c, p in zip(classes, row)},
+        }
+        for idx, row in zip(best, probabilities)
+    ]
+
+def detect_emotions(texts: List[str]) -> List[dict]:
+    """
+    Predict emotions for many texts at once. The TF-IDF transform and the
+    classifier run once for the whole list; labels are the argmax of the
+    probabilities. Returns {"emotion", "confidence", "distribution"} per
+    text, where distribution maps every class to its probability.
+    Previously seen texts are answered from emotion_cache.
+    """
+    if model is None:
+        raise RuntimeError("Emotion model not initialized. Call initialize_emotion_model() first.")
+    if not texts:
+        return []
+    _sync_online_model()
+
+    # Version first: a concurrent swap can then only pair an old key with the new model
+    version = model_version
+    pipeline = model
+    keys = [(version, normalize_emotion_text(text)) for text in texts]
+    results: List[Optional[dict]] = [emotion_cache.get(key) for key in keys]
+
+    missing = {}
+    for idx, (key, result) in enumerate(zip(keys, results)):
+        if result is None:
+            missing.setdefault(key, idx)
+    if missing:
+        scored = _score_emotions(pipeline, [texts[idx] for idx in missing.values()])
+        fresh = dict(zip(missing, scored))
+        for key, result in fresh.items():
+            emotion_cache.set(key, result)
+        results = [fresh.get(key, result) for key, result in zip(keys, results)]
+
+    return [{**r, "distribution": dict(r["distribution"])} for r in results]
+
+def detect_emotion(text: str) -> Tuple[str, float]:
+    """Predict emotion from text input."""
+    result = detect_emotions([text])[0]
+    return result["emotion"], result["confidence"]
+
+# Single-text requests from every endpoint share one batcher: concurrent
+# callers are scored together in one detect_emotions() call (see batch_utils)
+EMOTION_BATCH_SIZE = int(os.environ.get("ECHO_EMOTION_BATCH_SIZE", "32"))
+EMOTION_BATCH_DELAY = float(os.environ.get("ECHO_EMOTION_BATCH_DELAY_MS", "5")) / 1000.0
+# Texts waiting for a batch; beyond this callers get PoolSaturated (503)
+EMOTION_BATCH_QUEUE = int(os.environ.get("ECHO_EMOTION_BATCH_QUEUE", "256"))
+
+emotion_batcher = MicroBatcher(detect_emotions, max_batch_size=EMOTION_BATCH_SIZE,
+                               max_delay=EMOTION_BATCH_DELAY, name="emotion-batcher",
+                               max_queue=EMOTION_BATCH_QUEUE)
 
 # ---------------- FACE RECOGNITION ---------------- #
 
+# Legacy pickle, imported once into the append-only store (see store_utils)
 ENCODINGS_FILE = "face_encodings.pkl"
+FACE_STORE_DIR = "face_store"
 
-def load_encodings():
-    """Load stored face embeddings."""
-    if os.path.exists(ENCODINGS_FILE):
-        try:
-            with open(ENCODINGS_FILE, "rb") as f:
-                return pickle.load(f)
-        except Exception as e:
-            print(f"Error loading encodings: {e}")
-            return {"embeddings": [], "labels": []}
-    return {"embeddings": [], "labels": []}
+face_store = EmbeddingStore(FACE_STORE_DIR)
+# Enrollments by other server workers show up as changes to these files
+_store_watcher = ChangeWatcher(face_store.watch_paths)
 
-def save_encodings(data):
-    """Save face embeddings to file."""
+def load_encodings():
+    """Load stored face embeddings (live rows only)."""
     try:
-        with open(ENCODINGS_FILE, "wb") as f:
-            pickle.dump(data, f)
+        face_store.migrate_from_pickle(ENCODINGS_FILE)
+        face_store.refresh()
+        deleted = face_store.deleted_rows()
+        records = [r for r in face_store.records() if r["row"] not in deleted]
+        matrix = face_store.embeddings()
+        return {
+            "embeddings": [matrix[r["row"]].tolist() for r in records],
+            "labels": [r["label"] for r in records],
+        }
     except Exception as e:
-        raise RuntimeError(f"Error saving encodings: {e}")
+        print(f"Error loading encodings: {e}")
+        return {"embeddings": [], "labels": []}
+
+MATCH_THRESHOLD = 0.75
+
+# Approximate search for large galleries (see ann_utils). "exact" always
+# scans the full matrix; "ivf" switches to the inverted-file index once the
+# gallery reaches ANN_MIN_GALLERY_SIZE. IVF_NPROBE trades speed for recall.
+FACE_INDEX_MODE = os.environ.get("ECHO_FACE_INDEX", "exact")
+ANN_INDEX_FILE = "face_index.npz"
+ANN_MIN_GALLERY_SIZE = 2000
+IVF_NPROBE = int(os.environ.get("ECHO_IVF_NPROBE", DEFAULT_NPROBE))
+# Rows indexed in memory before the IVF file is rewritten; the rest is saved
+# at exit, and a stale file is caught up on load anyway
+ANN_SAVE_EVERY = 256
+# Deleted rows stay in the store (zeroed in the gallery) until compaction;
+# delete() compacts once they are this many and this share of all rows
+COMPACT_MIN_DELETED = 64
+COMPACT_DELETED_FRACTION = 0.25
 
-def save_labelled_face(image_path: str, label: str):
+class FaceGallery:
     """
-    Detect face, extract embedding using DeepFace, and save it with label.
+    Resident index of enrolled faces.
+
+    Embeddings are stored L2-normalised as rows of one contiguous float32
+    matrix, so cosine similarity against the whole gallery is a single
+    matrix-vector product. The matrix is grown geometrically, which keeps
+    enrollment amortised O(1) instead of re-stacking on every insert.
+
+    Row i of the gallery is row i of the embedding store; rows deleted from
+    the store are zeroed here (similarity 0) until the next compaction.
     """
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image file not found: {image_path}")
-    
-    data = load_encodings()
 
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._buffer = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._labels: List[str] = []
+        self._loaded = False
+        self._ann: Optional[IVFIndex] = None
+        self._deleted: set = set()
+        self._generation: Optional[str] = None
+        self._version = 0
+        self._ann_unsaved = 0
+
+    @staticmethod
+    def _normalise(vectors) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0  # zero vectors stay zero -> similarity 0
+        return vectors / norms
+
+    def _reserve(self, rows: int, dim: int):
+        if self._buffer.shape[1] != dim:
+            if self._size:
+                raise ValueError(f"Embedding size {dim} does not match gallery size {self._buffer.shape[1]}")
+            self._buffer = np.empty((0, dim), dtype=np.float32)
+        needed = self._size + rows
+        if needed > self._buffer.shape[0]:
+            capacity = max(needed, 2 * self._buffer.shape[0], 64)
+            grown = np.empty((capacity, dim), dtype=np.float32)
+            grown[:self._size] = self._buffer[:self._size]
+            self._buffer = grown
+
+    def _append(self, embeddings, labels: List[str]):
+        rows = self._normalise(embeddings)
+        self._reserve(len(rows), rows.shape[1])
+        self._buffer[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+        self._labels.extend(labels)
+        self._version += 1
+
+    def load(self):
+        """(Re)build the gallery from the embedding store."""
+        face_store.migrate_from_pickle(ENCODINGS_FILE)
+        with self._lock:
+            face_store.refresh()
+            self._buffer = np.empty((0, 0), dtype=np.float32)
+            self._size = 0
+            self._labels = []
+            self._deleted = set()
+            self._version += 1
+            if len(face_store):
+                self._append(face_store.embeddings(), [r["label"] for r in face_store.records()])
+            self._apply_deletes(face_store.deleted_rows())
+            self._generation = face_store.generation
+            self._ann = None
+            self._ann_unsaved = 0
+            self._load_ann()
+            self._loaded = True
+
+    def _apply_deletes(self, rows):
+        for row in rows:
+            if row < self._size:
+                self._buffer[row] = 0.0
+        self._deleted.update(rows)
+        self._version += 1
+
+    def refresh(self):
+        """Pick up rows committed to the store since the last load/refresh."""
+        if not self._loaded:
+            self.ensure_loaded()
+            return
+        with self._lock:
+            face_store.refresh()
+            if face_store.generation != self._generation:
+                self.load()  # compacted: row numbers changed
+                return
+            start = self._size
+            if len(face_store) > start:
+                added = face_store.records(start)
+                self._append(face_store.embeddings()[start:start + len(added)], [r["label"] for r in added])
+                self._sync_ann(start)
+            deletes = face_store.deleted_rows() - self._deleted
+            if deletes:
+                self._apply_deletes(deletes)
+
+    def sync(self):
+        """refresh() only if another process changed the store (checked at most once a second)."""
+        if _store_watcher.changed():
+            self.refresh()
+
+    # ---------- approximate index ---------- #
+
+    def _ann_wanted(self) -> bool:
+        return FACE_INDEX_MODE == "ivf" and self._size >= ANN_MIN_GALLERY_SIZE
+
+    def _load_ann(self):
+        """Reuse the persisted IVF index, catching up on rows enrolled since it was saved."""
+        if not self._ann_wanted():
+            return
+        if os.path.exists(ANN_INDEX_FILE):
+            try:
+                index = IVFIndex.load(ANN_INDEX_FILE)
+                if (index.tag == face_store.generation and len(index) <= self._size
+                        and index.centroids.shape[1] == self._buffer.shape[1]):
+                    index.nprobe = IVF_NPROBE
+                    if len(index) < self._size:
+                        index.add(self._buffer[len(index):self._size], start=len(index))
+                        index.save(ANN_INDEX_FILE)
+                    self._ann = index
+                    return
+            except Exception as e:
+                print(f"Error loading ANN index, rebuilding: {e}")
+        self.rebuild_ann()
+
+    def rebuild_ann(self):
+        """Re-cluster the whole gallery and persist the index."""
+        with self._lock:
+            index = IVFIndex(nlist=suggest_nlist(self._size), nprobe=IVF_NPROBE,
+                             tag=face_store.generation or "")
+            index.train(self._buffer[:self._size])
+            index.save(ANN_INDEX_FILE)
+            self._ann = index
+            self._ann_unsaved = 0
+
+    def save_ann(self):
+        """Persist rows added to the IVF index since it was last saved."""
+        with self._lock:
+            if self._ann is not None and self._ann_unsaved:
+                self._ann.save(ANN_INDEX_FILE)
+                self._ann_unsaved = 0
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    def invalidate(self):
+        """Drop the resident copy; it is reloaded lazily on next use."""
+        with self._lock:
+            self._loaded = False
+
+    def _sync_ann(self, start: int):
+        """Extend (or rebuild) the IVF index for rows appended from `start`."""
+        if self._ann is None:
+            if self._ann_wanted():
+                self.rebuild_ann()
+        elif self._ann.needs_retrain():
+            self.rebuild_ann()
+        else:
+            self._ann.add(self._buffer[start:self._size], start=start)
+            self._ann_unsaved += self._size - start
+            if self._ann_unsaved >= ANN_SAVE_EVERY:
+                self.save_ann()
+
+    def add(self, embedding, label: str, metadata: Optional[dict] = None):
+        """Durably enroll one embedding (O(1) append) and update the index in place."""
+        self.ensure_loaded()
+        face_store.append(embedding, label, metadata)
+        self.refresh()
+
+    def delete(self, label: str) -> int:
+        """Remove every row of `label`; compacts the store once enough rows are dead."""
+        self.ensure_loaded()
+        removed = face_store.delete(label)
+        self.refresh()
+        deleted = len(face_store.deleted_rows())
+        if deleted >= COMPACT_MIN_DELETED and deleted >= COMPACT_DELETED_FRACTION * len(face_store):
+            self.compact()
+        return removed
+
+    def compact(self):
+        """Reclaim deleted rows: rewrite the store without them and reload (row numbers change)."""
+        with self._lock:
+            face_store.compact()
+            self.load()
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str]]:
+        """Current (matrix, labels) pair; rows are L2-normalised."""
+        self.ensure_loaded()
+        with self._lock:
+            return self._buffer[:self._size], self._labels[:self._size]
+
+    def _top_k(self, matrix: np.ndarray, query: np.ndarray, k: int,
+               nprobe: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        ann = self._ann
+        if ann is not None:
+            return ann.search(matrix, query, k=k, nprobe=nprobe)
+        scores = matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    @property
+    def labels(self) -> List[str]:
+        """Labels of live (non-deleted) rows, in enrollment order."""
+        _, labels = self.snapshot()
+        return [label for i, label in enumerate(labels) if i not in self._deleted]
+
+    def __len__(self):
+        self.ensure_loaded()
+        return self._size
+
+    @property
+    def version(self) -> int:
+        """Changes whenever rows are added or deleted; cached matches compare against it."""
+        return self._version
+
+    @property
+    def state_key(self) -> tuple:
+        """Identifies the gallery contents identically in every process (version is per process)."""
+        return (self._generation, self._size, len(self._deleted))
+
+    def search(self, embedding, k: int = 1, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Return the top-k (label, cosine similarity) pairs, best first.
+        `nprobe` overrides the IVF recall/speed setting when the index is active.
+        """
+        matrix, labels = self.snapshot()
+        if not labels:
+            return []
+        ids, scores = self._top_k(matrix, self._normalise(embedding)[0], k, nprobe)
+        return [(labels[i], float(s)) for i, s in zip(ids, scores)]
+
+    def search_batch(self, embeddings, k: int = 1) -> List[List[Tuple[str, float]]]:
+        """Top-k matches for many query embeddings with one matrix-matrix product."""
+        matrix, labels = self.snapshot()
+        queries = self._normalise(embeddings)
+        if not labels:
+            return [[] for _ in queries]
+        if self._ann is not None:
+            return [self.search(q, k=k) for q in queries]
+        scores = queries @ matrix.T
+        k = min(k, len(labels))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, cols in zip(scores, top):
+            cols = cols[np.argsort(-row[cols])]
+            results.append([(labels[i], float(row[i])) for i in cols])
+        return results
+
+    def match(self, embedding, threshold: float = MATCH_THRESHOLD) -> Optional[str]:
+        """Best label if its similarity exceeds the threshold, else None."""
+        best = self.search(embedding, k=1)
+        if best and best[0][1] > threshold:
+            return best[0][0]
+        return None
+
+    def match_batch(self, embeddings, threshold: float = MATCH_THRESHOLD) -> List[Tuple[Optional[str], float]]:
+        """(label or None, best similarity) for each query embedding."""
+        results = []
+        for best in self.search_batch(embeddings, k=1):
+            label, score = best[0] if best else (None, 0.0)
+            results.append((label if score > threshold else None, score))
+        return results
+
+gallery = FaceGallery()
+atexit.register(gallery.save_ann)
+
+def get_gallery() -> FaceGallery:
+    return gallery
+
+# A path, a BGR ndarray, or encoded image bytes (decoded in memory)
+ImageInput = Union[str, bytes, np.ndarray]
+
+def save_labelled_face(image: ImageInput, label: str, source: Optional[str] = None):
+    """
+    Detect face, extract embedding with the preloaded Facenet engine, and save it with label.
+    """
+    if isinstance(image, str):
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Image file not found: {image}")
+        source = source or os.path.basename(image)
+    
     try:
-        embedding_obj = DeepFace.represent(
-            img_path=image_path,
-            model_name="Facenet",
-            enforce_detection=True
-        )
+        with image_input(image) as img:
+            embedding_obj = face_engine.represent([img], enforce_detection=True)[0]
 
         if not embedding_obj or "embedding" not in embedding_obj[0]:
             raise ValueError("No face detected in the image.")
 
         embedding = embedding_obj[0]["embedding"]
-        data["embeddings"].append(embedding)
-        data["labels"].append(label)
-
-        save_encodings(data)
+        gallery.add(embedding, label, {"source": source} if source else None)
         print(f"Face embedding saved successfully for label: {label}")
 
     except Exception as e:
         raise ValueError(f"Error processing image: {e}")
 
-def recognize_face(image_path: str) -> Optional[str]:
+# Content-hash cache of embeddings for repeated frames (see cache_utils).
+# Entries keep the embedding; the gallery match is recomputed only when the
+# gallery has changed since it was cached.
+FACE_CACHE_SIZE = 512
+FACE_CACHE_TTL = 300.0  # seconds
+FACE_CACHE_PERCEPTUAL = False  # also treat near-identical frames (dHash) as repeats
+
+face_cache = LRUCache(maxsize=FACE_CACHE_SIZE, ttl=FACE_CACHE_TTL)
+
+def _face_cache_key(kind: str, image: ImageInput):
+    if FACE_CACHE_PERCEPTUAL:
+        return (kind, "p", perceptual_hash(image))
+    return (kind, content_hash(image))
+
+def _cached_match(entry: dict, compute_match):
+    version = gallery.version
+    if entry.get("version") != version:
+        entry["match"] = compute_match()
+        entry["version"] = version
+    return entry["match"]
+
+def _embed_main_face(image: ImageInput) -> Optional[List[float]]:
+    try:
+        with image_input(image) as img:
+            embedding_obj = face_engine.represent([img], enforce_detection=True)[0]
+    except ValueError:
+        return None  # no face / undecodable: cache the negative result too
+    if not embedding_obj or "embedding" not in embedding_obj[0]:
+        return None
+    return embedding_obj[0]["embedding"]
+
+def recognize_face(image: ImageInput) -> Optional[str]:
     """
     Compare a given face with stored embeddings and return matched label.
     """
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image file not found: {image_path}")
+    if isinstance(image, str) and not os.path.exists(image):
+        raise FileNotFoundError(f"Image file not found: {image}")
     
-    data = load_encodings()
-    if not data["embeddings"]:
+    gallery.sync()
+    if len(gallery) == 0:
         return None
 
     try:
-        embedding_obj = DeepFace.represent(
-            img_path=image_path,
-            model_name="Facenet",
-            enforce_detection=True
+        if FACE_CACHE_PERCEPTUAL:
+            image = to_bgr_array(image)
+        entry = face_cache.get_or_compute(
+            _face_cache_key("face", image),
+            lambda: {"embedding": _embed_main_face(image)}
         )
-
-        if not embedding_obj or "embedding" not in embedding_obj[0]:
+        if entry["embedding"] is None:
             return None
 
-        embedding = embedding_obj[0]["embedding"]
+        return _cached_match(entry, lambda: gallery.match(entry["embedding"]))
 
-        def cosine_similarity(a, b):
-            """Calculate cosine similarity between two vectors."""
-            norm_a = norm(a)
-            norm_b = norm(b)
-            
-            # Check for zero vectors
-            if norm_a == 0 or norm_b == 0:
-                return 0.0
-                
-            return dot(a, b) / (norm_a * norm_b)
+    except Exception as e:
+        print(f"Error recognizing face: {e}")
+        return None
 
-        best_match = None
-        best_score = 0.0
+def recognize_faces(images: List) -> List[dict]:
+    """
+    Recognize the main face in each of several images (paths or BGR arrays).
+    Faces are embedded in one batch and matched in one matrix product.
+    Returns one {"label", "score", "error"} dict per image, in order; an
+    Exception in `images` (e.g. a failed decode) is reported as that entry's error.
+    """
+    results = [{"label": None, "score": None, "error": None} for _ in images]
+    valid = []
+    for idx, image in enumerate(images):
+        if isinstance(image, Exception):
+            results[idx]["error"] = str(image)
+        else:
+            valid.append(idx)
+    gallery.sync()
+    if not valid or len(gallery) == 0:
+        return results
 
-        for stored_embedding, label in zip(data["embeddings"], data["labels"]):
-            score = cosine_similarity(embedding, stored_embedding)
-            if score > best_score:
-                best_score = score
-                best_match = label
+    represented = face_engine.represent([images[i] for i in valid], enforce_detection=True, ignore_errors=True)
+    queries, owners = [], []
+    for idx, faces in zip(valid, represented):
+        if isinstance(faces, Exception):
+            results[idx]["error"] = str(faces)
+        elif faces:
+            queries.append(faces[0]["embedding"])
+            owners.append(idx)
 
-        return best_match if best_score > 0.75 else None
+    if queries:
+        for idx, (label, score) in zip(owners, gallery.match_batch(queries)):
+            results[idx]["label"] = label
+            results[idx]["score"] = round(score, 4)
+    return results
 
-    except Exception as e:
-        print(f"Error recognizing face: {e}")
-        return None
+def recognize_faces_in_image(image: ImageInput, min_confidence: Optional[float] = None,
+                             use_cache: bool = True) -> List[dict]:
+    """
+    Recognize every face in one image: a single SSD detector pass, one
+    batched embedding call for all crops and one gallery matrix product.
+    Returns [{"label", "score", "bbox", "confidence"}] per detected face.
+    Falls back to DeepFace's own detector if the SSD files are unavailable.
+    Pass use_cache=False for frames that will never repeat (video decode).
+    """
+    gallery.sync()
+    if not use_cache:
+        entry = _detect_and_embed(to_bgr_array(image), min_confidence)
+        return _match_detections(entry)
+    if FACE_CACHE_PERCEPTUAL:
+        image = to_bgr_array(image)
+    # Exact keys hash the encoded bytes, so a repeated upload is not even decoded
+    key = _face_cache_key("faces", image) + (min_confidence,)
+    entry = face_cache.get_or_compute(key, lambda: _detect_and_embed(to_bgr_array(image), min_confidence))
+    return _match_detections(entry)
+
+def _match_detections(entry: dict) -> List[dict]:
+    detections, embeddings = entry["detections"], entry["embeddings"]
+    if not detections:
+        return []
+    matches = _cached_match(
+        entry,
+        lambda: gallery.match_batch(embeddings) if len(gallery) else [(None, 0.0)] * len(detections)
+    )
+    return [
+        {"label": label, "score": round(score, 4), "bbox": d["bbox"], "confidence": round(d["confidence"], 4)}
+        for d, (label, score) in zip(detections, matches)
+    ]
+
+def _detect_and_embed(frame: np.ndarray, min_confidence: Optional[float]) -> dict:
+    try:
+        detections = face_detector.detect(frame, confidence=min_confidence)
+    except FileNotFoundError:
+        detections = None
+
+    if detections is not None:
+        crops = [face_detector.crop(frame, d["bbox"]) for d in detections]
+        embeddings = face_engine.embed_crops(crops) if crops else []
+    else:
+        faces = face_engine.represent([frame], enforce_detection=False)[0]
+        faces = [f for f in faces if f["face_confidence"]]
+        detections = [{"bbox": (f["facial_area"]["x"], f["facial_area"]["y"],
+                                f["facial_area"]["w"], f["facial_area"]["h"]),
+                       "confidence": float(f["face_confidence"])} for f in faces]
+        embeddings = [f["embedding"] for f in faces]
+    return {"detections": detections, "embeddings": embeddings}
+
+def track_faces_in_image(tracker, image: ImageInput, min_confidence: Optional[float] = None) -> List[dict]:
+    """
+    Track-then-recognize for live streams: detect every face, associate the
+    detections with `tracker` (a realtime_utils.RealTimeFaceTracker) and
+    embed only the faces the tracker asks about — new tracks and tracks
+    whose identity confidence has decayed. Returns [{"face_id", "label",
+    "score", "bbox", "confidence", "recognized"}] per detected face.
+    """
+    frame = to_bgr_array(image)
+    try:
+        detections = face_detector.detect(frame, confidence=min_confidence)
+        embeddings = None
+    except FileNotFoundError:
+        # DeepFace's detector embeds as it detects, so there is nothing to skip
+        entry = _detect_and_embed(frame, min_confidence)
+        detections, embeddings = entry["detections"], entry["embeddings"]
+
+    # An enrollment (here or in another worker) can change who an already-tracked face is
+    gallery.ensure_loaded()
+    gallery.sync()
+    # state_key rather than version: the tracker may visit several face worker processes
+    if tracker.gallery_version != gallery.state_key:
+        tracker.expire_identities()
+        tracker.gallery_version = gallery.state_key
+
+    def recognize(indices: List[int]):
+        if not len(gallery):
+            return [(None, 0.0)] * len(indices)
+        if embeddings is None:
+            queries = face_engine.embed_crops([face_detector.crop(frame, detections[i]["bbox"]) for i in indices])
+        else:
+            queries = [embeddings[i] for i in indices]
+        return gallery.match_batch(queries)
+
+    faces = tracker.update(detections, recognize)
+    for face, detection in zip(faces, detections):
+        face["score"] = round(face["score"], 4)
+        face["confidence"] = round(detection["confidence"], 4)
+    return faces
 
 # ---------------- MAIN EXECUTION ---------------- #
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Echo model utilities")
+    parser.add_argument("--build-emotion-model", action="store_true",
+                        help=f"train the emotion model and save {EMOTION_MODEL_FILE} and {EMOTION_COMPILED_FILE}")
+    parser.add_argument("--force", action="store_true",
+                        help="retrain even if the saved artifact is up to date")
+    parser.add_argument("--compact-faces", action="store_true",
+                        help=f"rewrite {FACE_STORE_DIR} without deleted rows")
+    args = parser.parse_args()
+
+    if args.compact_faces:
+        before = len(gallery)
+        gallery.compact()
+        print(f"Face store compacted: {before} -> {len(gallery)} rows")
+        raise SystemExit(0)
+
+    if args.build_emotion_model:
+        build_emotion_model(force=args.force)
+        print(f"Emotion model artifact is up to date ({EMOTION_MODEL_FILE})")
+        raise SystemExit(0)
+
     # Example usage
     try:
         # Initialize emotion model
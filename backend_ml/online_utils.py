@@ -0,0 +1,272 @@
+import os
+import copy
+import json
+import time
+import queue
+import threading
+import contextlib
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Sequence
+
+# ---------------- ONLINE EMOTION MODEL ---------------- #
+#
+# A HashingVectorizer has no vocabulary to grow and SGDClassifier.partial_fit
+# only touches the rows of the batch it is given, so the model is a fixed
+# (n_classes x N_FEATURES) weight matrix and an update costs the same no
+# matter how much data came before it. The trainer applies corrections on a
+# background thread to a copy of the live model and publishes the copy in one
+# assignment, so requests never see a half-updated model. A copy duplicates
+# only the classifier's arrays; the hashing vectorizer has no state.
+#
+# Applied corrections are numbered and appended to a FeedbackLog. A model
+# remembers the last number it absorbed, so saving it is only a checkpoint:
+# whoever trains or loads next first applies the logged corrections the
+# checkpoint lacks. That lets the model be saved every few seconds instead
+# of after every batch without losing corrections made in other processes.
+# The log keeps its newest FEEDBACK_LOG_MAX_BYTES, which is what a reseed
+# (after the base dataset changes) replays.
+
+N_FEATURES = 2 ** 18
+SEED_EPOCHS = 5
+SEED_BATCH_SIZE = 64
+FEEDBACK_WEIGHT = 1.0   # relative to a seed example; higher values overfit single phrases
+MAX_UPDATE_BATCH = 256
+FEEDBACK_LOG_MAX_BYTES = 4 << 20    # beyond this the oldest half of the log is dropped
+FEEDBACK_READ_BLOCK = 64 * 1024
+
+class OnlineTextClassifier:
+    """Hashing-vectorizer + logistic SGD classifier with predict_proba/classes_ like the pipeline."""
+
+    def __init__(self, classes: Sequence[str], n_features: int = N_FEATURES, seed: int = 0,
+                 key: Optional[dict] = None):
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm="l2")
+        self.classifier = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=seed)
+        self.classes_ = np.asarray(sorted(str(c) for c in classes))
+        self.seed = seed
+        self.key = key          # identifies the seed data, see model_utils
+        self.updates = 0        # feedback examples applied since seeding
+        self.feedback_seq = 0   # number of the last FeedbackLog record applied
+
+    def partial_fit(self, texts: List[str], labels: List[str], sample_weight: Optional[np.ndarray] = None):
+        unknown = set(labels) - set(self.classes_)
+        if unknown:
+            raise ValueError(f"Unknown emotion label(s): {', '.join(sorted(unknown))}")
+        features = self.vectorizer.transform(texts)
+        self.classifier.partial_fit(features, labels, classes=self.classes_, sample_weight=sample_weight)
+
+    def seed_fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = SEED_EPOCHS):
+        """Bootstrap from the base dataset with a few shuffled passes of mini-batches."""
+        texts, labels = np.asarray(texts, dtype=object), np.asarray(labels, dtype=object)
+        rng = np.random.default_rng(self.seed)
+        for _ in range(epochs):
+            order = rng.permutation(len(texts))
+            for start in range(0, len(order), SEED_BATCH_SIZE):
+                batch = order[start:start + SEED_BATCH_SIZE]
+                self.partial_fit(list(texts[batch]), list(labels[batch]))
+
+    def apply_feedback(self, texts: List[str], labels: List[str]):
+        self.partial_fit(texts, labels, sample_weight=np.full(len(texts), FEEDBACK_WEIGHT))
+        self.updates += len(texts)
+
+    def apply_records(self, records: List[Dict[str, Any]]):
+        """Apply FeedbackLog records in order; labels this model does not know are skipped."""
+        known = set(self.classes_)
+        pairs = [(r["text"], r["emotion"]) for r in records if r["emotion"] in known]
+        for start in range(0, len(pairs), MAX_UPDATE_BATCH):
+            batch = pairs[start:start + MAX_UPDATE_BATCH]
+            self.apply_feedback([t for t, _ in batch], [label for _, label in batch])
+        if records:
+            self.feedback_seq = records[-1]["seq"]
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        return self.classifier.predict_proba(self.vectorizer.transform(list(texts)))
+
+    def copy(self) -> "OnlineTextClassifier":
+        """A copy partial_fit can update without touching this model."""
+        clone = copy.copy(self)
+        clone.classifier = copy.copy(self.classifier)
+        for name, value in vars(self.classifier).items():
+            if isinstance(value, np.ndarray):
+                setattr(clone.classifier, name, value.copy())  # coef_, intercept_, ...
+        return clone
+
+    def save(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str, key: Optional[dict] = None) -> Optional["OnlineTextClassifier"]:
+        loaded = joblib.load(path)
+        if not isinstance(loaded, OnlineTextClassifier) or (key is not None and loaded.key != key):
+            return None
+        return loaded
+
+class FeedbackLog:
+    """
+    Append-only JSON-lines file of applied corrections,
+    {"seq", "text", "emotion"} per line with increasing seq. The caller
+    serialises appends (OnlineTrainer holds its lock). Reads go backwards
+    from the end, so catching up costs only the records being caught up on.
+    """
+
+    def __init__(self, path: str, max_bytes: int = FEEDBACK_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _newest_first(self) -> Iterator[Dict[str, Any]]:
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            carry = b""
+            while end > 0:
+                start = max(0, end - FEEDBACK_READ_BLOCK)
+                f.seek(start)
+                lines = (f.read(end - start) + carry).split(b"\n")
+                # The first piece may be the end of a line that starts in the previous block
+                carry = lines.pop(0) if start > 0 else b""
+                for line in reversed(lines):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # blank, or torn by an interrupted append
+                    if isinstance(record, dict) and "seq" in record:
+                        yield record
+                end = start
+
+    def last_seq(self) -> int:
+        return next((record["seq"] for record in self._newest_first()), 0)
+
+    def records_after(self, seq: int) -> List[Dict[str, Any]]:
+        """Records numbered above `seq`, oldest first."""
+        found = []
+        for record in self._newest_first():
+            if record["seq"] <= seq:
+                break
+            found.append(record)
+        return found[::-1]
+
+    def records(self) -> List[Dict[str, Any]]:
+        return self.records_after(0)
+
+    def append(self, pairs: List[tuple]) -> List[Dict[str, Any]]:
+        """Number and append (text, emotion) pairs; returns the new records."""
+        seq = self.last_seq()
+        records = [{"seq": seq + i + 1, "text": t, "emotion": e} for i, (t, e) in enumerate(pairs)]
+        data = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+        with open(self.path, "ab+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data  # end a line torn by a crash; alone it stays unparseable
+            f.write(data)
+            size += len(data)
+        if size > self.max_bytes:
+            self._drop_oldest_half()
+        return records
+
+    def _drop_oldest_half(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        cut = data.find(b"\n", len(data) // 2) + 1
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data[cut:])
+        os.replace(tmp_path, self.path)
+
+class OnlineTrainer:
+    """
+    Background worker applying (text, label) corrections. `get_model()`
+    returns the model to start from; `publish(model)` installs the updated
+    copy. Corrections queued while an update runs go into the next batch.
+    `lock`, if given, is held from get_model() to publish(), e.g. a file
+    lock shared with other processes training the same model. With a `log`,
+    each batch is appended to it under the lock, and the logged corrections
+    the starting model lacks (applied elsewhere since its checkpoint) are
+    applied before the batch.
+    """
+
+    def __init__(self, get_model: Callable[[], OnlineTextClassifier],
+                 publish: Callable[[OnlineTextClassifier], None], max_batch: int = MAX_UPDATE_BATCH,
+                 lock: Optional[ContextManager] = None, log: Optional[FeedbackLog] = None):
+        self.get_model = get_model
+        self.publish = publish
+        self.max_batch = max_batch
+        self.update_lock = lock
+        self.log = log
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.applied = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_update: Optional[float] = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="emotion-online-trainer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, pairs: List[tuple]):
+        """Queue (text, label) pairs for the next background update."""
+        self._ensure_started()
+        for pair in pairs:
+            self._queue.put(pair)
+
+    def _drain(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drain()
+            try:
+                with self.update_lock or contextlib.nullcontext():
+                    candidate = self.get_model().copy()
+                    if self.log is not None:
+                        missing = self.log.records_after(candidate.feedback_seq)
+                        candidate.apply_records(missing + self.log.append(batch))
+                    else:
+                        candidate.apply_feedback([t for t, _ in batch], [label for _, label in batch])
+                    self.publish(candidate)
+                with self._lock:
+                    self.applied += len(batch)
+                    self.batches += 1
+                    self.last_update = time.time()
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def join(self):
+        """Block until every queued correction has been applied (or failed)."""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "applied": self.applied,
+                "batches": self.batches,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "last_update": self.last_update,
+            }
@@ -3,7 +3,7 @@ import numpy as np
 import asyncio
 import threading
 import time
-from typing import Optional, Callable, Dict, Any
+from typing import Optional, Callable, Dict, Any, List, Tuple
 import logging
 from collections import deque
 import json
@@ -215,13 +215,35 @@ class RealTimeEmotionTracker:
         }
 
 class RealTimeFaceTracker:
-    """Track faces in real-time with recognition history"""
+    """
+    Track faces in real-time with recognition history.
+
+    update() associates each frame's detections with existing tracks by IoU
+    (falling back to centroid distance for fast movement), so a person who
+    stays in view keeps a stable face_id and label. Recognition only runs
+    for new tracks and for tracks whose identity confidence has decayed
+    below min_identity_confidence, so per-frame cost stays nearly constant
+    while nobody enters or leaves.
+    """
     
-    def __init__(self, max_faces: int = 10):
+    def __init__(self, max_faces: int = 10, iou_threshold: float = 0.3,
+                 max_centroid_shift: float = 0.5, identity_decay: float = 0.95,
+                 min_identity_confidence: float = 0.5, max_missed_frames: int = 5,
+                 max_identity_misses: int = 2):
         self.max_faces = max_faces
         self.face_history = deque(maxlen=max_faces * 10)  # Store more history for faces
         self.known_faces = {}  # face_id -> label mapping
         self.face_counter = 0
+        self.iou_threshold = iou_threshold
+        self.max_centroid_shift = max_centroid_shift  # fraction of the track's box size
+        self.identity_decay = identity_decay          # per frame
+        self.min_identity_confidence = min_identity_confidence
+        self.max_missed_frames = max_missed_frames
+        self.max_identity_misses = max_identity_misses  # consecutive unknown re-checks before a label is dropped
+        self.tracks: Dict[str, Dict[str, Any]] = {}
+        self.recognitions_run = 0
+        self.frames_tracked = 0
+        self.gallery_version = None  # set by model_utils.track_faces_in_image
         
     def add_face_detection(self, face_id: str, label: Optional[str], confidence: float, 
                           bbox: tuple, timestamp: float = None):
@@ -240,6 +262,136 @@ class RealTimeFaceTracker:
             "timestamp": timestamp
         })
         
+    @staticmethod
+    def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """IoU between (n, 4) and (m, 4) arrays of (x, y, w, h) boxes."""
+        ax1, ay1, ax2, ay2 = a[:, 0:1], a[:, 1:2], a[:, 0:1] + a[:, 2:3], a[:, 1:2] + a[:, 3:4]
+        bx1, by1, bx2, by2 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+        inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+        inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+        inter = inter_w * inter_h
+        union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+        return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+    def _associate(self, boxes: np.ndarray) -> Dict[int, str]:
+        """Greedy one-to-one matching of detection index -> face_id."""
+        if not self.tracks or not len(boxes):
+            return {}
+        track_ids = list(self.tracks)
+        track_boxes = np.array([self.tracks[t]["bbox"] for t in track_ids], dtype=np.float64)
+        scores = self._iou_matrix(track_boxes, boxes)
+
+        # Centroid fallback: a box that moved further than it overlaps still matches if close enough
+        track_centres = track_boxes[:, :2] + track_boxes[:, 2:] / 2
+        det_centres = boxes[:, :2] + boxes[:, 2:] / 2
+        shift = np.linalg.norm(track_centres[:, None, :] - det_centres[None, :, :], axis=2)
+        scale = np.maximum(track_boxes[:, 2:3], track_boxes[:, 3:4])
+        near = (scores < self.iou_threshold) & (shift <= self.max_centroid_shift * scale)
+        # Overlap matches rank above centroid-only matches, closer centroids first
+        scores = np.where(scores >= self.iou_threshold, scores, 0.0)
+        scores = np.where(near, self.iou_threshold * (1 - shift / np.maximum(scale, 1e-9)) + 1e-6, scores)
+
+        matches: Dict[int, str] = {}
+        used_tracks = set()
+        for flat in np.argsort(-scores, axis=None):
+            ti, di = divmod(int(flat), scores.shape[1])
+            if scores[ti, di] <= 0:
+                break
+            if ti in used_tracks or di in matches:
+                continue
+            matches[di] = track_ids[ti]
+            used_tracks.add(ti)
+        return matches
+
+    def update(self, detections: List[Dict[str, Any]],
+               recognize: Callable[[List[int]], List[Tuple[Optional[str], float]]],
+               timestamp: float = None) -> List[Dict[str, Any]]:
+        """
+        Feed one frame's detections ([{"bbox": (x, y, w, h), "confidence": c}]).
+        `recognize(indices)` is called at most once, with the indices of the
+        detections that need (re)identification, and returns (label, score)
+        for each. Returns one {"face_id", "label", "score", "bbox",
+        "recognized"} dict per detection, where "recognized" tells whether
+        recognition ran for it this frame.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.frames_tracked += 1
+        boxes = np.array([d["bbox"] for d in detections], dtype=np.float64).reshape(-1, 4)
+        matches = self._associate(boxes)
+
+        assigned: List[str] = []
+        needs_recognition: List[int] = []
+        for di, detection in enumerate(detections):
+            face_id = matches.get(di)
+            if face_id is None:
+                self.face_counter += 1
+                face_id = f"face_{self.face_counter}"
+                self.tracks[face_id] = {"label": None, "score": 0.0, "identity_confidence": 0.0}
+                needs_recognition.append(di)
+            else:
+                track = self.tracks[face_id]
+                track["identity_confidence"] *= self.identity_decay
+                if track["identity_confidence"] < self.min_identity_confidence:
+                    needs_recognition.append(di)
+            track = self.tracks[face_id]
+            track["bbox"] = tuple(detection["bbox"])
+            track["last_seen"] = timestamp
+            track["missed"] = 0
+            assigned.append(face_id)
+
+        if needs_recognition:
+            self.recognitions_run += len(needs_recognition)
+            for di, (label, score) in zip(needs_recognition, recognize(needs_recognition)):
+                track = self.tracks[assigned[di]]
+                if label is None and track["label"] is not None:
+                    # One unknown re-check may be blur or a head turn, but it may also be a
+                    # different person in the same box: keep the label only briefly and re-check
+                    # on the next frame; after max_identity_misses in a row it is dropped
+                    track["misses"] = track.get("misses", 0) + 1
+                    if track["misses"] < self.max_identity_misses:
+                        continue
+                track["label"] = label
+                track["score"] = score
+                track["misses"] = 0
+                track["identity_confidence"] = 1.0
+
+        matched = set(assigned)
+        for face_id in list(self.tracks):
+            if face_id not in matched:
+                self.tracks[face_id]["missed"] = self.tracks[face_id].get("missed", 0) + 1
+                if self.tracks[face_id]["missed"] > self.max_missed_frames:
+                    del self.tracks[face_id]
+
+        results = []
+        rechecked = set(needs_recognition)
+        for di, face_id in enumerate(assigned):
+            track = self.tracks[face_id]
+            self.add_face_detection(face_id, track["label"], track["score"], track["bbox"], timestamp)
+            results.append({
+                "face_id": face_id,
+                "label": track["label"],
+                "score": track["score"],
+                "bbox": track["bbox"],
+                "recognized": di in rechecked
+            })
+        return results
+
+    def expire_identities(self):
+        """Force every active track to be re-recognized on its next frame (e.g. after enrollment)."""
+        for track in self.tracks.values():
+            track["identity_confidence"] = 0.0
+
+    def get_tracking_stats(self) -> Dict[str, Any]:
+        """How much recognition work tracking saved"""
+        return {
+            "active_tracks": len(self.tracks),
+            "frames_tracked": self.frames_tracked,
+            "recognitions_run": self.recognitions_run,
+            "recognitions_per_frame": round(self.recognitions_run / self.frames_tracked, 3)
+            if self.frames_tracked else None
+        }
+
     def get_face_summary(self) -> Dict[str, Any]:
         """Get comprehensive face tracking summary"""
         if not self.face_history:
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import threading
+from filelock import FileLock, Timeout
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+# ---------------- SHARED STATE ACROSS SERVER WORKERS ---------------- #
+#
+# Several uvicorn/gunicorn workers on one host share the files under the
+# working directory but nothing in memory. This module gives them:
+#
+#   file_lock / update_json   one writer at a time per file (read-modify-write
+#                             under a cross-process lock, atomic replace)
+#   ChangeWatcher             cheap stat() check so a worker reloads a file
+#                             only after another worker changed it
+#   LeaderLock                one worker runs the scheduled jobs; the lock
+#                             is released by the OS if that worker dies
+#   EventBus                  append-only event file every worker tails, so
+#                             a message reaches WebSocket clients of all workers
+#
+# Everything is plain files and flock, so it also works with one worker.
+
+STATE_DIR = os.environ.get("ECHO_STATE_DIR", "state")
+CHECK_INTERVAL = 1.0          # seconds between stat() calls of a watcher
+EVENT_LOG_MAX_BYTES = 1 << 20 # the event file is truncated beyond this
+
+_locks: Dict[str, FileLock] = {}
+_locks_guard = threading.Lock()
+
+def state_path(name: str) -> str:
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, name)
+
+def file_lock(path: str) -> FileLock:
+    """Cross-process lock guarding `path` (a sibling `<path>.lock` file)."""
+    path = os.path.abspath(path)
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lock = _locks[path] = FileLock(path + ".lock")
+        return lock
+
+def read_json(path: str, default: Any = None) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def _replace_json(path: str, data: Any):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)  # readers see the old or the new file, never half of one
+
+def write_json(path: str, data: Any):
+    with file_lock(path):
+        _replace_json(path, data)
+
+def update_json(path: str, update: Callable[[Any], Any], default: Any = None) -> Any:
+    """Apply `update(current) -> new` under the file's lock and return the new value."""
+    with file_lock(path):
+        data = update(read_json(path, default))
+        _replace_json(path, data)
+        return data
+
+# ---------- change notification ---------- #
+
+class ChangeWatcher:
+    """
+    Report whether any of the watched files changed (mtime, size or inode)
+    since the last call. `paths` may be a callable for files whose name
+    changes, such as the live generation of the face store.
+    """
+
+    def __init__(self, paths: Union[str, Sequence[str], Callable[[], Sequence[str]]],
+                 interval: float = CHECK_INTERVAL):
+        self._paths = paths
+        self.interval = interval
+        self._signature: Optional[tuple] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _current_paths(self) -> Sequence[str]:
+        if callable(self._paths):
+            return self._paths()
+        return [self._paths] if isinstance(self._paths, str) else self._paths
+
+    def _stat(self) -> tuple:
+        signature = []
+        for path in self._current_paths():
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size, st.st_ino))
+            except FileNotFoundError:
+                signature.append((path, None))
+        return tuple(signature)
+
+    def changed(self, force: bool = False) -> bool:
+        """True on the first call and whenever the files changed; stat()s at most once per interval."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._signature is not None and now - self._checked < self.interval:
+                return False
+            self._checked = now
+            signature = self._stat()
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            return True
+
+    def mark_seen(self):
+        """Accept the files' current state, e.g. after this process wrote them itself."""
+        with self._lock:
+            self._signature = self._stat()
+            self._checked = time.monotonic()
+
+# ---------- leader election ---------- #
+
+class LeaderLock:
+    """Non-blocking flock held for the life of the process by exactly one worker."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = FileLock(state_path(f"{name}.leader.lock"), thread_local=False)
+
+    def is_leader(self) -> bool:
+        """Try to (re)acquire leadership without waiting; cheap once held."""
+        if self._lock.is_locked:
+            return True
+        try:
+            self._lock.acquire(timeout=0)
+        except Timeout:
+            return False
+        with open(state_path(f"{self.name}.leader"), "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def release(self):
+        if self._lock.is_locked:
+            self._lock.release(force=True)
+
+# ---------- cross-worker events ---------- #
+
+class EventBus:
+    """
+    Append-only JSON-lines file of events. publish() appends under the file
+    lock; poll() returns events appended since this process last looked
+    (including its own). A new reader starts at the end of the file.
+    """
+
+    def __init__(self, name: str, max_bytes: int = EVENT_LOG_MAX_BYTES):
+        self.path = state_path(f"{name}.events.jsonl")
+        self.max_bytes = max_bytes
+        self._offset: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def publish(self, event: Dict[str, Any]):
+        line = json.dumps(event) + "\n"
+        with file_lock(self.path):
+            mode = "w" if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes else "a"
+            with open(self.path, mode, encoding="utf-8") as f:
+                f.write(line)
+
+    def poll(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                size = 0
+            if self._offset is None:
+                self._offset = size
+                return []
+            if size < self._offset:
+                self._offset = 0  # truncated by a publisher
+            if size == self._offset:
+                return []
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read(size - self._offset)
+            events = []
+            for line in chunk.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    break  # still being written
+                self._offset += len(line)
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+            return events
@@ -0,0 +1,329 @@
+import os
+import json
+import pickle
+import shutil
+import threading
+import numpy as np
+from datetime import datetime
+from filelock import FileLock
+from typing import Optional, List, Dict, Any
+
+# ---------------- APPEND-ONLY EMBEDDING STORE ---------------- #
+#
+# Layout of a store directory:
+#
+#   CURRENT                 name of the live generation (swapped atomically)
+#   gen-000001/meta.json    {"dim": 128, "dtype": "float32", ...}
+#   gen-000001/embeddings.f32   raw float32 rows, read through np.memmap
+#   gen-000001/labels.jsonl     one JSON record per committed row or delete
+#   .lock                   cross-process writer lock
+#
+# An append writes the embedding row first and the log record second; the
+# log record is the commit point. Rows without a log record (a writer died
+# in between) and torn trailing log lines are ignored by readers and
+# truncated away by the next writer. Compaction writes a fresh generation
+# and flips CURRENT with os.replace, so a crash leaves either the old or
+# the new generation intact. The replaced generation stays on disk until
+# the following compaction, since other processes may still be reading
+# it; a reader that loses the race anyway re-reads CURRENT and retries.
+
+EMBEDDINGS_NAME = "embeddings.f32"
+LOG_NAME = "labels.jsonl"
+META_NAME = "meta.json"
+CURRENT_NAME = "CURRENT"
+DTYPE = np.float32
+
+def _fsync_dir(path: str):
+    # Directory fsync makes renames durable on POSIX; not available on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+class EmbeddingStore:
+    """Memory-mapped float32 embeddings plus an append-only label log."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock: Optional[FileLock] = None
+        self._local = threading.RLock()
+        self._generation: Optional[str] = None
+        self._dim: Optional[int] = None
+        self._records: List[Dict[str, Any]] = []
+        self._deleted: set = set()
+        self._log_offset = 0
+        self._rows = 0
+
+    # ---------- paths / generations ---------- #
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.root, CURRENT_NAME))
+
+    def _gen_path(self, name: Optional[str] = None) -> str:
+        return os.path.join(self.root, name or self._generation)
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, CURRENT_NAME), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def watch_paths(self) -> List[str]:
+        """Files that change whenever refresh() would find something new."""
+        paths = [os.path.join(self.root, CURRENT_NAME)]
+        current = self._read_current()
+        if current:
+            paths.append(os.path.join(self._gen_path(current), LOG_NAME))
+        return paths
+
+    def _file_lock(self) -> FileLock:
+        if self._lock is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._lock = FileLock(os.path.join(self.root, ".lock"))
+        return self._lock
+
+    def _create_generation(self, name: str, dim: int, extra: Optional[dict] = None) -> str:
+        path = self._gen_path(name)
+        os.makedirs(path, exist_ok=True)
+        meta = {"dim": dim, "dtype": np.dtype(DTYPE).name, "created": datetime.now().isoformat()}
+        meta.update(extra or {})
+        _write_file(os.path.join(path, META_NAME), json.dumps(meta).encode("utf-8"))
+        _write_file(os.path.join(path, EMBEDDINGS_NAME), b"")
+        _write_file(os.path.join(path, LOG_NAME), b"")
+        _fsync_dir(path)
+        return path
+
+    def _set_current(self, name: str):
+        tmp = os.path.join(self.root, CURRENT_NAME + ".tmp")
+        _write_file(tmp, name.encode("utf-8"))
+        os.replace(tmp, os.path.join(self.root, CURRENT_NAME))
+        _fsync_dir(self.root)
+
+    # ---------- reading ---------- #
+
+    def _reset_view(self, generation: Optional[str]):
+        self._generation = generation
+        self._records = []
+        self._deleted = set()
+        self._log_offset = 0
+        self._rows = 0
+        self._dim = None
+        if generation:
+            with open(os.path.join(self._gen_path(), META_NAME), "r", encoding="utf-8") as f:
+                self._dim = int(json.load(f)["dim"])
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """
+        Read log records committed since the last call (by any process).
+        Returns the new records; a generation switch resets the view and
+        returns every record of the new generation.
+        """
+        with self._local:
+            try:
+                return self._refresh()
+            except FileNotFoundError:
+                # Our generation was removed after we read CURRENT: start over from the live one
+                self._reset_view(None)
+                return self._refresh()
+
+    def _refresh(self) -> List[Dict[str, Any]]:
+        current = self._read_current()
+        if current != self._generation:
+            self._reset_view(current)
+        if not current:
+            return []
+
+        with open(os.path.join(self._gen_path(), LOG_NAME), "rb") as f:
+            f.seek(self._log_offset)
+            chunk = f.read()
+
+        new_records = []
+        consumed = 0
+        for line in chunk.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # torn tail from an interrupted writer
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            consumed += len(line)
+            if record.get("op") == "delete":
+                self._deleted.update(record["rows"])
+            else:
+                self._rows = record["row"] + 1
+                self._records.append(record)
+            new_records.append(record)
+        self._log_offset += consumed
+        return new_records
+
+    @property
+    def generation(self) -> Optional[str]:
+        return self._generation
+
+    def __len__(self):
+        return self._rows
+
+    def records(self, start: int = 0) -> List[Dict[str, Any]]:
+        """Committed row records from row `start` on (including deleted rows)."""
+        return self._records[start:]
+
+    def deleted_rows(self) -> set:
+        return set(self._deleted)
+
+    def embeddings(self) -> np.ndarray:
+        """Read-only memory map over the committed rows."""
+        if not self._rows:
+            return np.empty((0, self._dim or 0), dtype=DTYPE)
+        return np.memmap(
+            os.path.join(self._gen_path(), EMBEDDINGS_NAME),
+            dtype=DTYPE, mode="r", shape=(self._rows, self._dim)
+        )
+
+    # ---------- writing ---------- #
+
+    def append(self, embedding, label: str, metadata: Optional[dict] = None) -> int:
+        """Durably append one labelled embedding; returns its row number."""
+        return self.append_many([embedding], [label], [metadata or {}])[0]
+
+    def append_many(self, embeddings, labels: List[str], metadata: Optional[List[dict]] = None) -> List[int]:
+        rows = np.atleast_2d(np.asarray(embeddings, dtype=DTYPE))
+        if len(rows) != len(labels):
+            raise ValueError("embeddings and labels must have the same length")
+        metadata = metadata or [{} for _ in labels]
+
+        with self._file_lock(), self._local:
+            self.refresh()
+            if self._generation is None:
+                name = "gen-000001"
+                self._create_generation(name, rows.shape[1])
+                self._set_current(name)
+                self.refresh()
+            if rows.shape[1] != self._dim:
+                raise ValueError(f"Embedding size {rows.shape[1]} does not match store size {self._dim}")
+
+            gen_path = self._gen_path()
+            start = self._rows
+            with open(os.path.join(gen_path, EMBEDDINGS_NAME), "r+b") as f:
+                # Drop rows written by a writer that died before committing
+                f.truncate(start * self._dim * rows.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(rows.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            now = datetime.now().isoformat()
+            lines = b"".join(
+                (json.dumps({**meta, "row": start + i, "label": label, "ts": now}) + "\n").encode("utf-8")
+                for i, (label, meta) in enumerate(zip(labels, metadata))
+            )
+            with open(os.path.join(gen_path, LOG_NAME), "r+b") as f:
+                f.truncate(self._log_offset)  # discard a torn tail
+                f.seek(0, os.SEEK_END)
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.refresh()
+            return list(range(start, start + len(rows)))
+
+    def delete(self, label: str) -> int:
+        """
+        Append a tombstone for every current row with this label. Readers
+        skip them immediately; compaction reclaims the space.
+        """
+        with self._file_lock(), self._local:
+            self.refresh()
+            rows = [r["row"] for r in self._records if r["label"] == label and r["row"] not in self._deleted]
+            if not rows:
+                return 0
+            record = {"op": "delete", "label": label, "rows": rows, "ts": datetime.now().isoformat()}
+            line = (json.dumps(record) + "\n").encode("utf-8")
+            with open(os.path.join(self._gen_path(), LOG_NAME), "r+b") as f:
+                f.truncate(self._log_offset)
+                f.seek(0, os.SEEK_END)
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.refresh()
+            return len(rows)
+
+    def _write_generation(self, name: str, matrix: np.ndarray, records: List[dict], extra: dict):
+        """Fully write and fsync a generation directory (not yet live)."""
+        if os.path.exists(self._gen_path(name)):
+            shutil.rmtree(self._gen_path(name))  # leftover from a crashed compaction
+        path = self._create_generation(name, matrix.shape[1], extra)
+        with open(os.path.join(path, EMBEDDINGS_NAME), "wb") as f:
+            f.write(np.ascontiguousarray(matrix, dtype=DTYPE).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(os.path.join(path, LOG_NAME), "wb") as f:
+            for row, record in enumerate(records):
+                f.write((json.dumps({**record, "row": row}) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(path)
+
+    def compact(self):
+        """Rewrite live rows into a new generation and switch to it atomically."""
+        with self._file_lock(), self._local:
+            self.refresh()
+            if self._generation is None:
+                return
+            old = self._generation
+            name = f"gen-{int(old.split('-')[1]) + 1:06d}"
+            keep = [i for i, r in enumerate(self._records) if r["row"] not in self._deleted]
+            matrix = self.embeddings()
+            self._write_generation(
+                name,
+                np.asarray(matrix[keep]).reshape(len(keep), self._dim),
+                [self._records[i] for i in keep],
+                {"compacted_from": old},
+            )
+            del matrix
+
+            self._set_current(name)
+            self.refresh()
+            # Keep `old` for readers that have not moved off it yet; anything older is unused
+            for entry in os.listdir(self.root):
+                if entry.startswith("gen-") and entry not in (name, old):
+                    shutil.rmtree(self._gen_path(entry), ignore_errors=True)
+
+    # ---------- migration ---------- #
+
+    def migrate_from_pickle(self, pickle_path: str) -> int:
+        """
+        One-shot import of the legacy {"embeddings": [...], "labels": [...]}
+        pickle. Does nothing once the store exists; the pickle is left in
+        place as a backup. Returns the number of rows imported.
+        """
+        if self.exists() or not os.path.exists(pickle_path):
+            return 0  # the common case, decided without the cross-process lock
+        with self._file_lock(), self._local:
+            if self.exists():
+                return 0
+            with open(pickle_path, "rb") as f:
+                data = pickle.load(f)
+            embeddings, labels = data.get("embeddings", []), data.get("labels", [])
+            if not embeddings:
+                return 0
+            if len(embeddings) != len(labels):
+                raise ValueError(f"{pickle_path} holds {len(embeddings)} embeddings but "
+                                 f"{len(labels)} labels; refusing to migrate misaligned rows")
+            rows = np.atleast_2d(np.asarray(embeddings, dtype=DTYPE))
+            now = datetime.now().isoformat()
+            records = [{"label": label, "ts": now, "source": "migration"} for label in labels]
+            self._write_generation("gen-000001", rows, records,
+                                   {"migrated_from": os.path.basename(pickle_path)})
+            self._set_current("gen-000001")
+            self.refresh()
+            return len(labels)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+# The backend modules are imported as top-level modules, like app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shutil
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="module")
+def emotion_model(tmp_path_factory):
+    """
+    model_utils with the emotion model trained from ml_data.csv in a scratch
+    working directory (the module's artifact paths are relative). Skipped
+    where DeepFace, which model_utils imports, is not installed.
+    """
+    pytest.importorskip("deepface")
+    workdir = tmp_path_factory.mktemp("emotion")
+    shutil.copy(os.path.join(BACKEND_DIR, "ml_data.csv"), workdir)
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import model_utils
+        model_utils.EMOTION_INFERENCE = "sklearn"
+        model_utils.initialize_emotion_model()
+        yield model_utils
+    finally:
+        os.chdir(previous)
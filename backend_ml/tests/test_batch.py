@@ -0,0 +1,37 @@
+import threading
+
+import pytest
+
+from batch_utils import MicroBatcher
+from executor_utils import PoolSaturated
+
+# ---------------- MICRO-BATCHER ---------------- #
+
+def test_results_come_back_in_order():
+    batcher = MicroBatcher(lambda items: [i * 2 for i in items], max_batch_size=4, max_delay=0.01)
+    futures = [batcher.submit(i) for i in range(10)]
+    assert [f.result(timeout=5) for f in futures] == [i * 2 for i in range(10)]
+    assert batcher.stats()["items"] == 10
+
+def test_full_queue_rejects_instead_of_growing():
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow(items):
+        started.set()
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(slow, max_batch_size=1, max_delay=0, max_queue=3, name="test-batcher")
+    running = batcher.submit("running")
+    started.wait(5)  # the worker holds one item; three more may wait
+    queued = [batcher.submit(i) for i in range(3)]
+    with pytest.raises(PoolSaturated) as excinfo:
+        batcher.submit("one too many")
+    assert excinfo.value.pool == "test-batcher" and excinfo.value.retry_after >= 1
+    assert batcher.stats()["rejected"] == 1
+    release.set()
+    assert running.result(timeout=5) == "running"
+    assert [f.result(timeout=5) for f in queued] == [0, 1, 2]
+    # Space frees up once the backlog drains
+    assert batcher.submit("later").result(timeout=5) == "later"
@@ -0,0 +1,99 @@
+import csv
+import json
+import os
+import multiprocessing
+from datetime import datetime
+
+import numpy as np
+
+# ---------------- MULTI-PROCESS TESTS FOR THE SHARED-STATE LAYERS ---------------- #
+#
+# Each test starts PROCESSES spawned processes (the way several uvicorn
+# workers share one working directory) that hammer the same files at once,
+# then checks that nothing was lost, duplicated or torn.
+
+PROCESSES = 4
+ROUNDS = 50
+
+def _run_all(target, directory, count=PROCESSES):
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    procs = [ctx.Process(target=target, args=(str(directory), i, start)) for i in range(count)]
+    for p in procs:
+        p.start()
+    start.set()  # release every process together for maximum contention
+    for p in procs:
+        p.join(timeout=120)
+        assert p.exitcode == 0, f"worker exited with {p.exitcode}"
+
+# ---------- file_lock / update_json ---------- #
+
+def _increment_counter(directory, worker, start):
+    os.chdir(directory)
+    from state_utils import update_json
+    start.wait()
+    for _ in range(ROUNDS):
+        update_json("counter.json", lambda data: {**data, "n": data.get("n", 0) + 1,
+                                                  str(worker): data.get(str(worker), 0) + 1}, {})
+
+def test_update_json_loses_no_increment(tmp_path):
+    _run_all(_increment_counter, tmp_path)
+    with open(tmp_path / "counter.json", encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["n"] == PROCESSES * ROUNDS
+    assert all(data[str(i)] == ROUNDS for i in range(PROCESSES))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+# ---------- EmotionLogWriter ---------- #
+
+def _log_rows(directory, worker, start):
+    os.chdir(directory)
+    from logger_utils import EmotionLogWriter
+    writer = EmotionLogWriter("logs/emotion_logs.csv", batch_size=16, flush_interval=0.01)
+    start.wait()
+    for i in range(ROUNDS * 4):
+        writer.write((datetime.now(), f"worker {worker} row {i}, with a comma", "calm", 0.5, None))
+    writer.close()
+
+def test_emotion_log_writers_keep_rows_whole(tmp_path):
+    _run_all(_log_rows, tmp_path)
+    with open(tmp_path / "logs" / "emotion_logs.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["timestamp", "input_text", "emotion", "confidence"]
+    body = rows[1:]
+    assert len(body) == PROCESSES * ROUNDS * 4
+    assert all(len(row) == 4 and row[2] == "calm" for row in body)
+    for worker in range(PROCESSES):
+        # Each process's rows arrive complete and in its own order
+        own = [row[1] for row in body if row[1].startswith(f"worker {worker} ")]
+        assert own == [f"worker {worker} row {i}, with a comma" for i in range(ROUNDS * 4)]
+
+# ---------- EmbeddingStore ---------- #
+
+DIM = 8
+
+def _enroll(directory, worker, start):
+    from store_utils import EmbeddingStore
+    store = EmbeddingStore(os.path.join(directory, "face_store"))
+    start.wait()
+    for i in range(ROUNDS):
+        store.append(np.full(DIM, worker * 1000 + i, dtype=np.float32), f"w{worker}", {"i": i})
+        if worker == 0 and i == ROUNDS // 2:
+            store.compact()  # a generation switch while the others keep appending
+
+def test_embedding_store_appends_from_many_processes(tmp_path):
+    from store_utils import EmbeddingStore
+    _run_all(_enroll, tmp_path)
+    store = EmbeddingStore(str(tmp_path / "face_store"))
+    store.refresh()
+    records = store.records()
+    matrix = np.asarray(store.embeddings())
+    assert len(records) == PROCESSES * ROUNDS
+    assert [r["row"] for r in records] == list(range(len(records)))
+    seen = set()
+    for record in records:
+        worker = int(record["label"][1:])
+        # The row's vector belongs to the log record that committed it
+        assert np.all(matrix[record["row"]] == worker * 1000 + record["i"])
+        seen.add((worker, record["i"]))
+    assert len(seen) == PROCESSES * ROUNDS
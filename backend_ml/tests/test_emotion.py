@@ -0,0 +1,64 @@
+import csv
+import os
+
+import numpy as np
+
+from conftest import BACKEND_DIR
+
+# ---------------- EMOTION DETECTION MATCHES THE ORIGINAL PREDICTIONS ---------------- #
+
+def _dataset_texts():
+    with open(os.path.join(BACKEND_DIR, "ml_data.csv"), newline="", encoding="utf-8") as f:
+        texts = [row["text"] for row in csv.DictReader(f)]
+    return texts + ["", "completely unseen words here", "I feel calm but also a bit anxious"]
+
+# ---------- detect_emotions (batch API) ---------- #
+
+def test_batch_matches_single_pipeline_predictions(emotion_model):
+    emotion_model.emotion_cache.clear()
+    texts = _dataset_texts()
+    pipeline = emotion_model.model
+    results = emotion_model.detect_emotions(texts)
+    # Same label and rounded confidence as model.predict / max(predict_proba) per text
+    for text, result in zip(texts, results):
+        assert result["emotion"] == pipeline.predict([text])[0]
+        assert result["confidence"] == round(float(np.max(pipeline.predict_proba([text]))), 2)
+        assert set(result["distribution"]) == {str(c) for c in pipeline.classes_}
+    assert [emotion_model.detect_emotion(text) for text in texts] == \
+        [(r["emotion"], r["confidence"]) for r in results]
+
+def test_batch_of_nothing(emotion_model):
+    assert emotion_model.detect_emotions([]) == []
+
+# ---------- prediction cache ---------- #
+
+def test_cached_predictions_equal_fresh_ones(emotion_model):
+    texts = _dataset_texts()
+    emotion_model.emotion_cache.clear()
+    fresh = emotion_model._score_emotions(emotion_model.model, texts)
+    assert emotion_model.detect_emotions(texts) == fresh
+    hits = emotion_model.emotion_cache.hits
+    assert emotion_model.detect_emotions(texts) == fresh
+    assert emotion_model.emotion_cache.hits == hits + len(texts)
+
+def test_normalised_variants_share_the_raw_text_prediction(emotion_model):
+    emotion_model.emotion_cache.clear()
+    pipeline = emotion_model.model
+    for text in _dataset_texts():
+        variant = "  " + text.upper().replace(" ", "   ") + "?!"
+        # The key is only safe if the model itself cannot tell the variant apart
+        assert emotion_model._score_emotions(pipeline, [variant]) == emotion_model._score_emotions(pipeline, [text])
+        assert emotion_model.detect_emotions([text]) == emotion_model.detect_emotions([variant])
+
+def test_cached_results_are_not_shared_objects(emotion_model):
+    emotion_model.emotion_cache.clear()
+    first = emotion_model.detect_emotions(["I am worried"])[0]
+    first["distribution"].clear()
+    assert emotion_model.detect_emotions(["I am worried"])[0]["distribution"]
+
+def test_model_swap_retires_cached_predictions(emotion_model):
+    emotion_model.detect_emotions(["I am worried"])
+    version = emotion_model.model_version
+    emotion_model.initialize_emotion_model()
+    assert emotion_model.model_version == version + 1
+    assert len(emotion_model.emotion_cache) == 0
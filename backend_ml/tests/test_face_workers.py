@@ -0,0 +1,83 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("deepface")  # face_worker_utils imports face_utils
+
+import face_worker_utils
+from face_worker_utils import FaceWorkerPool
+
+# ---------------- FACE WORKER POOL: BATCHES, SATURATION, CRASHES ---------------- #
+#
+# The workers run _fake_task instead of Facenet: frame[0, 0, 0] says what to
+# do (1 answer, 2 answer after a second, 3 kill the worker process) and
+# frame[0, 0, 1] is echoed back as the score.
+
+ANSWER, SLOW, CRASH = 1, 2, 3
+
+def _no_models():
+    pass
+
+def _fake_task(task, name, shape, keep, kwargs):
+    frame, shm = face_worker_utils._frame_view(name, shape, keep)
+    action, value = int(frame[0, 0, 0]), float(frame[0, 0, 1])
+    del frame
+    if not keep:
+        shm.close()
+    if action == CRASH:
+        os._exit(1)
+    if action == SLOW:
+        time.sleep(1.0)
+    return {"label": "worker", "score": value, "error": None}
+
+def _frame(action, value=0):
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    frame[0, 0] = (action, value, 0)
+    return frame
+
+def _in_process(images):
+    return [{"label": "local", "score": float(image[0, 0, 1]), "error": None} for image in images]
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(face_worker_utils, "_init_worker", _no_models)
+    monkeypatch.setattr(face_worker_utils, "_run_on_frame", _fake_task)
+    workers = FaceWorkerPool(workers=1, slots=2, slot_bytes=8 * 8 * 3)
+    workers.start()
+    yield workers
+    workers.shutdown()
+
+def test_batch_larger_than_the_slot_ring_runs_in_workers(pool):
+    images = [_frame(ANSWER, i) for i in range(7)]
+    images.insert(3, ValueError("not an image"))
+    results = pool.recognize_faces(images, fallback=_in_process)
+    assert [r["label"] for r in results] == ["worker"] * 3 + [None] + ["worker"] * 4
+    assert results[3]["error"] == "not an image"
+    assert [r["score"] for i, r in enumerate(results) if i != 3] == list(range(7))
+
+def test_busy_pool_falls_back_without_waiting(pool):
+    busy = [pool.submit_main_face(_frame(SLOW)) for _ in range(2)]  # other callers hold every slot
+    started = time.perf_counter()
+    results = pool.recognize_faces([_frame(ANSWER, i) for i in range(3)], fallback=_in_process)
+    assert time.perf_counter() - started < 0.5
+    assert [(r["label"], r["score"]) for r in results] == [("local", 0), ("local", 1), ("local", 2)]
+    assert [f.result(timeout=10)["label"] for f in busy] == ["worker", "worker"]
+    # Without a fallback the images are reported, not dropped
+    busy = [pool.submit_main_face(_frame(SLOW)) for _ in range(2)]
+    assert pool.recognize_faces([_frame(ANSWER)])[0]["error"] == "No face worker available"
+    [f.result(timeout=10) for f in busy]
+
+def test_worker_crash_falls_back_and_pool_restarts(pool):
+    results = pool.recognize_faces([_frame(ANSWER, 1), _frame(CRASH, 2)], fallback=_in_process)
+    # The crashed image, and any other one lost with the worker, is recognized in-process
+    assert [r["score"] for r in results] == [1, 2]
+    assert results[1]["label"] == "local"
+    deadline = time.monotonic() + 60
+    while not (pool.stats()["restarts"] == 1 and pool.started) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert pool.started and pool.stats()["restarts"] == 1
+    assert pool.recognize_faces([_frame(ANSWER, 5)], fallback=_in_process)[0] == \
+        {"label": "worker", "score": 5.0, "error": None}
+    assert pool.stats()["free_slots"] == 2
@@ -0,0 +1,219 @@
+import os
+import csv
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from history_utils import COLUMN_FILES, EmotionHistory, to_micros
+
+# ---------------- DAY-PARTITIONED COLUMNS ---------------- #
+
+EMOTIONS = ["anxious", "calm", "disoriented", "exhausted", "frustrated"]
+USERS = [None, "ann", "bob"]
+START = datetime(2026, 9, 28, 18, 30)
+
+def _records(rng: random.Random, n: int, start: datetime = START, minutes: int = 23):
+    """Records over n * minutes from `start`, in shuffled order."""
+    records = [(start + timedelta(minutes=minutes * i, microseconds=rng.randrange(10 ** 6)),
+                rng.choice(EMOTIONS), rng.random(), rng.choice(USERS)) for i in range(n)]
+    rng.shuffle(records)
+    return records
+
+def _frame(records):
+    df = pd.DataFrame(records, columns=["moment", "emotion", "confidence", "user"])
+    df["ts"] = [to_micros(m) for m in df["moment"]]
+    df["confidence"] = df["confidence"].astype(np.float32)
+    return df
+
+def _expected_rows(records, start=None, end=None, user_id=None):
+    df = _frame(records)
+    if start is not None:
+        df = df[df["moment"] >= start]
+    if end is not None:
+        df = df[df["moment"] < end]
+    if user_id is not None:
+        df = df[df["user"] == user_id]
+    return df.sort_values("ts")
+
+def _query_frame(history, rows):
+    emotions, users = history.emotions(), [None] + history.users()
+    return pd.DataFrame({
+        "ts": rows["ts"],
+        "emotion": [emotions[c] for c in rows["emotion"]],
+        "confidence": rows["confidence"],
+        "user": [users[c] for c in rows["user"]],
+    }).sort_values("ts")
+
+def _assert_query(history, records, start=None, end=None, user_id=None):
+    expected = _expected_rows(records, start, end, user_id)
+    got = _query_frame(history, history.query(start, end, user_id))
+    assert got["ts"].tolist() == expected["ts"].tolist()
+    assert got["emotion"].tolist() == expected["emotion"].tolist()
+    assert got["confidence"].tolist() == expected["confidence"].tolist()
+    assert got["user"].tolist() == expected["user"].tolist()
+
+def test_query_returns_the_rows_in_range(tmp_path):
+    rng = random.Random(1)
+    history = EmotionHistory(str(tmp_path / "history"))
+    records = _records(rng, 1200)
+    for i in range(0, len(records), 100):
+        assert history.append(records[i:i + 100]) == len(records[i:i + 100])
+    assert len(history.days()) == 20
+
+    _assert_query(history, records)
+    _assert_query(history, records, START + timedelta(days=2, hours=5), START + timedelta(days=4, minutes=7))
+    _assert_query(history, records, START + timedelta(days=3), None, "ann")
+    _assert_query(history, records, None, START + timedelta(days=1), None)
+    assert not len(history.query(user_id="nobody")["ts"])
+    assert history.days(START + timedelta(days=2, hours=5), START + timedelta(days=3)) == \
+        [(START + timedelta(days=2)).date(), (START + timedelta(days=3)).date()]
+
+def test_bucket_counts_match_a_groupby(tmp_path):
+    rng = random.Random(2)
+    history = EmotionHistory(str(tmp_path / "history"))
+    records = _records(rng, 800)
+    history.append(records)
+    start, end = START + timedelta(hours=9), START + timedelta(days=6)
+    for bucket, freq in (("hour", "h"), ("day", "D")):
+        for user_id in (None, "bob"):
+            df = _expected_rows(records, start, end, user_id)
+            groups = df.groupby(df["moment"].dt.floor(freq))
+            expected = [
+                {
+                    "start": key.isoformat(),
+                    "total": len(group),
+                    "counts": {e: int(n) for e, n in group["emotion"].value_counts().items()},
+                    "mean_confidence": round(float(group["confidence"].astype(np.float64).mean()), 4),
+                }
+                for key, group in groups
+            ]
+            got = history.bucket_counts(start, end, bucket, user_id)
+            assert [{**g, "counts": dict(sorted(g["counts"].items()))} for g in got] == \
+                [{**e, "counts": dict(sorted(e["counts"].items()))} for e in expected]
+    with pytest.raises(ValueError):
+        history.bucket_counts(start, end, "week")
+
+def test_a_torn_append_is_hidden_and_trimmed(tmp_path):
+    rng = random.Random(3)
+    history = EmotionHistory(str(tmp_path / "history"))
+    records = _records(rng, 50, minutes=1)
+    history.append(records[:40])
+    day = history.days()[0]
+    # An append interrupted after two of the four columns
+    path = os.path.join(history.root, day.isoformat())
+    for name in ("ts", "emotion"):
+        with open(os.path.join(path, COLUMN_FILES[name]), "ab") as f:
+            f.write(b"\x01" * 8)
+    assert len(history.read_partition(day)["ts"]) == 40
+    _assert_query(history, records[:40])
+
+    history.append(records[40:])
+    sizes = {name: os.path.getsize(os.path.join(path, f)) for name, f in COLUMN_FILES.items()}
+    assert sizes == {"ts": 400, "emotion": 50, "confidence": 200, "user": 200}
+    _assert_query(history, records)
+    assert len(history.read_partition(day, 45)["ts"]) == 5
+
+def test_migrate_csv_imports_only_older_rows(tmp_path):
+    rng = random.Random(4)
+    csv_path = str(tmp_path / "emotion_logs.csv")
+    records = sorted(_records(rng, 300, minutes=11))
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "input_text", "emotion", "confidence"])
+        for moment, emotion, confidence, _ in records:
+            writer.writerow([moment.isoformat(), "some text", emotion, round(confidence, 2)])
+        writer.writerow(["not a time", "x", "calm", "0.5"])
+    imported = [(m, e, round(c, 2), None) for m, e, c, _ in records]
+
+    history = EmotionHistory(str(tmp_path / "history"))
+    # Live logging started before the migration: only older rows are imported
+    history.append(imported[200:])
+    assert history.migrate_csv(csv_path, batch_size=64) == 200
+    assert history.migrate_csv(csv_path) == 0
+    _assert_query(history, imported)
+
+# ---------------- ROLLUPS ---------------- #
+
+FROM, TO = datetime(2026, 9, 1), datetime(2026, 11, 1)
+
+def _assert_rollups_match(history):
+    for bucket in ("hour", "day"):
+        for user_id in (None, "ann", "bob"):
+            assert history.timeseries(FROM, TO, bucket, user_id) == history.bucket_counts(FROM, TO, bucket, user_id)
+    # A range inside the data, aligned to whole days
+    start, end = datetime(2026, 9, 30), datetime(2026, 10, 3)
+    assert history.timeseries(start, end, "hour", "ann") == history.bucket_counts(start, end, "hour", "ann")
+
+def test_timeseries_matches_bucket_counts(tmp_path):
+    rng = random.Random(5)
+    history = EmotionHistory(str(tmp_path / "history"))
+    records = _records(rng, 1500)  # 24 days, across a month boundary
+    for i in range(0, len(records), 128):
+        history.append(records[i:i + 128])
+    assert {d.month for d in history.days()} == {9, 10}
+    _assert_rollups_match(history)
+    assert sum(e["total"] for e in history.timeseries(FROM, TO, "day")) == 1500
+
+    history.rebuild_rollups()
+    _assert_rollups_match(EmotionHistory(history.root))
+
+def test_rows_a_crash_left_out_are_folded_in_on_the_next_append(tmp_path, monkeypatch):
+    rng = random.Random(6)
+    history = EmotionHistory(str(tmp_path / "history"))
+    records = _records(rng, 600)
+    history.append(records[:300])
+
+    def crash(*args):
+        raise OSError("killed")
+
+    # Columns written, rollups not
+    with monkeypatch.context() as m:
+        m.setattr(history, "_update_rollups", crash)
+        with pytest.raises(OSError):
+            history.append(records[300:400])
+    history.append(records[400:])
+    _assert_rollups_match(history)
+
+def test_rows_a_crash_left_out_are_folded_in_on_open(tmp_path, monkeypatch):
+    import history_utils
+
+    rng = random.Random(7)
+    history = EmotionHistory(str(tmp_path / "history"))
+    records = _records(rng, 400)
+    history.append(records[:300])
+    write_json = history_utils._write_json
+
+    def crash_on_daily(path, data):
+        if os.path.basename(os.path.dirname(path)) == history_utils.DAILY_ROLLUP_DIR:
+            raise OSError("killed")
+        write_json(path, data)
+
+    # Hourly rollups written, daily not
+    with monkeypatch.context() as m:
+        m.setattr(history_utils, "_write_json", crash_on_daily)
+        with pytest.raises(OSError):
+            history.append(records[300:])
+    _assert_rollups_match(EmotionHistory(history.root))
+
+def test_rollups_without_row_counts_are_taken_as_complete(tmp_path):
+    import history_utils
+
+    rng = random.Random(8)
+    history = EmotionHistory(str(tmp_path / "history"))
+    records = _records(rng, 400)
+    history.append(records[:300])
+    # Rollups written before the row counts were kept
+    for root, _, files in os.walk(history.root):
+        for name in files:
+            if name.endswith(".json") and name not in ("emotions.json", "users.json"):
+                path = os.path.join(root, name)
+                table = history_utils._read_json(path, {})
+                del table[history_utils.ROLLUP_ROWS_KEY]
+                history_utils._write_json(path, table)
+    history = EmotionHistory(history.root)
+    _assert_rollups_match(history)
+    history.append(records[300:])
+    _assert_rollups_match(history)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+
+from conftest import BACKEND_DIR
+from linear_utils import CompiledLinearClassifier
+
+# ---------------- COMPILED CLASSIFIER PARITY WITH SKLEARN ---------------- #
+
+DATA = pd.read_csv(f"{BACKEND_DIR}/ml_data.csv")
+PROBES = DATA["text"].tolist() + [
+    "", "!!!", "completely unseen words here", "I feel calm calm calm but also anxious",
+    "I'M SO Happy today", "worried worried and scared and worried",
+]
+
+def _fit(vectorizer, texts=DATA["text"], labels=DATA["emotion"]):
+    return make_pipeline(vectorizer, LogisticRegression()).fit(texts, labels)
+
+@pytest.mark.parametrize("vectorizer", [
+    TfidfVectorizer(),
+    TfidfVectorizer(ngram_range=(1, 2)),
+    TfidfVectorizer(ngram_range=(2, 3)),
+    TfidfVectorizer(sublinear_tf=True, norm="l1"),
+    TfidfVectorizer(stop_words="english", use_idf=False),
+    TfidfVectorizer(lowercase=False, norm=None),
+], ids=["default", "bigrams", "bigrams-only", "sublinear-l1", "stop-words-no-idf", "cased-unnormalised"])
+def test_probabilities_match_pipeline(vectorizer):
+    pipeline = _fit(vectorizer)
+    compiled = CompiledLinearClassifier.from_pipeline(pipeline)
+    np.testing.assert_allclose(compiled.predict_proba(PROBES), pipeline.predict_proba(PROBES), rtol=1e-9, atol=1e-12)
+    assert compiled.predict(PROBES).tolist() == pipeline.predict(PROBES).tolist()
+    assert compiled.classes_.tolist() == [str(c) for c in pipeline.classes_]
+
+def test_two_classes_match_pipeline():
+    mask = DATA["emotion"].isin(DATA["emotion"].unique()[:2])
+    pipeline = _fit(TfidfVectorizer(), DATA["text"][mask], DATA["emotion"][mask])
+    compiled = CompiledLinearClassifier.from_pipeline(pipeline)
+    np.testing.assert_allclose(compiled.predict_proba(PROBES), pipeline.predict_proba(PROBES), rtol=1e-9, atol=1e-12)
+
+def test_saved_model_round_trips(tmp_path):
+    pipeline = _fit(TfidfVectorizer(ngram_range=(1, 2)))
+    path = str(tmp_path / "model.npz")
+    CompiledLinearClassifier.from_pipeline(pipeline).save(path, key={"data": 1})
+    assert CompiledLinearClassifier.load(path, key={"data": 2}) is None
+    loaded = CompiledLinearClassifier.load(path, key={"data": 1})
+    np.testing.assert_allclose(loaded.predict_proba(PROBES), pipeline.predict_proba(PROBES), rtol=1e-9, atol=1e-12)
+    assert not [name for name in (tmp_path).iterdir() if name.suffix == ".tmp"]
+
+def test_unsupported_vectorizer_is_refused():
+    with pytest.raises(ValueError):
+        CompiledLinearClassifier.from_pipeline(_fit(TfidfVectorizer(analyzer="char")))
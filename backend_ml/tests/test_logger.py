@@ -0,0 +1,214 @@
+import os
+import csv
+import random
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import logger_utils
+from history_utils import EmotionHistory
+from logger_utils import LOG_HEADER, EmotionLogSummary, EmotionLogWriter, RecentEmotions
+from state_utils import file_lock
+
+# ---------------- INCREMENTAL SUMMARY ---------------- #
+
+EMOTIONS = ["anxious", "calm", "disoriented", "exhausted", "frustrated"]
+
+def _records(rng: random.Random, n: int):
+    return [(datetime.now(), f"text {i}, \"quoted\"\nsecond line", rng.choice(EMOTIONS), rng.random(), None)
+            for i in range(n)]
+
+def _append_rows(path: str, records):
+    """Rows written by another server worker."""
+    with file_lock(path):
+        file_exists = os.path.isfile(path)
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            if not file_exists:
+                csv.writer(f).writerow(LOG_HEADER)
+            csv.writer(f).writerows([[m.isoformat(), t, e, round(c, 2)] for m, t, e, c, _ in records])
+
+def _pandas_summary(path: str, pending=()):
+    # get_emotion_summary() as it was computed from a full read of the log
+    df = pd.read_csv(path)
+    extra = pd.DataFrame([{"emotion": e, "confidence": round(c, 2)} for _, _, e, c, _ in pending],
+                         columns=["emotion", "confidence"])
+    df = pd.concat([df[["emotion", "confidence"]], extra], ignore_index=True)
+    return {
+        "total": len(df),
+        "emotions": df["emotion"].value_counts().to_dict(),
+        "most_recent": df.iloc[-1]["emotion"],
+        "average_confidence": round(df["confidence"].mean(), 2),
+    }
+
+def _assert_same(summary, expected):
+    assert summary == expected
+    counts = list(summary["emotions"].values())
+    assert counts == sorted(counts, reverse=True)
+
+def test_summary_matches_a_full_read_of_a_large_log(tmp_path):
+    rng = random.Random(7)
+    path = str(tmp_path / "emotion_logs.csv")
+    writer = EmotionLogWriter(path, batch_size=500, flush_interval=0.01)
+    summary = EmotionLogSummary(path, str(tmp_path / "summary.json"), writer=writer)
+    assert summary.to_dict() == {"total": 0, "emotions": {}, "most_recent": None, "average_confidence": None}
+
+    for record in _records(rng, 3000):
+        writer.write(record)
+    writer.flush()
+    _assert_same(summary.to_dict(), _pandas_summary(path))
+
+    _append_rows(path, _records(rng, 1000))
+    _assert_same(summary.to_dict(), _pandas_summary(path))
+
+    # Queued, not yet written: counted from the writer
+    slow = EmotionLogWriter(path, batch_size=10000, flush_interval=60)
+    summary = EmotionLogSummary(path, str(tmp_path / "summary.json"), writer=slow)
+    queued = _records(rng, 1000)
+    for record in queued:
+        slow.write(record)
+    _assert_same(summary.to_dict(), _pandas_summary(path, queued))
+
+def test_checkpoint_restores_the_aggregate(tmp_path):
+    rng = random.Random(3)
+    path = str(tmp_path / "emotion_logs.csv")
+    _append_rows(path, _records(rng, 1500))
+    summary = EmotionLogSummary(path, str(tmp_path / "summary.json"))
+    summary.to_dict()
+    summary.save_checkpoint()
+    _append_rows(path, _records(rng, 200))
+    restored = EmotionLogSummary(path, str(tmp_path / "summary.json"))
+    _assert_same(restored.to_dict(), _pandas_summary(path))
+
+def test_summary_does_not_wait_for_a_busy_log(tmp_path):
+    rng = random.Random(5)
+    path = str(tmp_path / "emotion_logs.csv")
+    writer = EmotionLogWriter(path, batch_size=50, flush_interval=0.01)
+    summary = EmotionLogSummary(path, str(tmp_path / "summary.json"), writer=writer)
+    ours = _records(rng, 120)
+    for record in ours[:100]:
+        writer.write(record)
+    writer.flush()
+    summary.to_dict()
+    # Written past the offset the summary has read up to
+    for record in ours[100:]:
+        writer.write(record)
+    writer.flush()
+
+    others = _records(rng, 30)
+    holding, release = threading.Event(), threading.Event()
+
+    def other_worker():
+        # Another worker holds the log lock while appending
+        with file_lock(path):
+            _append_rows(path, others)
+            holding.set()
+            release.wait(10)
+
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    try:
+        assert holding.wait(10)
+        # Our events all count; the other worker's rows are not read yet
+        assert summary.to_dict()["total"] == 120
+    finally:
+        release.set()
+        thread.join()
+    _assert_same(summary.to_dict(), _pandas_summary(path))
+
+# ---------------- STREAK AND CAREGIVER ALERT RINGS ---------------- #
+
+def _streak_reference(emotions, target_emotion, streak_length):
+    # check_emotion_streak() as it was computed from a full read of the log
+    recent = pd.Series(emotions, dtype=object).tail(streak_length).tolist()
+    return {
+        "streak_detected": recent == [target_emotion] * streak_length,
+        "recent_emotions": recent,
+        "count": recent.count(target_emotion)
+    }
+
+def _alert_reference(emotions, lookback, threshold):
+    if not emotions:
+        return {"should_alert": False, "distress_count": 0, "distress_emotions": [], "recent_emotions": []}
+    recent = pd.Series(emotions, dtype=object).tail(lookback).tolist()
+    distress_count = sum(1 for e in recent if e in logger_utils.DISTRESS_EMOTIONS)
+    return {
+        "should_alert": distress_count >= threshold,
+        "distress_count": distress_count,
+        "distress_emotions": logger_utils.DISTRESS_EMOTIONS,
+        "recent_emotions": recent
+    }
+
+def _recent_emotions(tmp_path, writer):
+    history = EmotionHistory(str(tmp_path / "history"))
+    return RecentEmotions(writer.path, capacity=8, writer=writer, history=history)
+
+def _history_writer(tmp_path):
+    history = EmotionHistory(str(tmp_path / "history"))
+    writer = EmotionLogWriter(str(tmp_path / "emotion_logs.csv"), batch_size=16, flush_interval=0.01)
+    writer.add_sink("history", lambda batch: history.append((m, e, c, u) for m, _, e, c, u in batch),
+                    lock=history.lock())
+    return writer
+
+def _assert_checks_match(events):
+    for user_id in [None, "ann", "bob", "cy"]:
+        emotions = [e for e, u in events if user_id is None or u == user_id]
+        for length in (1, 3, 5, 12):
+            for target in ("anxious", "calm"):
+                assert logger_utils.check_emotion_streak(target, length, user_id) == \
+                    _streak_reference(emotions, target, length)
+        for lookback in (3, 5, 7, 12):
+            for threshold in (1, 3):
+                assert logger_utils.check_caregiver_alert(lookback, threshold, user_id) == \
+                    _alert_reference(emotions, lookback, threshold)
+
+def test_ring_checks_match_a_full_read_of_the_log(tmp_path, monkeypatch):
+    rng = random.Random(11)
+    writer = _history_writer(tmp_path)
+    monkeypatch.setattr(logger_utils, "recent_emotions", _recent_emotions(tmp_path, writer))
+    start = datetime(2026, 10, 16, 20, 0)
+    events = []
+    for i in range(600):
+        # Runs of one emotion, so streaks fire; spread over four day partitions
+        emotion = events[-1][0] if events and rng.random() < 0.5 else rng.choice(EMOTIONS)
+        user_id = rng.choice([None, "ann", "bob", "cy"])
+        logger_utils.recent_emotions.record((start + timedelta(minutes=7 * i), "text", emotion, rng.random(), user_id))
+        events.append((emotion, user_id))
+        if i % 97 == 0:
+            writer.flush()
+        if i % 40 == 39:
+            # Some checks see events still queued in the writer, some see them stored
+            _assert_checks_match(events)
+    assert len(EmotionHistory(str(tmp_path / "history")).days()) == 4
+
+    # A restarted worker restores every ring from storage
+    writer.flush()
+    monkeypatch.setattr(logger_utils, "recent_emotions", _recent_emotions(tmp_path, writer))
+    _assert_checks_match(events)
+
+def test_checks_do_not_take_the_writers_lock(tmp_path, monkeypatch):
+    writer = _history_writer(tmp_path)
+    monkeypatch.setattr(logger_utils, "recent_emotions", _recent_emotions(tmp_path, writer))
+    for emotion in ["calm", "anxious", "anxious"]:
+        logger_utils.recent_emotions.record((datetime.now(), "text", emotion, 0.9, "ann"))
+    logger_utils.check_emotion_streak(user_id="ann")  # restores the rings
+    logger_utils.check_emotion_streak()
+    writer.flush()
+
+    holding, release = threading.Event(), threading.Event()
+
+    def other_worker():
+        with file_lock(writer.path), logger_utils.recent_emotions.history.lock():
+            holding.set()
+            release.wait(10)
+
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    try:
+        assert holding.wait(10)
+        logger_utils.recent_emotions.record((datetime.now(), "text", "anxious", 0.9, "ann"))
+        assert logger_utils.check_emotion_streak("anxious", 3, "ann")["streak_detected"]
+        assert logger_utils.check_caregiver_alert(3, 3)["should_alert"]
+    finally:
+        release.set()
+        thread.join()
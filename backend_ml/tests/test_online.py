@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import online_utils
+from conftest import BACKEND_DIR
+from online_utils import FeedbackLog, OnlineTextClassifier, OnlineTrainer
+
+# ---------------- ONLINE EMOTION MODEL AND FEEDBACK LOG ---------------- #
+
+DATA = pd.read_csv(f"{BACKEND_DIR}/ml_data.csv")
+
+def _seeded():
+    model = OnlineTextClassifier(classes=DATA["emotion"].unique(), n_features=2 ** 12)
+    model.seed_fit(DATA["text"].tolist(), DATA["emotion"].tolist(), epochs=1)
+    return model
+
+def test_copy_updates_leave_the_original_untouched():
+    model = _seeded()
+    texts = DATA["text"].tolist()
+    before = model.predict_proba(texts)
+    clone = model.copy()
+    assert clone.vectorizer is model.vectorizer  # stateless, shared
+    clone.apply_feedback(["I am so scared"] * 5, ["anxious"] * 5)
+    np.testing.assert_array_equal(model.predict_proba(texts), before)
+    assert not np.array_equal(clone.predict_proba(texts), before)
+    assert (model.updates, clone.updates) == (0, 5)
+
+def test_log_numbers_records_and_reads_them_back(tmp_path):
+    log = FeedbackLog(str(tmp_path / "feedback.jsonl"))
+    assert log.last_seq() == 0 and log.records() == []
+    log.append([("a", "calm"), ("b", "happy")])
+    log.append([("c", "anxious")])
+    assert [r["seq"] for r in log.records()] == [1, 2, 3]
+    assert [r["text"] for r in log.records_after(1)] == ["b", "c"]
+    assert log.records_after(3) == []
+
+def test_log_skips_a_torn_line(tmp_path):
+    log = FeedbackLog(str(tmp_path / "feedback.jsonl"))
+    log.append([("a", "calm")])
+    with open(log.path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 2, "text": "interrup')  # writer died mid-line
+    log.append([("b", "happy")])
+    assert [(r["seq"], r["text"]) for r in log.records()] == [(1, "a"), (2, "b")]
+
+def test_log_reads_across_blocks_and_drops_oldest_half(tmp_path, monkeypatch):
+    monkeypatch.setattr(online_utils, "FEEDBACK_READ_BLOCK", 37)
+    log = FeedbackLog(str(tmp_path / "feedback.jsonl"), max_bytes=4000)
+    for i in range(200):
+        log.append([(f"text {i}", "calm")])
+    with open(log.path, "rb") as f:
+        size = len(f.read())
+    assert size <= 4000
+    records = log.records()
+    # The newest records survive with their numbers, oldest first and contiguous
+    assert records[-1] == {"seq": 200, "text": "text 199", "emotion": "calm"}
+    assert [r["seq"] for r in records] == list(range(records[0]["seq"], 201))
+    assert all(json.loads(line) for line in open(log.path, encoding="utf-8"))
+
+def test_trainer_catches_up_on_corrections_logged_elsewhere(tmp_path):
+    log = FeedbackLog(str(tmp_path / "feedback.jsonl"))
+    checkpoint = _seeded()
+    published = {}
+    # Two processes that both start from the same (stale) checkpoint
+    first = OnlineTrainer(lambda: checkpoint, lambda m: published.update(first=m), log=log)
+    second = OnlineTrainer(lambda: checkpoint, lambda m: published.update(second=m), log=log)
+    first.submit([("I am so scared", "anxious")] * 3)
+    first.join()
+    second.submit([("what a peaceful day", "calm")] * 2)
+    second.join()
+    assert (published["first"].updates, published["first"].feedback_seq) == (3, 3)
+    # The second batch was applied on top of the first one's logged corrections
+    assert (published["second"].updates, published["second"].feedback_seq) == (5, 5)
+    assert checkpoint.updates == 0
+
+def test_records_with_unknown_labels_are_skipped():
+    model = _seeded()
+    model.apply_records([{"seq": 1, "text": "x", "emotion": "bored"},
+                         {"seq": 2, "text": "y", "emotion": "calm"}])
+    assert (model.updates, model.feedback_seq) == (1, 2)
@@ -0,0 +1,61 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from store_utils import EmbeddingStore
+
+# ---------------- EMBEDDING STORE: COMPACTION AND MIGRATION ---------------- #
+
+DIM = 4
+
+def _store(tmp_path, rows=6):
+    store = EmbeddingStore(str(tmp_path / "face_store"))
+    for i in range(rows):
+        store.append(np.full(DIM, i, dtype=np.float32), f"person{i % 3}")
+    return store
+
+def test_compaction_keeps_previous_generation_for_readers(tmp_path):
+    store = _store(tmp_path)
+    reader = EmbeddingStore(store.root)
+    reader.refresh()
+    store.delete("person0")
+    store.compact()
+    # The reader's generation is still readable after the switch
+    assert os.path.isdir(os.path.join(store.root, "gen-000001"))
+    assert [r["label"] for r in reader.refresh()] == ["person1", "person2", "person1", "person2"]
+    store.compact()
+    assert sorted(n for n in os.listdir(store.root) if n.startswith("gen-")) == ["gen-000002", "gen-000003"]
+
+def test_refresh_retries_when_generation_vanishes(tmp_path):
+    store = _store(tmp_path)
+    store.compact()
+    store.compact()  # gen-000001 is gone now
+    reader = EmbeddingStore(store.root)
+    live = reader._read_current
+    stale = iter(["gen-000001"])
+    # CURRENT read just before a compaction in another process removed that generation
+    reader._read_current = lambda: next(stale, None) or live()
+    records = reader.refresh()
+    assert reader.generation == "gen-000003"
+    assert len(records) == len(reader) == 6
+    assert np.asarray(reader.embeddings())[5].tolist() == [5.0] * DIM
+
+def test_migrate_from_pickle(tmp_path):
+    pickle_path = tmp_path / "face_encodings.pkl"
+    with open(pickle_path, "wb") as f:
+        pickle.dump({"embeddings": [[1.0] * DIM, [2.0] * DIM], "labels": ["a", "b"]}, f)
+    store = EmbeddingStore(str(tmp_path / "face_store"))
+    assert store.migrate_from_pickle(str(pickle_path)) == 2
+    assert [r["label"] for r in store.records()] == ["a", "b"]
+    assert store.migrate_from_pickle(str(pickle_path)) == 0
+
+def test_migrate_refuses_misaligned_pickle(tmp_path):
+    pickle_path = tmp_path / "face_encodings.pkl"
+    with open(pickle_path, "wb") as f:
+        pickle.dump({"embeddings": [[1.0] * DIM, [2.0] * DIM, [3.0] * DIM], "labels": ["a", "b"]}, f)
+    store = EmbeddingStore(str(tmp_path / "face_store"))
+    with pytest.raises(ValueError):
+        store.migrate_from_pickle(str(pickle_path))
+    assert not store.exists()
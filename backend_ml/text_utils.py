@@ -0,0 +1,96 @@
+import re
+import codecs
+from collections import Counter
+from typing import Any, BinaryIO, Dict, Iterator
+
+# ---------------- CHUNKED TEXT READING ---------------- #
+#
+# Long uploads (transcripts, journals) are read in fixed-size binary blocks
+# and cut into passages at paragraph breaks, or at sentence ends once a
+# passage reaches MAX_CHUNK_CHARS. Memory is bounded by one block plus a few
+# passages, whatever the file size.
+
+READ_BLOCK_SIZE = 64 * 1024
+MAX_CHUNK_CHARS = 1000
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def _split_passage(paragraph: str, max_chars: int) -> Iterator[str]:
+    """Group the sentences of one paragraph into chunks of at most ~max_chars."""
+    if len(paragraph) <= max_chars:
+        yield paragraph
+        return
+    chunk = ""
+    for sentence in _SENTENCE_END.split(paragraph):
+        if chunk and len(chunk) + len(sentence) + 1 > max_chars:
+            yield chunk
+            chunk = ""
+        # A single run-on "sentence" longer than the limit is hard-wrapped
+        while len(sentence) > max_chars:
+            yield sentence[:max_chars]
+            sentence = sentence[max_chars:]
+        chunk = f"{chunk} {sentence}" if chunk else sentence
+    if chunk:
+        yield chunk
+
+def iter_text_chunks(stream: BinaryIO, max_chars: int = MAX_CHUNK_CHARS,
+                     encoding: str = "utf-8") -> Iterator[str]:
+    """Yield non-empty passages of a binary text stream, decoding incrementally."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    while True:
+        block = stream.read(READ_BLOCK_SIZE)
+        pending += decoder.decode(block, final=not block)
+        parts = _PARAGRAPH_BREAK.split(pending)
+        # The last part may continue in the next block, unless the file ended
+        complete, pending = (parts, "") if not block else (parts[:-1], parts[-1])
+        # Without paragraph breaks, flush long text at sentence ends to stay bounded
+        if block and len(pending) > 4 * max_chars:
+            ends = [m.end() for m in _SENTENCE_END.finditer(pending)]
+            cut = ends[-1] if ends else len(pending) - max_chars
+            complete.append(pending[:cut])
+            pending = pending[cut:]
+        for paragraph in complete:
+            paragraph = " ".join(paragraph.split())
+            if paragraph:
+                yield from _split_passage(paragraph, max_chars)
+        if not block:
+            return
+
+# ---------------- RUNNING EMOTION AGGREGATE ---------------- #
+
+class EmotionAggregate:
+    """Running per-emotion counts and mean class distribution over analysed chunks."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.characters = 0
+        self.counts: Counter = Counter()
+        self.confidence_sum = 0.0
+        self.distribution_sum: Dict[str, float] = {}
+
+    def add(self, text: str, result: Dict[str, Any]):
+        self.chunks += 1
+        self.characters += len(text)
+        self.counts[result["emotion"]] += 1
+        self.confidence_sum += result["confidence"]
+        for emotion, p in result.get("distribution", {}).items():
+            self.distribution_sum[emotion] = self.distribution_sum.get(emotion, 0.0) + p
+
+    @property
+    def dominant(self):
+        # Most frequent per-chunk emotion; ties go to the higher mean probability
+        if not self.chunks:
+            return None
+        return max(self.counts, key=lambda e: (self.counts[e], self.distribution_sum.get(e, 0.0)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "characters": self.characters,
+            "dominant_emotion": self.dominant,
+            "emotion_counts": dict(self.counts),
+            "mean_confidence": round(self.confidence_sum / self.chunks, 4) if self.chunks else None,
+            "mean_distribution": {e: round(p / self.chunks, 4) for e, p in self.distribution_sum.items()}
+            if self.chunks else {},
+        }